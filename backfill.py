@@ -0,0 +1,354 @@
+import gzip
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import metrics
+
+
+NSE_ARCHIVE_URL = "https://nsearchives.nseindia.com"
+
+# First trade date published in the UDiFF bhavcopy format only
+UDIFF_START = date(2024, 7, 8)
+
+HEADERS = {
+    'accept': 'application/json, text/javascript, */*; q=0.01',
+    'accept-encoding': 'gzip, deflate',
+    'accept-language': 'en-US,en;q=0.9',
+    'referer': 'https://www.nseindia.com/api/chart-databyindex?index=OPTIDXBANKNIFTY25-01-2024CE46000.00',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36',
+    'x-requested-with': 'XMLHttpRequest',
+    'connection': 'keep-alive',
+}
+
+# NSE equity segment trading holidays that fall on weekdays. Weekends are
+# always skipped. Years not listed here can be supplied with load_holidays().
+NSE_HOLIDAYS = frozenset(date.fromisoformat(d) for d in [
+    # 2022
+    '2022-01-26', '2022-03-01', '2022-03-18', '2022-04-14', '2022-04-15',
+    '2022-05-03', '2022-08-09', '2022-08-15', '2022-08-31', '2022-10-05',
+    '2022-10-24', '2022-10-26', '2022-11-08',
+    # 2023
+    '2023-01-26', '2023-03-07', '2023-03-30', '2023-04-04', '2023-04-07',
+    '2023-04-14', '2023-05-01', '2023-06-28', '2023-08-15', '2023-09-19',
+    '2023-10-02', '2023-10-24', '2023-11-14', '2023-11-27', '2023-12-25',
+    # 2024
+    '2024-01-22', '2024-01-26', '2024-03-08', '2024-03-25', '2024-03-29',
+    '2024-04-11', '2024-04-17', '2024-05-01', '2024-05-20', '2024-06-17',
+    '2024-07-17', '2024-08-15', '2024-10-02', '2024-11-01', '2024-11-15',
+    '2024-11-20', '2024-12-25',
+    # 2025
+    '2025-02-26', '2025-03-14', '2025-03-31', '2025-04-10', '2025-04-14',
+    '2025-04-18', '2025-05-01', '2025-08-15', '2025-08-27', '2025-10-02',
+    '2025-10-21', '2025-10-22', '2025-11-05', '2025-12-25',
+    # 2026
+    '2026-01-26', '2026-03-03', '2026-03-26', '2026-03-31', '2026-04-03',
+    '2026-04-14', '2026-05-01', '2026-05-28', '2026-06-26', '2026-09-14',
+    '2026-10-02', '2026-10-20', '2026-11-10', '2026-11-24', '2026-12-25',
+])
+
+# Weekdays that kept returning 404 after a later day was published, kept in
+# the save folder so unlisted holidays stop being requested
+MISSED_FILENAME = "holidays.missed.txt"
+
+# 404 counts of days not yet recorded as missed, and how many separate runs
+# must see a day missing before it is
+PENDING_FILENAME = "holidays.pending.json"
+MISSED_RUNS = 2
+
+# Status codes worth retrying; 404 means the archive does not exist (holiday
+# or not yet published) and is returned straight away.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def load_holidays(path, holidays=NSE_HOLIDAYS):
+    """
+    Read extra holiday dates from a text file, one date per line in
+    YYYY-MM-DD or DD/MM/YYYY format, and add them to holidays. Blank lines
+    and '#' comments are ignored.
+    """
+    holidays = set(holidays)
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if '/' in line:
+                holidays.add(datetime.strptime(line, '%d/%m/%Y').date())
+            else:
+                holidays.add(date.fromisoformat(line))
+    return frozenset(holidays)
+
+
+def missed_path(save_folder):
+    return os.path.join(save_folder, MISSED_FILENAME)
+
+
+def known_holidays(save_folder, path=None):
+    """NSE_HOLIDAYS plus the dates in path (if given) and the missed days recorded in save_folder."""
+    holidays = load_holidays(path) if path else NSE_HOLIDAYS
+    if os.path.isfile(missed_path(save_folder)):
+        holidays = load_holidays(missed_path(save_folder), holidays)
+    return holidays
+
+
+def _save_pending(save_folder, pending):
+    path = os.path.join(save_folder, PENDING_FILENAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(pending, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def record_missed_days(save_folder, stats):
+    """
+    Count a miss against every weekday that returned 404 although a later
+    day downloaded in the same run, i.e. the day is missing rather than not
+    published yet. Once a day has missed on MISSED_RUNS separate runs it is
+    added to the save folder's missed-days file, so later runs treat it as a
+    holiday. A day that downloads clears its count.
+
+    Returns:
+    - List of the newly recorded days.
+    """
+    path = os.path.join(save_folder, PENDING_FILENAME)
+    pending = {}
+    if os.path.isfile(path):
+        with open(path) as f:
+            pending = json.load(f)
+
+    published = [s['date'] for s in stats if s['status'] == 200]
+    for day in published:
+        pending.pop(f"{day:%Y-%m-%d}", None)
+    last = max(published, default=None)
+    missed = []
+    for day in sorted({s['date'] for s in stats if s['status'] == 404 and last is not None and s['date'] < last}):
+        key = f"{day:%Y-%m-%d}"
+        pending[key] = pending.get(key, 0) + 1
+        if pending[key] >= MISSED_RUNS:
+            missed.append(day)
+            del pending[key]
+    if pending or os.path.isfile(path):
+        _save_pending(save_folder, pending)
+
+    if missed:
+        with open(missed_path(save_folder), 'a') as f:
+            for day in missed:
+                f.write(f"{day:%Y-%m-%d}  # 404 from the archive on {MISSED_RUNS} runs\n")
+    return missed
+
+
+def is_trading_day(day, holidays=NSE_HOLIDAYS):
+    return day.weekday() < 5 and day not in holidays
+
+
+def trading_days(start, end, holidays=NSE_HOLIDAYS):
+    """Return the trading days between start and end (both inclusive)."""
+    if isinstance(start, datetime):
+        start = start.date()
+    if isinstance(end, datetime):
+        end = end.date()
+    days = []
+    current = start
+    while current <= end:
+        if is_trading_day(current, holidays):
+            days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+def bhavcopy_url(day, base_url=NSE_ARCHIVE_URL):
+    """Archive URL of the day's bhavcopy; NSE only publishes the UDiFF file from UDIFF_START."""
+    if day >= UDIFF_START:
+        return f"{base_url.rstrip('/')}/content/cm/BhavCopy_NSE_CM_0_0_0_{day:%Y%m%d}_F_0000.csv.zip"
+    month_abbr = day.strftime('%b').upper()
+    return (f"{base_url.rstrip('/')}/content/historical/EQUITIES/{day.year}/{month_abbr}/"
+            f"cm{day:%d}{month_abbr}{day.year}bhav.csv.zip")
+
+
+class ArchiveClient:
+    """
+    Small HTTP client that keeps one persistent connection per worker thread
+    and host, so consecutive downloads reuse the same keep-alive socket.
+    """
+
+    def __init__(self, headers=HEADERS, timeout=30, retries=3, backoff=0.5):
+        self.headers = dict(headers)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._local = threading.local()
+        # Every open connection, whichever worker thread's pool holds it
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connection(self, scheme, netloc):
+        pool = getattr(self._local, 'pool', None)
+        if pool is None:
+            pool = self._local.pool = {}
+        conn = pool.get((scheme, netloc))
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = pool[(scheme, netloc)] = conn_class(netloc, timeout=self.timeout)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self, scheme, netloc):
+        conn = self._local.pool.pop((scheme, netloc), None)
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def close(self):
+        """Close the connections of every thread that used this client."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+    def get(self, url):
+        """
+        Fetch url and return (status, body, attempts). Network errors and
+        retryable status codes are retried with exponential backoff; the last
+        error is re-raised once the retries are used up.
+        """
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                conn = self._connection(parts.scheme, parts.netloc)
+                conn.request('GET', path, headers=self.headers)
+                response = conn.getresponse()
+                body = response.read()
+                if response.will_close:
+                    self._drop_connection(parts.scheme, parts.netloc)
+                encoding = response.getheader('content-encoding', '')
+                if encoding == 'gzip':
+                    body = gzip.decompress(body)
+                elif encoding == 'deflate':
+                    body = zlib.decompress(body)
+                status = response.status
+                if status not in RETRY_STATUS or attempt > self.retries:
+                    return status, body, attempt
+            except (http.client.HTTPException, OSError):
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt > self.retries:
+                    raise
+            # Exponential backoff with a little jitter so workers don't retry in lockstep
+            time.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random() / 2))
+
+
+def _fetch_day(client, day, base_url):
+    url = bhavcopy_url(day, base_url)
+    started = time.perf_counter()
+    stat = {'date': day, 'url': url, 'status': None, 'bytes': 0, 'attempts': 0, 'error': None, 'category': None}
+    data = None
+    with metrics.span('download', date=day) as span:
+        try:
+            status, body, attempts = client.get(url)
+            stat['status'] = status
+            stat['attempts'] = attempts
+            if status == 200:
+                data = body
+                stat['bytes'] = len(body)
+                span.add(bytes=len(body))
+            else:
+                stat['error'] = f"HTTP {status}"
+                stat['category'] = metrics.classify_failure(status=status)
+        except Exception as e:
+            stat['attempts'] = client.retries + 1
+            stat['error'] = str(e)
+            stat['category'] = metrics.classify_failure(e)
+        if stat['category'] is not None:
+            span.fail(stat['category'], stat['error'])
+    stat['latency'] = time.perf_counter() - started
+    return day, data, stat
+
+
+def backfill(days, handler, workers=8, base_url=NSE_ARCHIVE_URL, retries=3, backoff=0.5, timeout=30):
+    """
+    Download the bhavcopy archive for every day in days using a pool of
+    worker threads.
+
+    Parameters:
+    - days: Iterable of datetime.date values, usually from trading_days().
+    - handler: Called as handler(day, data) with the raw zip bytes of every
+      successful download. Calls happen on the calling thread in date order,
+      so the handler can append to a shared database without locking.
+    - workers: Number of concurrent downloads.
+    - base_url: Archive host, e.g. a local stand-in server for offline runs.
+
+    Returns:
+    - List of per-day stat dicts (date, status, bytes, attempts, latency,
+      error and its metrics.classify_failure() category).
+    """
+    days = sorted(days)
+    client = ArchiveClient(timeout=timeout, retries=retries, backoff=backoff)
+    stats = []
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map() fetches concurrently but yields results in submission order
+            for day, data, stat in executor.map(lambda d: _fetch_day(client, d, base_url), days):
+                if data is not None:
+                    handler(day, data)
+                stats.append(stat)
+    finally:
+        client.close()
+    elapsed = time.perf_counter() - started
+    for stat in stats:
+        stat['elapsed'] = elapsed
+    return stats
+
+
+def summarize(stats):
+    """Aggregate throughput and latency figures for a backfill run."""
+    latencies = sorted(s['latency'] for s in stats)
+    elapsed = stats[0]['elapsed'] if stats else 0.0
+    total_bytes = sum(s['bytes'] for s in stats)
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))]
+
+    return {
+        'days': len(stats),
+        'downloaded': sum(1 for s in stats if s['status'] == 200),
+        'failed': sum(1 for s in stats if s['status'] != 200),
+        'failures': {category: sum(1 for s in stats if s['category'] == category)
+                     for category in sorted({s['category'] for s in stats if s['category']})},
+        'bytes': total_bytes,
+        'elapsed': elapsed,
+        'days_per_sec': len(stats) / elapsed if elapsed else 0.0,
+        'mb_per_sec': total_bytes / elapsed / 1e6 if elapsed else 0.0,
+        'latency_p50': percentile(0.50),
+        'latency_p95': percentile(0.95),
+        'latency_max': latencies[-1] if latencies else 0.0,
+    }
+
+
+def print_report(stats):
+    for s in stats:
+        status = s['status'] if s['error'] is None else f"{s['error']} ({s['category']})"
+        print(f"{s['date']:%d/%m/%Y}  {status}  {s['bytes']:>9} bytes  {s['latency'] * 1000:8.1f} ms  attempts={s['attempts']}")
+    summary = summarize(stats)
+    print(f"{summary['downloaded']}/{summary['days']} days downloaded in {summary['elapsed']:.2f}s "
+          f"({summary['days_per_sec']:.1f} days/s, {summary['mb_per_sec']:.2f} MB/s), "
+          f"latency p50={summary['latency_p50'] * 1000:.1f} ms p95={summary['latency_p95'] * 1000:.1f} ms "
+          f"max={summary['latency_max'] * 1000:.1f} ms")
+    if summary['failures']:
+        print("Failures: " + ", ".join(f"{category}={count}" for category, count in summary['failures'].items()))
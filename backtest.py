@@ -0,0 +1,200 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from indicators import ema, sma
+from parallel import map_shared
+from price_matrix import compact_columns
+from rs_engine import RS_PERIODS, RS_WEIGHTS
+
+
+# Trend filters a symbol must pass on the rebalance day to be bought
+FILTERS = ['none', 'above_sma200', 'sma50_above_sma200', 'ema10_above_ema30']
+
+# Days of history needed before the first rebalance (the longest RS lookback)
+WARMUP = max(RS_PERIODS)
+
+TRADING_DAYS = 252
+
+
+def observation_rs(closes):
+    """
+    rs_engine.rs_scores evaluated on every trade date.
+
+    Like rs_scores, ROCR(n) counts n of the symbol's own observations back,
+    not n calendar rows, so a symbol with missing days needs max(RS_PERIODS)
+    real closes before it is scored. rs[d, j] equals rs_scores(closes[:d + 1])[j]
+    on every date symbol j traded and is NaN on the dates it didn't.
+    """
+    compact, _ = compact_columns(closes)
+    valid = ~np.isnan(closes)
+    positions = np.cumsum(valid, axis=0) - 1
+    rows, cols = np.nonzero(valid)
+    index = positions[rows, cols]
+    ok = index >= WARMUP
+    rows, cols, index = rows[ok], cols[ok], index[ok]
+
+    score = np.zeros(len(rows))
+    for period, weight in zip(RS_PERIODS, RS_WEIGHTS):
+        score += weight * (compact[index, cols] / compact[index - period, cols])
+    rs = np.full(closes.shape, np.nan)
+    rs[rows, cols] = score / sum(RS_WEIGHTS)
+    return rs
+
+
+def prepare_signals(closes):
+    """
+    Compute everything the simulation reads, once for all parameter sets.
+
+    Parameters:
+    - closes: Date x symbol close matrix (NaN where a symbol didn't trade).
+
+    Returns:
+    - Dict of date x symbol arrays: 'returns' (daily, 0 on days without a
+      trade), 'rs' (see observation_rs), 'tradable' and one boolean
+      'filter_<name>' per trend filter.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    tradable = ~np.isnan(closes)
+    # Carry the last close over days a symbol didn't trade, so holdings keep their value
+    filled = pd.DataFrame(closes).ffill().to_numpy()
+
+    returns = np.zeros_like(filled)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns[1:] = filled[1:] / filled[:-1] - 1
+    returns[~np.isfinite(returns)] = 0.0
+
+    sma_50, sma_200 = sma(filled, 50), sma(filled, 200)
+    ema_10, ema_30 = ema(filled, 10), ema(filled, 30)
+    return {
+        'returns': returns,
+        'rs': observation_rs(closes),
+        'tradable': tradable,
+        'filter_above_sma200': filled > sma_200,
+        'filter_sma50_above_sma200': sma_50 > sma_200,
+        'filter_ema10_above_ema30': ema_10 > ema_30,
+    }
+
+
+def param_grid(top_n=(10, 20), rebalance=(21,), filters=('none',), cost_bps=(10,)):
+    """Every combination of the given parameter values, as a list of dicts."""
+    return [{'top_n': n, 'rebalance': every, 'filter': name, 'cost_bps': cost}
+            for n, every, name, cost in itertools.product(top_n, rebalance, filters, cost_bps)]
+
+
+def simulate(arrays, params):
+    """
+    Equal-weight top-N RS portfolio, rebalanced every params['rebalance']
+    trade dates at the close. Between rebalances holdings drift with their
+    returns; on each rebalance the traded fraction of the portfolio
+    (one-way turnover) pays params['cost_bps'] basis points.
+
+    Returns:
+    - (equity, turnover): daily portfolio value starting at 1.0 and the
+      turnover of every rebalance.
+    """
+    returns, rs = arrays['returns'], arrays['rs']
+    n_dates, n_symbols = returns.shape
+    eligible = arrays['tradable'] & ~np.isnan(rs)
+    if params['filter'] != 'none':
+        eligible = eligible & arrays[f"filter_{params['filter']}"]
+    cost = params['cost_bps'] / 1e4
+
+    equity = np.ones(n_dates)
+    weights = np.zeros(n_symbols)
+    value = 1.0
+    turnover = []
+    rebalances = list(range(WARMUP, n_dates, params['rebalance']))
+    for k, day in enumerate(rebalances):
+        # Pick the top N eligible symbols by RS
+        scores = np.where(eligible[day], rs[day], -np.inf)
+        n = min(params['top_n'], int(eligible[day].sum()))
+        picks = np.argpartition(-scores, n - 1)[:n] if n else np.zeros(0, dtype=np.int64)
+        target = np.zeros(n_symbols)
+        target[picks] = 1.0 / params['top_n']
+
+        traded = float(np.abs(target - weights).sum())
+        turnover.append(traded)
+        value *= 1 - cost * traded
+        equity[day] = value
+
+        # Hold until the next rebalance; only the held columns are touched
+        end = rebalances[k + 1] if k + 1 < len(rebalances) else n_dates - 1
+        growth = np.cumprod(1 + returns[day + 1:end + 1, picks], axis=0)
+        cash = 1.0 - target[picks].sum()
+        path = cash + growth @ target[picks]
+        equity[day + 1:end + 1] = value * path
+
+        weights = np.zeros(n_symbols)
+        if len(path):
+            weights[picks] = target[picks] * growth[-1] / path[-1]
+            value *= path[-1]
+        else:
+            weights = target
+    return equity, np.asarray(turnover)
+
+
+def performance(equity, turnover):
+    """Summary statistics of one equity curve (from the first rebalance on)."""
+    equity = equity[WARMUP:] if len(equity) > WARMUP else equity[-1:]
+    daily = equity[1:] / equity[:-1] - 1
+    years = max(len(daily), 1) / TRADING_DAYS
+    volatility = daily.std(ddof=1) * np.sqrt(TRADING_DAYS) if len(daily) > 1 else np.nan
+    return {
+        'total_return': equity[-1] / equity[0] - 1,
+        'cagr': (equity[-1] / equity[0]) ** (1 / years) - 1,
+        'volatility': volatility,
+        'sharpe': daily.mean() * TRADING_DAYS / volatility if volatility else np.nan,
+        'max_drawdown': float((equity / np.maximum.accumulate(equity) - 1).min()),
+        'avg_turnover': float(turnover.mean()) if len(turnover) else 0.0,
+    }
+
+
+def _run_params(arrays, params):
+    equity, turnover = simulate(arrays, params)
+    return {**params, **performance(equity, turnover)}
+
+
+def backtest(matrix, params):
+    """
+    Run one parameter set over a close PriceMatrix.
+
+    Returns:
+    - (equity Series indexed by date, performance dict)
+    """
+    equity, turnover = simulate(prepare_signals(matrix.values), params)
+    return pd.Series(equity, index=matrix.dates, name='equity'), performance(equity, turnover)
+
+
+def sweep(matrix, grid, workers=1):
+    """
+    Backtest every parameter set in grid. Signals are computed once; the
+    parameter sets are spread over a process pool that shares them.
+
+    Returns:
+    - DataFrame with one row per parameter set, best Sharpe ratio first.
+    """
+    results = map_shared(_run_params, prepare_signals(matrix.values), grid, workers)
+    return pd.DataFrame(results).sort_values('sharpe', ascending=False, kind='stable', ignore_index=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from matrix_cache import open_matrix_cache
+
+    parser = argparse.ArgumentParser(description="Backtest top-N RS portfolios over BhavDB.")
+    parser.add_argument("--save-folder", default="D:/Bhav Folder")
+    parser.add_argument("--top-n", type=int, nargs="+", default=[10, 20])
+    parser.add_argument("--rebalance", type=int, nargs="+", default=[21], help="trade dates between rebalances")
+    parser.add_argument("--filters", nargs="+", choices=FILTERS, default=['none'])
+    parser.add_argument("--cost-bps", type=float, nargs="+", default=[10])
+    parser.add_argument("--workers", type=int, default=1, help="processes to spread parameter sets across")
+    args = parser.parse_args()
+
+    matrix = open_matrix_cache(args.save_folder).matrix('CLOSE')
+    grid = param_grid(args.top_n, args.rebalance, args.filters, args.cost_bps)
+    results = sweep(matrix, grid, args.workers)
+    print(f"{len(grid)} parameter sets over {len(matrix.symbols)} symbols x {len(matrix.dates)} days")
+    print(results.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
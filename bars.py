@@ -0,0 +1,206 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bhavstore import read_bhav, store_path
+from ingest import load_manifest
+from price_matrix import trade_dates
+
+
+BARS_DIRNAME = "Bars"
+
+# Bar frequency -> cache file name. Weeks run Monday to Sunday, so a
+# special Saturday session stays in its own week.
+FREQS = {'W': "weekly", 'M': "monthly"}
+
+BAR_COLUMNS = ['SYMBOL', 'PERIOD', 'OPEN', 'HIGH', 'LOW', 'CLOSE', 'TOTTRDQTY', 'DAYS', 'FIRST_DATE', 'LAST_DATE']
+
+DAILY_COLUMNS = ['SYMBOL', 'TIMESTAMP', 'OPEN', 'HIGH', 'LOW', 'CLOSE', 'TOTTRDQTY']
+
+
+def day_numbers(dates):
+    """Days since 1970-01-01 for datetime-like values."""
+    return np.asarray(pd.DatetimeIndex(dates).values.astype('datetime64[D]').astype(np.int64))
+
+
+def period_start(days, freq='W'):
+    """
+    Day number of the first day of the bar each day number falls in:
+    the Monday of its week for 'W', the 1st of its month for 'M'.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    if freq == 'W':
+        # Day 4 (1970-01-05) was a Monday
+        return days - (days - 4) % 7
+    if freq == 'M':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    raise ValueError(f"unknown bar frequency '{freq}'")
+
+
+def _daily_as_bars(df, freq):
+    """One-day bars, so days and partial bars aggregate the same way."""
+    dates = pd.DatetimeIndex(trade_dates(df['TIMESTAMP']))
+    days = day_numbers(dates)
+    return pd.DataFrame({
+        'SYMBOL': df['SYMBOL'].astype(str).to_numpy(),
+        'PERIOD': period_start(days, freq).astype('datetime64[D]'),
+        'OPEN': df['OPEN'].to_numpy(dtype=float),
+        'HIGH': df['HIGH'].to_numpy(dtype=float),
+        'LOW': df['LOW'].to_numpy(dtype=float),
+        'CLOSE': df['CLOSE'].to_numpy(dtype=float),
+        'TOTTRDQTY': df['TOTTRDQTY'].to_numpy(dtype=np.int64),
+        'DAYS': np.ones(len(df), dtype=np.int64),
+        'FIRST_DATE': dates.values.astype('datetime64[D]'),
+        'LAST_DATE': dates.values.astype('datetime64[D]'),
+    })
+
+
+def _aggregate(bars):
+    """
+    Merge bars sharing (SYMBOL, PERIOD) in one sorted pass: first OPEN,
+    highest HIGH, lowest LOW, last CLOSE, summed volume and day count.
+    """
+    if bars.empty:
+        return bars.reindex(columns=BAR_COLUMNS).reset_index(drop=True)
+    symbols, codes = np.unique(bars['SYMBOL'].to_numpy(dtype=str), return_inverse=True)
+    periods = bars['PERIOD'].to_numpy()
+    order = np.lexsort((bars['FIRST_DATE'].to_numpy(), periods, codes))
+    codes, periods = codes[order], periods[order]
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (periods[1:] != periods[:-1])])
+    ends = np.r_[starts[1:], len(order)] - 1
+
+    def column(name):
+        return bars[name].to_numpy()[order]
+
+    return pd.DataFrame({
+        'SYMBOL': symbols[codes[starts]],
+        'PERIOD': periods[starts],
+        'OPEN': column('OPEN')[starts],
+        'HIGH': np.maximum.reduceat(column('HIGH'), starts),
+        'LOW': np.minimum.reduceat(column('LOW'), starts),
+        'CLOSE': column('CLOSE')[ends],
+        'TOTTRDQTY': np.add.reduceat(column('TOTTRDQTY'), starts),
+        'DAYS': np.add.reduceat(column('DAYS'), starts),
+        'FIRST_DATE': column('FIRST_DATE')[starts],
+        'LAST_DATE': column('LAST_DATE')[ends],
+    })
+
+
+def build_bars(df, freq='W'):
+    """
+    Weekly ('W') or monthly ('M') OHLCV bars for every symbol of a long
+    daily frame, in one grouped pass.
+
+    Returns:
+    - DataFrame with BAR_COLUMNS sorted by (SYMBOL, PERIOD); PERIOD is the
+      first calendar day of the bar, FIRST_DATE/LAST_DATE the trade dates
+      it spans.
+    """
+    return _aggregate(_daily_as_bars(df, freq))
+
+
+def update_bars(bars, df, freq='W'):
+    """
+    Fold new daily rows into existing bars. Only bars of the periods the
+    new days fall in are recomputed; every other bar is kept as is.
+    """
+    new = _daily_as_bars(df, freq)
+    keys = pd.MultiIndex.from_arrays([new['SYMBOL'], new['PERIOD']])
+    touched = pd.MultiIndex.from_arrays([bars['SYMBOL'], bars['PERIOD']]).isin(keys)
+    merged = _aggregate(pd.concat([bars[touched], new], ignore_index=True))
+    bars = pd.concat([bars[~touched], merged], ignore_index=True)
+    return bars.sort_values(['SYMBOL', 'PERIOD'], kind='stable', ignore_index=True)
+
+
+def bars_path(save_folder, freq='W'):
+    return os.path.join(save_folder, BARS_DIRNAME, f"{FREQS[freq]}.parquet")
+
+
+def _read_cache(path):
+    if not os.path.isfile(path):
+        return None, {}
+    table = pq.read_table(path)
+    covered = json.loads((table.schema.metadata or {}).get(b'days', b'{}'))
+    bars = table.to_pandas()
+    for name in ('PERIOD', 'FIRST_DATE', 'LAST_DATE'):
+        bars[name] = bars[name].to_numpy().astype('datetime64[D]')
+    return bars, covered
+
+
+def _write_cache(path, bars, covered):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(bars, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'days': json.dumps(covered).encode()})
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_bars(save_folder, freq='W'):
+    """
+    Cached bars for the whole store, brought up to date with the manifest.
+
+    The cache remembers the checksum of every day it covers. Days ingested
+    since are folded in with update_bars; days expired by retention drop
+    their bars, and the one bar per symbol that straddles the new first day
+    is rebuilt from the store. Any other difference (a re-ingested or
+    backfilled older day) triggers a full rebuild.
+    """
+    store_dir = store_path(save_folder)
+    path = bars_path(save_folder, freq)
+    manifest = {key: entry['checksum'] for key, entry in load_manifest(save_folder).items()}
+    bars, covered = _read_cache(path)
+
+    if bars is not None and covered:
+        last = max(covered)
+        changed = any(covered[key] != checksum for key, checksum in manifest.items() if key in covered)
+        gaps = any(key not in covered for key in manifest if key <= last)
+        expired = [key for key in covered if key not in manifest]
+        if changed or gaps or (expired and manifest and max(expired) > min(manifest)):
+            bars = None
+    if bars is None or not covered:
+        print(f"Building {FREQS[freq]} bars from the store...")
+        bars = build_bars(read_bhav(store_dir, columns=DAILY_COLUMNS, upcast=True), freq)
+        _write_cache(path, bars, manifest)
+        return bars
+
+    if expired and manifest:
+        first = np.datetime64(min(manifest), 'D')
+        stale = bars['FIRST_DATE'].to_numpy() < first
+        if stale.any():
+            edge = bars[stale & (bars['LAST_DATE'].to_numpy() >= first)]
+            bars = bars[~stale]
+            if not edge.empty:
+                rows = read_bhav(store_dir, columns=DAILY_COLUMNS, start=min(manifest),
+                                 end=pd.Timestamp(edge['LAST_DATE'].max()), symbols=edge['SYMBOL'].unique(),
+                                 upcast=True)
+                rebuilt = build_bars(rows, freq)
+                keep = pd.MultiIndex.from_arrays([rebuilt['SYMBOL'], rebuilt['PERIOD']]).isin(
+                    pd.MultiIndex.from_arrays([edge['SYMBOL'], edge['PERIOD']]))
+                bars = pd.concat([bars, rebuilt[keep]], ignore_index=True)
+                bars = bars.sort_values(['SYMBOL', 'PERIOD'], kind='stable', ignore_index=True)
+    elif expired:
+        bars = bars.iloc[0:0]
+
+    new_days = sorted(key for key in manifest if key > last)
+    if new_days:
+        bars = update_bars(bars, read_bhav(store_dir, columns=DAILY_COLUMNS, start=new_days[0], upcast=True), freq)
+    if new_days or expired:
+        _write_cache(path, bars, manifest)
+    return bars
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or update the weekly and monthly bar caches.")
+    parser.add_argument("--save-folder", default="D:/Bhav Folder")
+    args = parser.parse_args()
+
+    for freq, name in FREQS.items():
+        bars = load_bars(args.save_folder, freq)
+        print(f"{name}: {len(bars)} bars for {bars['SYMBOL'].nunique()} symbols")
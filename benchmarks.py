@@ -0,0 +1,922 @@
+import argparse
+import contextlib
+import csv
+import http.server
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from bhavstore import compact_store, import_csv, read_bhav, store_path
+from indicators import bollinger, ema, rolling_max, rolling_min, sma
+from price_matrix import build_price_matrix
+from metrics import peak_rss_mb
+from parallel import map_columns
+from rs_engine import relative_strength, rs_kernel
+
+
+def synthetic_bhavdb(n_symbols=2000, n_days=500, seed=0):
+    """
+    Build a BhavDB-shaped DataFrame of random-walk prices, one row per
+    symbol per trading day, in the order ingestion appends them.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range('2023-01-02', periods=n_days)
+    symbols = np.array([f"SYM{i:04d}" for i in range(n_symbols)])
+    start = rng.uniform(20, 3000, n_symbols)
+    returns = rng.normal(0.0005, 0.02, (n_days, n_symbols))
+    close = np.round(start * np.exp(np.cumsum(returns, axis=0)), 2)
+    prev = np.vstack([start.round(2), close[:-1]])
+    high = np.round(np.maximum(close, prev) * (1 + rng.uniform(0, 0.02, close.shape)), 2)
+    low = np.round(np.minimum(close, prev) * (1 - rng.uniform(0, 0.02, close.shape)), 2)
+    qty = rng.integers(1_000, 5_000_000, close.shape)
+    return pd.DataFrame({
+        'SYMBOL': np.tile(symbols, n_days),
+        'SERIES': 'EQ',
+        'OPEN': prev.ravel(),
+        'HIGH': high.ravel(),
+        'LOW': low.ravel(),
+        'CLOSE': close.ravel(),
+        'LAST': close.ravel(),
+        'PREVCLOSE': prev.ravel(),
+        'TOTTRDQTY': qty.ravel(),
+        'TOTTRDVAL': np.round(qty * close, 2).ravel(),
+        'TIMESTAMP': np.repeat(days.strftime('%d-%b-%Y').str.upper().to_numpy(), n_symbols),
+        'TOTALTRADES': (qty // 50).ravel(),
+        'ISIN': np.tile([f"INE{i:06d}01" for i in range(n_symbols)], n_days),
+    })
+
+
+UDIFF_HEADER = ['TradDt', 'BizDt', 'Sgmt', 'Src', 'FinInstrmTp', 'FinInstrmId', 'ISIN', 'TckrSymb',
+                'SctySrs', 'XpryDt', 'FininstrmActlXpryDt', 'StrkPric', 'OptnTp', 'FinInstrmNm',
+                'OpnPric', 'HghPric', 'LwPric', 'ClsPric', 'LastPric', 'PrvsClsgPric', 'UndrlygPric',
+                'SttlmPric', 'OpnIntrst', 'ChngInOpnIntrst', 'TtlTradgVol', 'TtlTrfVal',
+                'TtlNbOfTxsExctd', 'SsnId', 'NewBrdLotQty', 'Rmks', 'Rsvd1', 'Rsvd2', 'Rsvd3', 'Rsvd4']
+
+
+def _market_panel(n_symbols, n_days, seed):
+    """synthetic_bhavdb with n_symbols EQ symbols plus a third as many of other series."""
+    n_other = n_symbols // 3
+    df = synthetic_bhavdb(n_symbols + n_other, n_days, seed)
+    df['SERIES'] = np.tile(['EQ'] * n_symbols + list(np.resize(['BE', 'BZ', 'SM', 'N1', 'GB'], n_other)), n_days)
+    return df
+
+
+def synthetic_bhavcopy(n_symbols=2500, fmt='legacy', seed=0, day='2024-01-05'):
+    """
+    One full-market bhavcopy day as CSV bytes in the legacy or UDiFF layout:
+    n_symbols EQ rows plus a third as many rows of other series.
+    """
+    df = _market_panel(n_symbols, 1, seed).sample(frac=1, random_state=seed).reset_index(drop=True)
+    return format_bhavcopy(df, pd.Timestamp(day), fmt)
+
+
+def format_bhavcopy(df, trade_date, fmt='legacy'):
+    """Render one day of bhavcopy rows as the CSV NSE publishes, legacy or UDiFF."""
+    df = df.copy()
+    if fmt == 'legacy':
+        df['TIMESTAMP'] = trade_date.strftime('%d-%b-%Y').upper()
+        # NSE ends every line with a comma, which pandas reads as an unnamed column
+        return (df.to_csv(index=False, lineterminator=',\n')).encode()
+    out = pd.DataFrame({column: '' for column in UDIFF_HEADER}, index=df.index)
+    out['TradDt'] = out['BizDt'] = trade_date.strftime('%Y-%m-%d')
+    out['Sgmt'], out['Src'], out['FinInstrmTp'], out['SsnId'], out['NewBrdLotQty'] = 'CM', 'NSE', 'STK', 'F1', 1
+    out['FinInstrmId'] = np.arange(len(df))
+    out['FinInstrmNm'] = df['SYMBOL'] + ' LIMITED'
+    for source, column in [('ISIN', 'ISIN'), ('TckrSymb', 'SYMBOL'), ('SctySrs', 'SERIES'),
+                           ('OpnPric', 'OPEN'), ('HghPric', 'HIGH'), ('LwPric', 'LOW'),
+                           ('ClsPric', 'CLOSE'), ('LastPric', 'LAST'), ('PrvsClsgPric', 'PREVCLOSE'),
+                           ('SttlmPric', 'CLOSE'), ('TtlTradgVol', 'TOTTRDQTY'),
+                           ('TtlTrfVal', 'TOTTRDVAL'), ('TtlNbOfTxsExctd', 'TOTALTRADES')]:
+        out[source] = df[column]
+    return out.to_csv(index=False).encode()
+
+
+def synthetic_archives(root, days, n_symbols=2000, seed=0):
+    """
+    Write one bhavcopy zip per trading day under root, at the same path the
+    NSE archive serves it from (legacy before UDIFF_START, UDiFF after), so
+    serving root over HTTP stands in for the archive host.
+
+    Returns:
+    - Total bytes written.
+    """
+    from backfill import UDIFF_START, bhavcopy_url
+
+    panel = _market_panel(n_symbols, len(days), seed)
+    rows = len(panel) // len(days) if days else 0
+    total = 0
+    for i, day in enumerate(days):
+        df = panel.iloc[i * rows:(i + 1) * rows].sample(frac=1, random_state=seed + i)
+        fmt = 'udiff' if day >= UDIFF_START else 'legacy'
+        url_path = bhavcopy_url(day, '')
+        member = os.path.basename(url_path)[:-len('.zip')]
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(member, format_bhavcopy(df, pd.Timestamp(day), fmt))
+        path = os.path.join(root, *url_path.strip('/').split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(buffer.getvalue())
+        total += buffer.tell()
+    return total
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(root, handler=_QuietHandler):
+    """
+    Serve root on a free localhost port from a background thread.
+    handler is the SimpleHTTPRequestHandler subclass answering requests.
+
+    Returns:
+    - (server, base_url); call server.shutdown() when done.
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def timed(func, repeat=3):
+    """Return (best wall time in seconds, result of the last call)."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def bench_store(n_symbols, n_days, workdir):
+    csv_path = os.path.join(workdir, "BhavDB.csv")
+    daily_dir = os.path.join(workdir, "BhavStore")
+    monthly_dir = os.path.join(workdir, "BhavStoreMonthly")
+    synthetic_bhavdb(n_symbols, n_days).to_csv(csv_path, index=False)
+    import_csv(csv_path, daily_dir)
+    import_csv(csv_path, monthly_dir)
+    compact_store(monthly_dir)
+    last_day = read_bhav(daily_dir, columns=['TIMESTAMP'])['TIMESTAMP'].max()
+    recent = last_day - pd.Timedelta(days=60)
+    some_symbols = [f"SYM{i:04d}" for i in range(0, n_symbols, 100)]
+
+    cases = [
+        ("full table", lambda: pd.read_csv(csv_path), {}),
+        ("SYMBOL,CLOSE", lambda: pd.read_csv(csv_path, usecols=['SYMBOL', 'CLOSE']),
+         {'columns': ['SYMBOL', 'CLOSE']}),
+        ("last 60 days", lambda: _csv_date_filter(csv_path, recent), {'start': recent}),
+        (f"{len(some_symbols)} symbols", lambda: _csv_symbol_filter(csv_path, some_symbols),
+         {'symbols': some_symbols}),
+    ]
+    print(f"BhavDB load: {n_symbols} symbols x {n_days} days, "
+          f"CSV {os.path.getsize(csv_path) / 1e6:.1f} MB")
+    print(f"{'case':<14}{'csv s':>8}{'daily s':>9}{'monthly s':>11}{'speedup':>9}"
+          f"{'csv MB':>8}{'store MB':>10}")
+    for name, csv_load, kwargs in cases:
+        csv_time, csv_df = timed(csv_load)
+        daily_time, _ = timed(lambda: read_bhav(daily_dir, **kwargs))
+        monthly_time, store_df = timed(lambda: read_bhav(monthly_dir, **kwargs))
+        print(f"{name:<14}{csv_time:8.3f}{daily_time:9.3f}{monthly_time:11.3f}"
+              f"{csv_time / monthly_time:8.1f}x{frame_mb(csv_df):8.1f}{frame_mb(store_df):10.1f}")
+
+
+def _csv_date_filter(csv_path, start):
+    df = pd.read_csv(csv_path)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    return df[df['TIMESTAMP'] >= start]
+
+
+def _csv_symbol_filter(csv_path, symbols):
+    df = pd.read_csv(csv_path)
+    return df[df['SYMBOL'].isin(symbols)]
+
+
+def _legacy_rs_loop(bhavcopy_data):
+    """The per-symbol mask loop demo.py used to run, with talib.ROCR(...)[-1] inlined."""
+    rs_values = {}
+    for symbol in bhavcopy_data['SYMBOL'].unique():
+        closes = np.array(bhavcopy_data[bhavcopy_data['SYMBOL'] == symbol]['CLOSE'].tolist())
+        rocr = [closes[-1] / closes[-1 - n] if len(closes) > n else np.nan for n in (63, 126, 189, 252)]
+        rs_values[symbol] = (rocr[0] * 2 + rocr[1] + rocr[2] + rocr[3]) / 5
+    return pd.Series(rs_values)
+
+
+def bench_rs(n_symbols, n_days, workdir):
+    df = synthetic_bhavdb(n_symbols, n_days)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    # Drop a few rows so some symbols have gaps in their history
+    df = df.drop(df.sample(frac=0.01, random_state=1).index)
+
+    loop_time, legacy = timed(lambda: _legacy_rs_loop(df), repeat=1)
+    engine_time, table = timed(lambda: relative_strength(df))
+    diff = np.nanmax(np.abs(table['RS'].reindex(legacy.index).to_numpy() - legacy.to_numpy()))
+    print(f"RS for {n_symbols} symbols x {n_days} days ({len(df)} rows)")
+    print(f"per-symbol loop {loop_time:8.3f} s")
+    print(f"vectorized      {engine_time:8.3f} s  ({loop_time / engine_time:.0f}x), max abs diff {diff:.2e}")
+
+
+def _legacy_ema(data, window):
+    """watchistTest.calculate_ema before vectorization."""
+    ema_values = []
+    smoothing_factor = 2 / (window + 1)
+    ema_values.append(data.iloc[0])
+    for i in range(1, len(data)):
+        ema_values.append((data.iloc[i] - ema_values[-1]) * smoothing_factor + ema_values[-1])
+    return ema_values
+
+
+def _legacy_indicators(close):
+    return {
+        'ema10': _legacy_ema(close, 10), 'ema40': _legacy_ema(close, 40),
+        'sma50': close.rolling(window=50).mean(), 'sma200': close.rolling(window=200).mean(),
+        'sma250': close.rolling(window=250).mean(),
+        'ema10d': _legacy_ema(close, 10), 'ema30': _legacy_ema(close, 30),
+        'high52': close.rolling(window=260).max().shift(7), 'low52': close.rolling(window=260).min().shift(7),
+        'high100': close.rolling(window=100).max().shift(1), 'low100': close.rolling(window=100).min().shift(1),
+        'upper': close.rolling(window=20).mean() + 2 * close.rolling(window=20).std(),
+        'lower': close.rolling(window=20).mean() - close.rolling(window=20).std(),
+    }
+
+
+def _vector_indicators(close):
+    ema_10 = ema(close, 10)
+    _, upper, lower = bollinger(close, 20, upper_k=2, lower_k=1)
+    return {
+        'ema10': ema_10, 'ema40': ema(close, 40),
+        'sma50': sma(close, 50), 'sma200': sma(close, 200), 'sma250': sma(close, 250),
+        'ema10d': ema_10, 'ema30': ema(close, 30),
+        'high52': rolling_max(close, 260, shift=7), 'low52': rolling_min(close, 260, shift=7),
+        'high100': rolling_max(close, 100, shift=1), 'low100': rolling_min(close, 100, shift=1),
+        'upper': upper, 'lower': lower,
+    }
+
+
+def bench_indicators(n_symbols, n_days, workdir):
+    matrix = build_price_matrix(synthetic_bhavdb(n_symbols, n_days), 'CLOSE')
+    sample = min(n_symbols, 50)
+    closes = [pd.Series(matrix.values[:, j]) for j in range(sample)]
+
+    legacy_time, legacy = timed(lambda: [_legacy_indicators(c) for c in closes], repeat=1)
+    vector_time, vector = timed(lambda: [_vector_indicators(c) for c in closes])
+    matrix_time, whole = timed(lambda: _vector_indicators(pd.DataFrame(matrix.values)))
+
+    diff = 0.0
+    for old, new in zip(legacy, vector):
+        for name in old:
+            diff = max(diff, np.nanmax(np.abs(np.asarray(old[name], dtype=float) - np.asarray(new[name], dtype=float))))
+    for name in whole:
+        column = np.asarray(legacy[0][name], dtype=float)
+        diff = max(diff, np.nanmax(np.abs(column - whole[name].to_numpy()[:, 0])))
+
+    print(f"UPD indicators, {n_days} days per symbol")
+    print(f"legacy per symbol     {legacy_time / sample * 1000:9.2f} ms")
+    print(f"vectorized per symbol {vector_time / sample * 1000:9.2f} ms  ({legacy_time / vector_time:.0f}x)")
+    print(f"{n_symbols}-column matrix   {matrix_time * 1000:9.2f} ms total, "
+          f"{matrix_time / n_symbols * 1000:.3f} ms per symbol ({legacy_time / sample * n_symbols / matrix_time:.0f}x)")
+    print(f"max abs diff vs legacy {diff:.2e}")
+
+
+def bench_upd(n_symbols, n_days, workdir):
+    from watchistTest import build_UPD_frame
+
+    df = synthetic_bhavdb(n_symbols, n_days)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    symbols = df['SYMBOL'].unique()
+    print(f"Batch UPD build, {n_days} days per symbol")
+    print(f"{'watchlist':>10}{'rows':>10}{'seconds':>10}{'us/row':>9}")
+    size = max(n_symbols // 8, 1)
+    while True:
+        watchlist = symbols[:size]
+        elapsed, upd_df = timed(lambda: build_UPD_frame(df, watchlist))
+        print(f"{size:>10}{len(upd_df):>10}{elapsed:>10.3f}{elapsed / len(upd_df) * 1e6:>9.2f}")
+        if size == len(symbols):
+            break
+        size = min(size * 2, len(symbols))
+
+
+def bench_parallel(n_symbols, n_days, workdir):
+    from indicator_state import DAILY_COLUMNS, upd_kernel
+
+    closes = build_price_matrix(synthetic_bhavdb(n_symbols, n_days), 'CLOSE').values
+    upd_outputs = {name: 'matrix' for name in ['R.S.'] + DAILY_COLUMNS}
+    print(f"Sharded computation over {n_symbols} symbols x {n_days} days ({os.cpu_count()} CPUs)")
+    print(f"{'workers':>8}{'RS s':>9}{'UPD s':>9}{'UPD speedup':>13}")
+    baseline = reference = None
+    for workers in (1, 2, 4, 8):
+        rs_time, _ = timed(lambda: map_columns(rs_kernel, closes, {'RS': 'vector'}, workers))
+        upd_time, result = timed(lambda: map_columns(upd_kernel, closes, upd_outputs, workers))
+        if baseline is None:
+            baseline, reference = upd_time, result
+        identical = all(np.array_equal(result[k], reference[k], equal_nan=True) for k in reference)
+        print(f"{workers:>8}{rs_time:>9.3f}{upd_time:>9.3f}{baseline / upd_time:>12.2f}x"
+              f"{'' if identical else '  (MISMATCH)'}")
+
+
+def bench_cache(n_symbols, n_days, workdir):
+    from ingest import load_manifest
+    from matrix_cache import open_matrix_cache
+    from rs_engine import matrix_relative_strength
+
+    csv_path = os.path.join(workdir, "BhavDB.csv")
+    synthetic_bhavdb(n_symbols, n_days).to_csv(csv_path, index=False)
+    import_csv(csv_path, store_path(workdir))
+    compact_store(store_path(workdir))
+    load_manifest(workdir)
+
+    build_time, _ = timed(lambda: open_matrix_cache(workdir), repeat=1)
+    columns = ['SYMBOL', 'CLOSE', 'TIMESTAMP']
+    store_time, store_rs = timed(lambda: relative_strength(read_bhav(store_path(workdir), columns, upcast=True)))
+    open_time, cache = timed(lambda: open_matrix_cache(workdir))
+    cache_time, cache_rs = timed(lambda: matrix_relative_strength(open_matrix_cache(workdir).matrix('CLOSE')))
+    window_time, _ = timed(lambda: open_matrix_cache(workdir).window('CLOSE', start=cache.dates[-60]).values.sum())
+    identical = store_rs['RS'].equals(cache_rs['RS'])
+    print(f"Matrix cache: {n_symbols} symbols x {n_days} days")
+    print(f"{'first build':<26}{build_time:8.3f} s")
+    print(f"{'open (fresh)':<26}{open_time:8.3f} s")
+    print(f"{'RS via store load':<26}{store_time:8.3f} s")
+    print(f"{'RS via cache':<26}{cache_time:8.3f} s  {store_time / cache_time:.1f}x"
+          f"{'' if identical else '  (MISMATCH)'}")
+    print(f"{'last 60 days via cache':<26}{window_time:8.3f} s")
+
+
+def _legacy_filter_date(csv_path, start_date):
+    """The full read/parse/rewrite intre.filter_date used to run on BhavDB.csv."""
+    df = pd.read_csv(csv_path)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y', errors='coerce')
+    df = df[df['TIMESTAMP'] >= pd.Timestamp(start_date)]
+    df['TIMESTAMP'] = df['TIMESTAMP'].dt.strftime('%d-%b-%Y')
+    df.to_csv(csv_path, mode='w', index=False, header=True)
+
+
+def bench_retention(n_symbols, n_days, workdir):
+    from ingest import load_manifest
+    from retention import apply_retention, retention_cutoff
+
+    csv_path = os.path.join(workdir, "BhavDB.csv")
+    synthetic_bhavdb(n_symbols, n_days).to_csv(csv_path, index=False)
+    import_csv(csv_path, store_path(workdir))
+    compact_store(store_path(workdir))
+    load_manifest(workdir)
+    first_day = read_bhav(store_path(workdir), columns=['TIMESTAMP'])['TIMESTAMP'].min().date()
+
+    # Advance "today" one calendar day at a time, expiring the oldest days
+    today = first_day + pd.Timedelta(days=365 * 2 + 30).to_pytimedelta()
+    print(f"Daily retention: {n_symbols} symbols x {n_days} days")
+    print(f"{'day':>4}{'csv rewrite s':>15}{'partition drop s':>18}{'days expired':>14}")
+    for day in range(5):
+        cutoff = retention_cutoff(today)
+        csv_time, _ = timed(lambda: _legacy_filter_date(csv_path, cutoff), repeat=1)
+        store_time, (_, _, expired) = timed(lambda: apply_retention(workdir, today), repeat=1)
+        print(f"{day:>4}{csv_time:>15.3f}{store_time:>18.4f}{expired:>14}")
+        today += pd.Timedelta(days=1).to_pytimedelta()
+
+
+def _legacy_parse(path):
+    """What process_bhavcopy_csv used to do: untyped parse, then filter and drop, then parse dates."""
+    df = pd.read_csv(path)
+    df = df[df['SERIES'] == 'EQ'].drop(columns=[c for c in df.columns if str(c).startswith('Unnamed:')])
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    return df
+
+
+def _dictreader_symbols(path):
+    with open(path, newline='') as csvfile:
+        return [row['SYMBOL'] for row in csv.DictReader(csvfile) if row['SERIES'] == 'EQ']
+
+
+def bench_parse(n_symbols, n_days, workdir):
+    from bhavparse import parse_bhavcopy
+
+    paths = {}
+    for fmt in ('legacy', 'udiff'):
+        paths[fmt] = os.path.join(workdir, f"{fmt}.csv")
+        with open(paths[fmt], 'wb') as f:
+            f.write(synthetic_bhavcopy(n_symbols, fmt))
+    rows = n_symbols + n_symbols // 3
+
+    cases = [
+        ("legacy read_csv", lambda: _legacy_parse(paths['legacy'])),
+        ("legacy typed", lambda: parse_bhavcopy(paths['legacy'])),
+        ("udiff typed", lambda: parse_bhavcopy(paths['udiff'])),
+        ("symbols DictReader", lambda: _dictreader_symbols(paths['legacy'])),
+        ("symbols typed", lambda: parse_bhavcopy(paths['legacy'], columns=['SYMBOL'])['SYMBOL'].tolist()),
+    ]
+    print(f"Bhavcopy parse: {rows} rows ({n_symbols} EQ), legacy {os.path.getsize(paths['legacy']) / 1e6:.2f} MB, "
+          f"UDiFF {os.path.getsize(paths['udiff']) / 1e6:.2f} MB")
+    print(f"{'case':<20}{'ms':>9}{'rows/s':>13}")
+    results = {}
+    for name, parse in cases:
+        elapsed, results[name] = timed(parse, repeat=5)
+        print(f"{name:<20}{elapsed * 1000:9.2f}{rows / elapsed:13,.0f}")
+
+    legacy = results["legacy read_csv"].reset_index(drop=True)
+    same = all(np.array_equal(legacy[c].to_numpy(), df[c].to_numpy())
+               for df in (results["legacy typed"], results["udiff typed"]) for c in legacy.columns)
+    same &= results["symbols DictReader"] == results["symbols typed"]
+    print("typed parsers match the legacy parse" if same else "MISMATCH against the legacy parse")
+
+
+def bench_screener(n_symbols, n_days, workdir):
+    import screener
+    from watchistTest import build_UPD_frame
+
+    df = synthetic_bhavdb(n_symbols, n_days)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    upd_path = os.path.join(workdir, "UPD.csv")
+    build_UPD_frame(df, df['SYMBOL'].unique()).to_csv(upd_path, index=False, date_format='%d-%b-%Y')
+
+    # Dozens of screens: the named ones plus threshold variations
+    screens = dict(screener.SCREENS)
+    for pct in range(50, 100, 2):
+        screens[f"rs_{pct}_above_sma200"] = f"rs_pct >= {pct} and close > sma200"
+
+    def full_pass():
+        upd_df = pd.read_csv(upd_path)
+        dates = pd.to_datetime(upd_df['TIMESTAMP'], format='%d-%b-%Y')
+        upd_df = upd_df[dates == dates.max()]
+        return upd_df[upd_df['CLOSE'] > upd_df['Daily SMA(200)']]
+
+    cold_time, _ = timed(lambda: (screener._snapshots.clear(),
+                                  os.path.exists(upd_path[:-4] + screener.SNAPSHOT_SUFFIX)
+                                  and os.remove(upd_path[:-4] + screener.SNAPSHOT_SUFFIX),
+                                  screener.load_snapshot(upd_path)), repeat=1)
+    disk_time, _ = timed(lambda: (screener._snapshots.clear(), screener.load_snapshot(upd_path)))
+    memory_time, snapshot = timed(lambda: screener.load_snapshot(upd_path))
+    csv_time, _ = timed(full_pass, repeat=1)
+    screens_time, results = timed(lambda: screener.run_screens(snapshot, screens))
+    print(f"Screener over {len(snapshot)} symbols ({os.path.getsize(upd_path) / 1e6:.0f} MB UPD.csv)")
+    print(f"{'full pandas pass per screen':<32}{csv_time * 1000:10.2f} ms")
+    print(f"{'snapshot, first build':<32}{cold_time * 1000:10.2f} ms")
+    print(f"{'snapshot, from Parquet cache':<32}{disk_time * 1000:10.2f} ms")
+    print(f"{'snapshot, in memory':<32}{memory_time * 1000:10.2f} ms")
+    print(f"{f'{len(screens)} screens':<32}{screens_time * 1000:10.2f} ms"
+          f"  ({screens_time / len(screens) * 1000:.2f} ms/screen)")
+    print(f"{'leaders matched':<32}{len(results['leaders']):10d}")
+
+
+def _loop_backtest(closes, signals, params):
+    """Reference day-by-day share-count simulation of one parameter set."""
+    from backtest import WARMUP
+
+    closes = pd.DataFrame(closes).ffill().to_numpy()
+    eligible = signals['tradable'] & ~np.isnan(signals['rs'])
+    if params['filter'] != 'none':
+        eligible = eligible & signals[f"filter_{params['filter']}"]
+    shares = np.zeros(closes.shape[1])
+    cash = 1.0
+    equity = np.ones(len(closes))
+    for day in range(WARMUP, len(closes)):
+        if (day - WARMUP) % params['rebalance'] == 0:
+            value = cash + np.nansum(shares * closes[day])
+            old = np.where(shares > 0, shares * closes[day] / value, 0)
+            picks = np.flatnonzero(eligible[day])
+            picks = picks[np.argsort(-signals['rs'][day][picks], kind='stable')][:params['top_n']]
+            target = np.zeros(len(shares))
+            target[picks] = 1.0 / params['top_n']
+            value *= 1 - params['cost_bps'] / 1e4 * np.abs(target - old).sum()
+            shares = np.where(target > 0, target * value / closes[day], 0)
+            cash = value * (1 - target.sum())
+        equity[day] = cash + np.nansum(shares * closes[day])
+    return equity
+
+
+def bench_backtest(n_symbols, n_days, workdir):
+    from backtest import FILTERS, param_grid, prepare_signals, simulate, sweep
+
+    matrix = build_price_matrix(synthetic_bhavdb(n_symbols, n_days), 'CLOSE')
+    grid = param_grid(top_n=(5, 10, 20, 30, 50), rebalance=(5, 10, 21, 42, 63), filters=FILTERS, cost_bps=(10,))
+    signals_time, signals = timed(lambda: prepare_signals(matrix.values), repeat=1)
+    loop_time, reference = timed(lambda: _loop_backtest(matrix.values, signals, grid[0]), repeat=1)
+    worst = np.max(np.abs(simulate(signals, grid[0])[0] / reference - 1))
+    print(f"Backtest sweep: {n_symbols} symbols x {n_days} days, {len(grid)} parameter sets ({os.cpu_count()} CPUs)")
+    print(f"{'signals (once)':<24}{signals_time:9.3f} s")
+    print(f"{'daily loop, 1 set':<24}{loop_time:9.3f} s  (~{loop_time * len(grid):.0f} s for the sweep)")
+    print(f"{'vectorized vs loop':<24}{worst:9.1e} max rel diff")
+    reference = None
+    for workers in (1, 2, 4):
+        elapsed, results = timed(lambda: sweep(matrix, grid, workers), repeat=1)
+        if reference is None:
+            reference = results
+        same = results.equals(reference)
+        print(f"{f'sweep, {workers} workers':<24}{elapsed:9.3f} s{'' if same else '  (MISMATCH)'}")
+
+
+def bench_bars(n_symbols, n_days, workdir):
+    from bars import build_bars, update_bars
+
+    df = synthetic_bhavdb(n_symbols, n_days)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    last_day = df['TIMESTAMP'] == df['TIMESTAMP'].max()
+    aggregations = {'OPEN': 'first', 'HIGH': 'max', 'LOW': 'min', 'CLOSE': 'last', 'TOTTRDQTY': 'sum'}
+
+    resample_time, _ = timed(lambda: df.set_index('TIMESTAMP').groupby('SYMBOL').resample('W-SUN').agg(aggregations),
+                             repeat=1)
+    print(f"Bars from {n_symbols} symbols x {n_days} days")
+    print(f"{'groupby().resample()':<24}{resample_time:9.3f} s")
+    for freq in ('W', 'M'):
+        build_time, bars = timed(lambda: build_bars(df, freq))
+        previous = build_bars(df[~last_day], freq)
+        update_time, updated = timed(lambda: update_bars(previous, df[last_day], freq))
+        same = updated.equals(bars)
+        print(f"{f'build_bars {freq}':<24}{build_time:9.3f} s  {len(bars)} bars")
+        print(f"{f'update_bars {freq}, 1 day':<24}{update_time:9.3f} s{'' if same else '  (MISMATCH)'}")
+
+
+def bench_metrics(n_symbols, n_days, workdir):
+    import metrics
+    from bhavzip import read_bhavcopy_zip
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("cm05JAN2024bhav.csv", synthetic_bhavcopy(n_symbols))
+    data = buffer.getvalue()
+    calls = 100000
+
+    def spans():
+        for _ in range(calls):
+            with metrics.span('stage', date='2024-01-01') as span:
+                span.add(rows=1)
+
+    metrics.disable()
+    off, _ = timed(spans)
+    parse_off, _ = timed(lambda: read_bhavcopy_zip(data), repeat=5)
+    metrics.enable()
+    on, _ = timed(spans)
+    parse_on, _ = timed(lambda: read_bhavcopy_zip(data), repeat=5)
+    metrics.disable()
+    metrics.reset()
+    print(f"span overhead disabled: {off / calls * 1e9:.0f} ns, enabled (in memory): {on / calls * 1e6:.1f} us")
+    print(f"read_bhavcopy_zip ({n_symbols} symbols): {parse_off * 1000:.2f} ms disabled, "
+          f"{parse_on * 1000:.2f} ms enabled")
+
+
+def _server_client(address, paths, repeat):
+    """Client process: request every path repeat times over one keep-alive connection."""
+    import http.client
+
+    conn = http.client.HTTPConnection(*address)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            sent = time.perf_counter()
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed, sorted(latencies)
+
+
+def bench_server(n_symbols, n_days, workdir):
+    import asyncio
+    import urllib.request
+
+    from ingest import append_day, load_manifest
+    from server import QueryServer
+    from watchistTest import build_UPD_frame
+
+    df = synthetic_bhavdb(n_symbols, n_days + 1)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    last_day = df['TIMESTAMP'].max()
+    load_manifest(workdir)
+    append_day(df[df['TIMESTAMP'] < last_day], workdir)
+    upd_path = os.path.join(workdir, "UPD.csv")
+    upd_time, _ = timed(lambda: build_UPD_frame(df, df['SYMBOL'].unique()).to_csv(
+        upd_path, index=False, date_format='%d-%b-%Y'), repeat=1)
+
+    # What a dashboard pays today for one number: parse UPD.csv again
+    def reparse():
+        upd_df = pd.read_csv(upd_path)
+        return upd_df.loc[upd_df['Symbol'] == 'SYM0001', 'R.S.'].iloc[-1]
+    reparse_time, _ = timed(reparse, repeat=1)
+
+    query_server = QueryServer(workdir, poll=0, adhoc_screens=True)
+    loop = asyncio.new_event_loop()
+    load_started = time.perf_counter()
+    server = loop.run_until_complete(query_server.start('127.0.0.1', 0))
+    load_time = time.perf_counter() - load_started
+    address = server.sockets[0].getsockname()[:2]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    rng = np.random.default_rng(0)
+    symbols = [f"SYM{i:04d}" for i in rng.integers(0, n_symbols, 200)]
+    paths = ([f"/rs/{symbol}" for symbol in symbols] + [f"/upd/{symbol}" for symbol in symbols]
+             + [f"/history/{symbol}?days=60&fields=close" for symbol in symbols]
+             + ["/rs?top=20", "/screen/leaders", "/screen?q=rs_pct%20%3E%3D%2095", "/health"])
+    print(f"Query server: {n_symbols} symbols x {n_days} days, snapshot loaded in {load_time:.2f} s")
+    print(f"{'re-parse UPD.csv per query':<30}{reparse_time * 1000:10.2f} ms")
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        for name, repeat in (("first pass (cache misses)", 1), ("warm (LRU hits)", 20)):
+            elapsed, latencies = executor.submit(_server_client, address, paths, repeat).result()
+            p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+            print(f"{name:<30}{len(latencies) / elapsed:10,.0f} req/s  p50 {p50 * 1e6:6.0f} us  p99 {p99 * 1e6:6.0f} us")
+
+        # Ingest the next day and rewrite UPD.csv, then hot-swap
+        append_day(df[df['TIMESTAMP'] == last_day], workdir)
+        build_UPD_frame(df, df['SYMBOL'].unique()).to_csv(upd_path, index=False, date_format='%d-%b-%Y')
+        before = json.loads(urllib.request.urlopen(f"http://{address[0]}:{address[1]}/health").read())
+        swap_started = time.perf_counter()
+        request = urllib.request.Request(f"http://{address[0]}:{address[1]}/reload", method='POST')
+        urllib.request.urlopen(request).read()
+        swap_time = time.perf_counter() - swap_started
+        after = json.loads(urllib.request.urlopen(f"http://{address[0]}:{address[1]}/health").read())
+        print(f"{'reload after a new day':<30}{swap_time:10.2f} s   last date {before['last_date']} -> "
+              f"{after['last_date']}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    print(f"(UPD.csv generation for the fixture took {upd_time:.1f} s)")
+
+
+def _memory_case(case, workdir):
+    """Child process side of bench_compact: run one case, return (seconds, MB held, peak RSS MB)."""
+    from compact import compact_nbytes, read_compact
+    from watchistTest import generate_UPD_csv
+
+    store_dir = store_path(workdir)
+    watchlist_path = os.path.join(workdir, "watchlist.csv")
+    started = time.perf_counter()
+    held = None
+    if case == 'csv frame':
+        held = frame_mb(pd.read_csv(os.path.join(workdir, "BhavDB.csv")))
+    elif case == 'store frame':
+        held = frame_mb(read_bhav(store_dir, upcast=True))
+    elif case == 'compact':
+        held = compact_nbytes(read_compact(store_dir)) / 1e6
+    elif case == 'UPD float64':
+        generate_UPD_csv(watchlist_path, store_dir, os.path.join(workdir, "UPD64.csv"))
+    elif case == 'UPD compact':
+        generate_UPD_csv(watchlist_path, store_dir, os.path.join(workdir, "UPD32.csv"), compact=True)
+    return time.perf_counter() - started, held, peak_rss_mb()
+
+
+def bench_compact(n_symbols, n_days, workdir):
+    from compact import UPD_PRICE_COLUMNS, compare_UPD
+
+    csv_path = os.path.join(workdir, "BhavDB.csv")
+    synthetic_bhavdb(n_symbols, n_days).to_csv(csv_path, index=False)
+    import_csv(csv_path, store_path(workdir))
+    compact_store(store_path(workdir))
+    with open(os.path.join(workdir, "watchlist.csv"), 'w') as f:
+        f.write(''.join(f"SYM{i:04d}\n" for i in range(n_symbols)))
+
+    print(f"Compact layout: {n_symbols} symbols x {n_days} days, whole universe as the watchlist")
+    print(f"{'case':<14}{'seconds':>9}{'MB held':>10}{'peak RSS MB':>13}")
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        baseline = executor.submit(peak_rss_mb).result()
+    for case in ('csv frame', 'store frame', 'compact', 'UPD float64', 'UPD compact'):
+        # A fresh process per case, so each peak is its own
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            seconds, held, peak = executor.submit(_memory_case, case, workdir).result()
+        held = f"{held:.1f}" if held is not None else '-'
+        print(f"{case:<14}{seconds:9.2f}{held:>10}{peak - baseline if peak else 0:13.0f}")
+
+    key = ['Symbol', 'TIMESTAMP']
+    expected = pd.read_csv(os.path.join(workdir, "UPD64.csv")).sort_values(key, ignore_index=True)
+    actual = pd.read_csv(os.path.join(workdir, "UPD32.csv")).sort_values(key, ignore_index=True)
+    same_rows = expected[key + UPD_PRICE_COLUMNS].equals(actual[key + UPD_PRICE_COLUMNS])
+    print(f"UPD.csv {os.path.getsize(os.path.join(workdir, 'UPD64.csv')) / 1e6:.0f} MB -> "
+          f"{os.path.getsize(os.path.join(workdir, 'UPD32.csv')) / 1e6:.0f} MB; "
+          f"rows and prices {'identical' if same_rows else 'DIFFER'}; "
+          f"largest indicator relative difference {compare_UPD(expected, actual):.2e}")
+    print(f"(peak RSS is over a {baseline:.0f} MB interpreter baseline)")
+
+
+def _stage_days(workdir):
+    with open(os.path.join(workdir, "days.json")) as f:
+        return [date.fromisoformat(day) for day in json.load(f)]
+
+
+def _stage_download(workdir, base_url):
+    from backfill import backfill, summarize
+
+    zip_dir = os.path.join(workdir, "zips")
+    os.makedirs(zip_dir, exist_ok=True)
+
+    def save(day, data):
+        with open(os.path.join(zip_dir, f"{day}.zip"), 'wb') as f:
+            f.write(data)
+
+    summary = summarize(backfill(_stage_days(workdir), save, base_url=base_url))
+    return {'items': summary['downloaded'], 'bytes': summary['bytes'], 'failed': summary['failed']}
+
+
+def _stage_extract(workdir, base_url):
+    from bhavzip import read_bhavcopy_zip
+
+    rows = size = 0
+    for day in _stage_days(workdir):
+        with open(os.path.join(workdir, "zips", f"{day}.zip"), 'rb') as f:
+            data = f.read()
+        size += len(data)
+        rows += len(read_bhavcopy_zip(data))
+    return {'items': rows, 'bytes': size}
+
+
+def _stage_ingest(workdir, base_url):
+    from bhavzip import read_bhavcopy_zip
+    from ingest import load_manifest
+    from twoyeardata import process_bhavcopy_csv
+
+    save_folder = os.path.join(workdir, "Bhav Folder")
+    os.makedirs(save_folder, exist_ok=True)
+    frames = []
+    for day in _stage_days(workdir):
+        with open(os.path.join(workdir, "zips", f"{day}.zip"), 'rb') as f:
+            frames.append((day, read_bhavcopy_zip(f.read())))
+    # Only the store writes are timed; parsing was the extract stage
+    started = time.perf_counter()
+    manifest = load_manifest(save_folder)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for day, df in frames:
+            process_bhavcopy_csv(day.strftime('%d/%m/%Y'), save_folder, df, manifest)
+    return {'items': sum(len(df) for _, df in frames), 'seconds': time.perf_counter() - started}
+
+
+def _stage_dedup(workdir, base_url):
+    """Re-ingest every day; the manifest must skip all of them."""
+    result = _stage_ingest(workdir, base_url)
+    from ingest import load_manifest
+    result['days_in_manifest'] = len(load_manifest(os.path.join(workdir, "Bhav Folder")))
+    return result
+
+
+def _stage_retention(workdir, base_url):
+    from retention import RETENTION_DAYS, apply_retention
+
+    days = _stage_days(workdir)
+    # Expire roughly the oldest month
+    today = days[0] + pd.Timedelta(days=RETENTION_DAYS + 30).to_pytimedelta()
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, files, expired = apply_retention(os.path.join(workdir, "Bhav Folder"), today)
+    return {'items': expired, 'files_removed': files}
+
+
+def _stage_rs(workdir, base_url):
+    from matrix_cache import open_matrix_cache
+    from rs_engine import matrix_relative_strength
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        cache = open_matrix_cache(os.path.join(workdir, "Bhav Folder"))
+    table = matrix_relative_strength(cache.matrix('CLOSE'))
+    return {'items': len(table)}
+
+
+def _stage_upd(workdir, base_url):
+    from bhavstore import store_path
+    from watchistTest import generate_UPD_csv
+
+    save_folder = os.path.join(workdir, "Bhav Folder")
+    upd_path = os.path.join(save_folder, "UPD.csv")
+    generate_UPD_csv(os.path.join(save_folder, "watchlist.csv"), store_path(save_folder), upd_path)
+    return {'items': sum(1 for _ in open(upd_path)) - 1, 'bytes': os.path.getsize(upd_path)}
+
+
+# Pipeline stages in run order: (name, function, unit of 'items')
+PIPELINE_STAGES = [
+    ('download', _stage_download, 'days'),
+    ('extract', _stage_extract, 'rows'),
+    ('ingest', _stage_ingest, 'rows'),
+    ('dedup', _stage_dedup, 'rows'),
+    ('retention', _stage_retention, 'days'),
+    ('rs', _stage_rs, 'symbols'),
+    ('upd', _stage_upd, 'rows'),
+]
+
+
+def _run_stage(func, workdir, base_url):
+    """Child process side: run one stage and report its time and peak RSS."""
+    started = time.perf_counter()
+    result = func(workdir, base_url)
+    result.setdefault('seconds', time.perf_counter() - started)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def run_pipeline(n_symbols, n_days, workdir, watchlist_size=None, seed=0):
+    """
+    Generate a synthetic archive and run every pipeline stage against it,
+    each in a fresh process so its peak RSS is its own.
+
+    Returns:
+    - Report dict (config, baseline RSS and per-stage figures), JSON-ready.
+    """
+    from backfill import NSE_HOLIDAYS, trading_days
+
+    # A fixed calendar ending after the UDiFF switch, so both formats are exercised
+    end = date(2024, 12, 31)
+    days = trading_days(date(2000, 1, 3), end, NSE_HOLIDAYS)[-n_days:]
+    with open(os.path.join(workdir, "days.json"), 'w') as f:
+        json.dump([day.isoformat() for day in days], f)
+    archive_root = os.path.join(workdir, "archive")
+    started = time.perf_counter()
+    archive_bytes = synthetic_archives(archive_root, days, n_symbols, seed)
+    generate_seconds = time.perf_counter() - started
+
+    # Watchlist: every k-th EQ symbol
+    watchlist_size = watchlist_size or n_symbols
+    step = max(n_symbols // watchlist_size, 1)
+    os.makedirs(os.path.join(workdir, "Bhav Folder"), exist_ok=True)
+    with open(os.path.join(workdir, "Bhav Folder", "watchlist.csv"), 'w') as f:
+        f.write(''.join(f"SYM{i:04d}\n" for i in range(0, n_symbols, step)[:watchlist_size]))
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        baseline = executor.submit(peak_rss_mb).result()
+    report = {
+        'config': {'symbols': n_symbols, 'days': len(days), 'first_day': days[0].isoformat(),
+                   'last_day': days[-1].isoformat(), 'watchlist': watchlist_size, 'seed': seed,
+                   'archive_mb': archive_bytes / 1e6, 'generate_seconds': generate_seconds,
+                   'python': sys.version.split()[0], 'cpus': os.cpu_count()},
+        'baseline_rss_mb': baseline,
+        'stages': {},
+    }
+    server, base_url = serve_directory(archive_root)
+    try:
+        for name, func, unit in PIPELINE_STAGES:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(_run_stage, func, workdir, base_url).result()
+            result['unit'] = unit
+            result['per_second'] = result['items'] / result['seconds'] if result['seconds'] else None
+            if 'bytes' in result:
+                result['mb_per_second'] = result['bytes'] / 1e6 / result['seconds'] if result['seconds'] else None
+            report['stages'][name] = result
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_pipeline(n_symbols, n_days, workdir, json_path=None):
+    report = run_pipeline(n_symbols, n_days, workdir)
+    config = report['config']
+    print(f"Pipeline on {config['symbols']} symbols x {config['days']} days "
+          f"({config['first_day']} to {config['last_day']}, {config['archive_mb']:.1f} MB of zips)")
+    print(f"{'stage':<11}{'seconds':>9}{'items':>10}{'':<8}{'per second':>13}{'peak RSS MB':>13}")
+    for name, stage in report['stages'].items():
+        rss = f"{stage['peak_rss_mb']:.0f}" if stage['peak_rss_mb'] is not None else '-'
+        print(f"{name:<11}{stage['seconds']:9.3f}{stage['items']:>10} {stage['unit']:<7}"
+              f"{stage['per_second'] or 0:13,.0f}{rss:>13}")
+    if json_path:
+        text = json.dumps(report, indent=2, default=str)
+        if json_path == '-':
+            print(text)
+        else:
+            with open(json_path, 'w') as f:
+                f.write(text + '\n')
+            print(f"Wrote {json_path}")
+
+
+BENCHMARKS = {
+    'backtest': bench_backtest,
+    'bars': bench_bars,
+    'cache': bench_cache,
+    'compact': bench_compact,
+    'indicators': bench_indicators,
+    'parallel': bench_parallel,
+    'metrics': bench_metrics,
+    'parse': bench_parse,
+    'pipeline': bench_pipeline,
+    'retention': bench_retention,
+    'screener': bench_screener,
+    'server': bench_server,
+    'rs': bench_rs,
+    'store': bench_store,
+    'upd': bench_upd,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks on synthetic bhavcopy data.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=500)
+    parser.add_argument("--years", type=float, help="pipeline: trading days as years of history (overrides --days)")
+    parser.add_argument("--json", help="pipeline: write the report as JSON to this path ('-' for stdout)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.benchmark == 'pipeline':
+            days = int(args.years * 248) if args.years else args.days
+            bench_pipeline(args.symbols, days, workdir, args.json)
+        else:
+            BENCHMARKS[args.benchmark](args.symbols, args.days, workdir)
@@ -0,0 +1,109 @@
+import io
+from collections import namedtuple
+
+import pyarrow as pa
+import pyarrow.compute
+import pyarrow.csv as pcsv
+
+import metrics
+
+
+# Columns every parsed bhavcopy has, in the legacy CSV order
+BHAV_COLUMNS = ['SYMBOL', 'SERIES', 'OPEN', 'HIGH', 'LOW', 'CLOSE', 'LAST', 'PREVCLOSE',
+                'TOTTRDQTY', 'TOTTRDVAL', 'TIMESTAMP', 'TOTALTRADES', 'ISIN']
+
+COLUMN_TYPES = {
+    'SYMBOL': pa.string(),
+    'SERIES': pa.string(),
+    'OPEN': pa.float64(),
+    'HIGH': pa.float64(),
+    'LOW': pa.float64(),
+    'CLOSE': pa.float64(),
+    'LAST': pa.float64(),
+    'PREVCLOSE': pa.float64(),
+    'TOTTRDQTY': pa.int64(),
+    'TOTTRDVAL': pa.float64(),
+    'TIMESTAMP': pa.timestamp('s'),
+    'TOTALTRADES': pa.int64(),
+    'ISIN': pa.string(),
+}
+
+# A file layout: source column for each bhavcopy column and the trade date format
+BhavSchema = namedtuple('BhavSchema', ['name', 'columns', 'date_format'])
+
+LEGACY_SCHEMA = BhavSchema('legacy', {column: column for column in BHAV_COLUMNS}, '%d-%b-%Y')
+
+# UDiFF common bhavcopy, published by NSE from July 2024
+UDIFF_SCHEMA = BhavSchema('udiff', {
+    'SYMBOL': 'TckrSymb',
+    'SERIES': 'SctySrs',
+    'OPEN': 'OpnPric',
+    'HIGH': 'HghPric',
+    'LOW': 'LwPric',
+    'CLOSE': 'ClsPric',
+    'LAST': 'LastPric',
+    'PREVCLOSE': 'PrvsClsgPric',
+    'TOTTRDQTY': 'TtlTradgVol',
+    'TOTTRDVAL': 'TtlTrfVal',
+    'TIMESTAMP': 'TradDt',
+    'TOTALTRADES': 'TtlNbOfTxsExctd',
+    'ISIN': 'ISIN',
+}, '%Y-%m-%d')
+
+SCHEMAS = [LEGACY_SCHEMA, UDIFF_SCHEMA]
+
+
+def detect_schema(header):
+    """Pick the schema whose source columns all appear in the CSV header line."""
+    names = {name.strip() for name in header.split(',')}
+    for schema in SCHEMAS:
+        if set(schema.columns.values()) <= names:
+            return schema
+    raise ValueError(f"unrecognised bhavcopy header: {header[:120]}")
+
+
+def parse_bhavcopy(source, series='EQ', columns=None, schema=None):
+    """
+    Parse a bhavcopy CSV into the legacy column layout with typed columns.
+
+    Only the needed columns are converted, rows of other series are dropped
+    before anything reaches pandas, and TIMESTAMP comes back as datetime64
+    so nothing downstream re-parses date strings.
+
+    Parameters:
+    - source: Path, file object or raw CSV bytes.
+    - series: Series to keep (None keeps every row).
+    - columns: Bhavcopy columns to return (None returns BHAV_COLUMNS).
+    - schema: BhavSchema to use; detected from the header when omitted.
+
+    Returns:
+    - DataFrame with the requested columns.
+    """
+    with metrics.span('parse') as span:
+        if isinstance(source, bytes):
+            data = source
+        elif hasattr(source, 'read'):
+            data = source.read()
+        else:
+            with open(source, 'rb') as f:
+                data = f.read()
+        if schema is None:
+            schema = detect_schema(data[:data.find(b'\n')].decode('utf-8-sig').strip())
+
+        wanted = list(BHAV_COLUMNS if columns is None else columns)
+        needed = wanted + ['SERIES'] if series is not None and 'SERIES' not in wanted else wanted
+        renames = {schema.columns[column]: column for column in needed}
+        table = pcsv.read_csv(
+            io.BytesIO(data),
+            convert_options=pcsv.ConvertOptions(
+                include_columns=list(renames),
+                column_types={source_name: COLUMN_TYPES[column] for source_name, column in renames.items()},
+                timestamp_parsers=[schema.date_format],
+                strings_can_be_null=False,
+            ),
+        )
+        table = table.rename_columns([renames[name] for name in table.column_names])
+        if series is not None:
+            table = table.filter(pa.compute.equal(pa.compute.utf8_trim_whitespace(table['SERIES']), series))
+        span.add(bytes=len(data), rows=table.num_rows)
+        return table.select(wanted).to_pandas()
@@ -0,0 +1,367 @@
+import glob
+import os
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+STORE_DIRNAME = "BhavStore"
+
+PRICE_COLUMNS = ['OPEN', 'HIGH', 'LOW', 'CLOSE', 'LAST', 'PREVCLOSE']
+
+# On-disk schema of one bhavcopy row. Prices are float32 (NSE prices have two
+# decimals, which float32 holds exactly enough to round back to paise),
+# volumes int64, repeated strings dictionary encoded and the trade date typed.
+SCHEMA = pa.schema([
+    ('SYMBOL', pa.dictionary(pa.int32(), pa.string())),
+    ('SERIES', pa.dictionary(pa.int32(), pa.string())),
+    ('OPEN', pa.float32()),
+    ('HIGH', pa.float32()),
+    ('LOW', pa.float32()),
+    ('CLOSE', pa.float32()),
+    ('LAST', pa.float32()),
+    ('PREVCLOSE', pa.float32()),
+    ('TOTTRDQTY', pa.int64()),
+    ('TOTTRDVAL', pa.float64()),
+    ('TIMESTAMP', pa.date32()),
+    ('TOTALTRADES', pa.int64()),
+    ('ISIN', pa.dictionary(pa.int32(), pa.string())),
+])
+
+
+def store_path(save_folder):
+    return os.path.join(save_folder, STORE_DIRNAME)
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    return pd.Timestamp(value).date()
+
+
+def to_store_frame(df):
+    """
+    Convert a bhavcopy DataFrame in the CSV layout (TIMESTAMP as '05-JAN-2024')
+    to the typed store layout.
+    """
+    out = pd.DataFrame(index=range(len(df)))
+    for field in SCHEMA:
+        name = field.name
+        if name not in df.columns:
+            raise KeyError(f"bhavcopy column '{name}' is missing")
+        values = df[name].to_numpy()
+        if name == 'TIMESTAMP':
+            if not np.issubdtype(values.dtype, np.datetime64):
+                values = pd.to_datetime(values, format='%d-%b-%Y').to_numpy()
+            out[name] = values.astype('datetime64[ns]')
+        elif pa.types.is_dictionary(field.type):
+            out[name] = pd.Categorical(values)
+        elif pa.types.is_float32(field.type):
+            out[name] = values.astype(np.float32)
+        else:
+            out[name] = values.astype(np.float64 if pa.types.is_float64(field.type) else np.int64)
+    return out
+
+
+def partition_path(store_dir, trade_date):
+    return os.path.join(store_dir, f"{trade_date:%Y-%m}", f"{trade_date:%Y-%m-%d}.parquet")
+
+
+def month_path(store_dir, trade_date):
+    return os.path.join(store_dir, f"{trade_date:%Y-%m}", f"{trade_date:%Y-%m}.parquet")
+
+
+def _write_table(table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+
+
+def _remove_from_month(store_dir, trade_date):
+    """Drop trade_date from a compacted month file so a rewrite can't duplicate it."""
+    path = month_path(store_dir, trade_date)
+    if not os.path.exists(path):
+        return
+    table = pq.read_table(path, schema=SCHEMA)
+    keep = pa.compute.not_equal(table['TIMESTAMP'], pa.scalar(trade_date, pa.date32()))
+    if pa.compute.all(keep).as_py():
+        return
+    table = table.filter(keep)
+    if table.num_rows:
+        _write_table(table, path)
+    else:
+        os.remove(path)
+
+
+def write_day(store_dir, df):
+    """
+    Write bhavcopy rows into one partition file per trade date. An existing
+    partition for the same date is replaced, so re-running a day is safe.
+
+    Returns:
+    - List of (trade_date, path, row_count) for the partitions written.
+    """
+    frame = to_store_frame(df)
+    written = []
+    for trade_date, day_frame in frame.groupby('TIMESTAMP', sort=True):
+        trade_date = pd.Timestamp(trade_date).date()
+        table = pa.Table.from_pandas(day_frame, schema=SCHEMA, preserve_index=False)
+        _remove_from_month(store_dir, trade_date)
+        path = partition_path(store_dir, trade_date)
+        _write_table(table, path)
+        written.append((trade_date, path, len(day_frame)))
+    return written
+
+
+def compact_month(store_dir, month):
+    """
+    Merge the day partitions of month ('YYYY-MM') into a single month file.
+    Reading a month then opens one file instead of ~21.
+
+    Returns:
+    - Path of the month file, or None if the month has no data.
+    """
+    first = date.fromisoformat(f"{month}-01")
+    files = sorted(glob.glob(os.path.join(store_dir, month, '*.parquet')),
+                   key=lambda p: (_partition_range(p)[0], len(p)))
+    if not files:
+        return None
+    path = month_path(store_dir, first)
+    if files == [path]:
+        return path
+    table = pa.concat_tables([pq.read_table(p, schema=SCHEMA) for p in files]).unify_dictionaries()
+    table = table.take(pa.compute.sort_indices(table, [('TIMESTAMP', 'ascending')]))
+    _write_table(table.combine_chunks(), path)
+    for p in files:
+        if p != path:
+            os.remove(p)
+    return path
+
+
+def compact_store(store_dir, before=None, after=None):
+    """
+    Compact every month that ends before the given date (all months when
+    before is None). The current month is normally left as day files.
+    Months starting before after are skipped as well, so retention can keep
+    the month it is expiring day by day as day files.
+    """
+    before, after = _as_date(before), _as_date(after)
+    compacted = []
+    for month in sorted(os.listdir(store_dir)) if os.path.isdir(store_dir) else []:
+        if not os.path.isdir(os.path.join(store_dir, month)):
+            continue
+        first = date.fromisoformat(f"{month}-01")
+        last = (pd.Timestamp(first) + pd.offsets.MonthEnd(0)).date()
+        if before is not None and last >= before:
+            continue
+        if after is not None and first < after:
+            continue
+        path = compact_month(store_dir, month)
+        if path is not None:
+            compacted.append(path)
+    return compacted
+
+
+def split_month(store_dir, month):
+    """Turn a compacted month file back into one partition file per trade date."""
+    first = date.fromisoformat(f"{month}-01")
+    path = month_path(store_dir, first)
+    if not os.path.exists(path):
+        return
+    table = pq.read_table(path, schema=SCHEMA)
+    for trade_date in pa.compute.unique(table['TIMESTAMP']).to_pylist():
+        keep = pa.compute.equal(table['TIMESTAMP'], pa.scalar(trade_date, pa.date32()))
+        day_path = partition_path(store_dir, trade_date)
+        if not os.path.exists(day_path):
+            _write_table(table.filter(keep), day_path)
+    os.remove(path)
+
+
+def drop_before(store_dir, cutoff):
+    """
+    Delete every partition that ends before cutoff. Whole files are removed,
+    so nothing is read or rewritten; a month file straddling the cutoff is
+    split into day files once so later days can again be dropped file by file.
+
+    Returns:
+    - List of the partition files removed.
+    """
+    cutoff = _as_date(cutoff)
+    removed = []
+    for path in list_partitions(store_dir, end=cutoff):
+        first, last = _partition_range(path)
+        if last < cutoff:
+            os.remove(path)
+            removed.append(path)
+        elif first < cutoff:
+            split_month(store_dir, f"{first:%Y-%m}")
+            removed.extend(drop_before(store_dir, cutoff))
+            break
+    for month in {os.path.dirname(path) for path in removed}:
+        if os.path.isdir(month) and not os.listdir(month):
+            os.rmdir(month)
+    return removed
+
+
+def _partition_range(path):
+    """Return the (first, last) trade date a partition file can contain."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if len(name) == 10:
+        day = date.fromisoformat(name)
+        return day, day
+    first = date.fromisoformat(f"{name}-01")
+    last = (pd.Timestamp(first) + pd.offsets.MonthEnd(0)).date()
+    return first, last
+
+
+def list_partitions(store_dir, start=None, end=None):
+    """Partition files overlapping [start, end], in trade date order."""
+    start, end = _as_date(start), _as_date(end)
+    files = []
+    paths = glob.glob(os.path.join(store_dir, '*', '*.parquet'))
+    for path in sorted(paths, key=lambda p: (_partition_range(p)[0], len(p))):
+        first, last = _partition_range(path)
+        if start is not None and last < start:
+            continue
+        if end is not None and first > end:
+            continue
+        files.append(path)
+    return files
+
+
+def read_bhav_table(store_dir, columns=None, start=None, end=None, symbols=None):
+    """
+    Load rows from the store as an Arrow table in the on-disk types
+    (dictionary-encoded strings, float32 prices, date32 TIMESTAMP), for
+    callers that don't need a DataFrame. Arguments as for read_bhav().
+    Rows come in partition order, which is trade date order unless a day
+    was written after its month was compacted.
+    """
+    start, end = _as_date(start), _as_date(end)
+    files = list_partitions(store_dir, start, end)
+    schema = SCHEMA if columns is None else pa.schema([SCHEMA.field(c) for c in columns])
+    if not files:
+        return schema.empty_table()
+
+    dataset = ds.dataset(files, schema=SCHEMA, format='parquet')
+    expression = None
+    if start is not None:
+        expression = ds.field('TIMESTAMP') >= pa.scalar(start, pa.date32())
+    if end is not None:
+        clause = ds.field('TIMESTAMP') <= pa.scalar(end, pa.date32())
+        expression = clause if expression is None else expression & clause
+    if symbols is not None:
+        clause = ds.field('SYMBOL').isin(list(symbols))
+        expression = clause if expression is None else expression & clause
+
+    return dataset.to_table(columns=schema.names, filter=expression)
+
+
+def read_bhav(store_dir, columns=None, start=None, end=None, symbols=None, upcast=False):
+    """
+    Load rows from the store.
+
+    Parameters:
+    - columns: Columns to read (None reads all). Only these are decoded.
+    - start, end: Inclusive trade date bounds. Partitions outside the range
+      are never opened; the bounds are also pushed down as a row filter.
+    - symbols: Optional list of symbols to keep, pushed down to the reader.
+    - upcast: Return prices as float64 rounded to paise instead of float32.
+
+    Returns:
+    - DataFrame in trade date order with categorical SYMBOL/SERIES and a
+      datetime64 TIMESTAMP column.
+    """
+    df = read_bhav_table(store_dir, columns, start, end, symbols).to_pandas(date_as_object=False)
+    if 'TIMESTAMP' in df.columns and not df['TIMESTAMP'].is_monotonic_increasing:
+        # A day written after its month was compacted sorts after the month file
+        df = df.sort_values('TIMESTAMP', kind='stable', ignore_index=True)
+    if upcast:
+        for column in PRICE_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype(np.float64).round(2)
+    return df
+
+
+def load_bhavdb(path, columns=None, symbols=None, upcast=True):
+    """
+    Load BhavDB from either a store folder or a legacy BhavDB.csv file.
+    Analytics scripts call this so both layouts keep working.
+    """
+    if os.path.isdir(path):
+        return read_bhav(path, columns=columns, symbols=symbols, upcast=upcast)
+    df = pd.read_csv(path, usecols=columns)
+    if symbols is not None:
+        df = df[df['SYMBOL'].isin(list(symbols))]
+    return df
+
+
+def import_csv(csv_path, store_dir, chunksize=500_000):
+    """
+    Migrate an existing BhavDB.csv into the partitioned store and record
+    every imported day in the ingest manifest of the store's save folder.
+
+    The CSV is read in chunks and need not be sorted: a date already
+    written by an earlier chunk is merged with its partition. Rows are
+    deduplicated on (SYMBOL, TIMESTAMP), keeping the first.
+
+    Returns:
+    - Number of rows in the imported days.
+    """
+    from ingest import (KEY_COLUMNS, build_manifest, day_checksum, load_manifest, manifest_path,
+                        save_manifest)
+
+    save_folder = os.path.dirname(os.path.abspath(store_dir))
+    # A store without a manifest gets one built from scratch afterwards
+    rebuild = not os.path.isfile(manifest_path(save_folder)) and bool(list_partitions(store_dir))
+    days = {}
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk = chunk.drop(columns=[c for c in chunk.columns if str(c).startswith('Unnamed:')])
+        chunk['TIMESTAMP'] = pd.to_datetime(chunk['TIMESTAMP'], format='%d-%b-%Y')
+        for timestamp, day_df in chunk.groupby('TIMESTAMP', sort=True):
+            key = timestamp.strftime('%Y-%m-%d')
+            if key in days:
+                # The date continues from an earlier chunk
+                day_df = pd.concat([read_bhav(store_dir, start=timestamp, end=timestamp), day_df],
+                                   ignore_index=True)
+            day_df = day_df.drop_duplicates(subset=KEY_COLUMNS, keep='first')
+            write_day(store_dir, day_df)
+            days[key] = {'rows': len(day_df), 'checksum': day_checksum(day_df)}
+
+    if rebuild:
+        manifest = build_manifest(save_folder)
+    else:
+        manifest = load_manifest(save_folder) if os.path.isfile(manifest_path(save_folder)) else {}
+        manifest.update(days)
+    save_manifest(save_folder, manifest)
+    return sum(entry['rows'] for entry in days.values())
+
+
+def export_csv(store_dir, csv_path):
+    """Write the store back out in the BhavDB.csv layout."""
+    df = read_bhav(store_dir)
+    df['TIMESTAMP'] = df['TIMESTAMP'].dt.strftime('%d-%b-%Y').str.upper()
+    df.to_csv(csv_path, index=False, float_format='%.2f')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the partitioned BhavDB store.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("csv_path", help="BhavDB.csv to import from or export to")
+    parser.add_argument("--store", default=store_path("D:/Bhav Folder"))
+    args = parser.parse_args()
+
+    if args.command == "import":
+        rows = import_csv(args.csv_path, args.store)
+        print(f"Imported {rows} rows into {args.store}")
+    else:
+        export_csv(args.store, args.csv_path)
+        print(f"Exported {args.store} to {args.csv_path}")
@@ -0,0 +1,46 @@
+import hashlib
+import io
+import os
+import zipfile
+
+import metrics
+from bhavparse import parse_bhavcopy
+
+
+def read_bhavcopy_zip(data, series='EQ'):
+    """
+    Parse a bhavcopy archive straight from memory.
+
+    Parameters:
+    - data: Raw bytes of the downloaded .zip archive.
+    - series: Series to keep (None keeps every row).
+
+    Returns:
+    - Typed DataFrame (see bhavparse.parse_bhavcopy) for the CSV member of
+      the archive, legacy or UDiFF; no files are written.
+    """
+    with metrics.span('extract') as span:
+        with zipfile.ZipFile(io.BytesIO(data)) as zip_ref:
+            members = [name for name in zip_ref.namelist() if name.lower().endswith('.csv')]
+            if not members:
+                raise zipfile.BadZipFile("archive contains no CSV member")
+            csv_data = zip_ref.read(members[0])
+        span.add(bytes=len(data), csv_bytes=len(csv_data))
+    return parse_bhavcopy(csv_data, series)
+
+
+def cache_archive(data, cache_dir):
+    """
+    Store the raw archive under its SHA-256 digest and return the path.
+    Identical downloads map to the same file, so re-runs never rewrite it
+    and concurrent writers can't clobber each other.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(cache_dir, digest[:2], f"{digest}.zip")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as out_file:
+            out_file.write(data)
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,250 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from bars import day_numbers
+from bhavstore import read_bhav_table
+from indicator_state import (DAILY_COLUMNS, INDICATOR_COLUMNS, new_state, slice_bar_closes, update_symbol,
+                             upd_kernel, weekly_bar_closes, weekly_indicators)
+from parallel import map_columns
+from price_matrix import segment_positions, trade_dates
+
+
+# Long BhavDB rows in compact form, sorted by (symbol code, day):
+# - symbols: the shared symbol dictionary, sorted; every code indexes it
+# - codes: int32 symbol code of every row
+# - days: int32 days since 1970-01-01
+# - prices: price column -> float32 array, or int32 paise when read with paise=True
+CompactBhav = namedtuple('CompactBhav', ['symbols', 'codes', 'days', 'prices'])
+
+UPD_PRICE_COLUMNS = ['HIGH', 'LOW', 'CLOSE', 'LAST']
+
+# Indicator columns computed per row, in the order of the output block
+UPD_VALUE_COLUMNS = ['R.S.'] + INDICATOR_COLUMNS
+
+# Watchlist symbols whose indicators are computed together; bounds the
+# date x symbol scratch matrices whatever the watchlist size
+CHUNK_SYMBOLS = 256
+
+# Rows per to_csv call when writing UPD.csv from compact arrays
+CHUNK_ROWS = 200_000
+
+
+def to_paise(prices):
+    """Prices (rupees, float) as int32 paise."""
+    return np.rint(np.asarray(prices, dtype=np.float64) * 100).astype(np.int32)
+
+
+def as_rupees(prices):
+    """
+    Float32 or paise prices as the float64 values read_bhav(upcast=True)
+    returns, so indicators computed from either layout are identical.
+    """
+    prices = np.asarray(prices)
+    if prices.dtype.kind == 'i':
+        return prices / 100
+    return np.round(prices.astype(np.float64), 2)
+
+
+def _compact(symbols, codes, days, prices, paise):
+    """Drop unused dictionary entries, sort by (code, day) and narrow the types."""
+    used = np.bincount(codes, minlength=len(symbols)) > 0
+    codes = (np.cumsum(used) - 1)[codes]
+    order = np.lexsort((days, codes))
+    prices = {name: (to_paise(values[order]) if paise else np.asarray(values[order], dtype=np.float32))
+              for name, values in prices.items()}
+    return CompactBhav(symbols[used], codes[order].astype(np.int32), days[order].astype(np.int32), prices)
+
+
+def read_compact(store_dir, fields=UPD_PRICE_COLUMNS, start=None, end=None, symbols=None, paise=False):
+    """
+    Read store rows straight from Arrow into a CompactBhav: the SYMBOL
+    dictionary becomes the shared dictionary, date32 trade dates are
+    already int32 day numbers and float32 prices are used as stored, so
+    no Python objects are created per row.
+
+    Parameters:
+    - fields: Price columns to load.
+    - start, end, symbols: As for bhavstore.read_bhav().
+    - paise: Return prices as int32 paise instead of float32 rupees.
+    """
+    table = read_bhav_table(store_dir, ['SYMBOL', 'TIMESTAMP'] + list(fields), start, end, symbols)
+    table = table.unify_dictionaries().combine_chunks()
+    column = table['SYMBOL']
+    chunk = column.chunk(0) if column.num_chunks else pa.array([], pa.dictionary(pa.int32(), pa.string()))
+    # Sort the dictionary so codes follow symbol order
+    dictionary = np.asarray(chunk.dictionary.to_pylist(), dtype=object)
+    symbols, remap = np.unique(dictionary.astype(str), return_inverse=True)
+    codes = remap[chunk.indices.to_numpy()] if len(dictionary) else np.zeros(0, dtype=np.int64)
+    days = table['TIMESTAMP'].cast(pa.int32()).to_numpy()
+    prices = {name: table[name].to_numpy() for name in fields}
+    return _compact(np.asarray(symbols, dtype=object), codes, days, prices, paise)
+
+
+def frame_to_compact(df, fields=UPD_PRICE_COLUMNS, paise=False):
+    """CompactBhav from a BhavDB DataFrame, e.g. a legacy BhavDB.csv."""
+    codes, symbols = pd.factorize(df['SYMBOL'].astype(str), sort=True)
+    days = day_numbers(trade_dates(df['TIMESTAMP']))
+    prices = {name: df[name].to_numpy(dtype=np.float64) for name in fields}
+    return _compact(np.asarray(symbols, dtype=object), codes, days, prices, paise)
+
+
+def compact_nbytes(compact):
+    return (compact.codes.nbytes + compact.days.nbytes + sum(v.nbytes for v in compact.prices.values())
+            + sum(len(s) for s in compact.symbols))
+
+
+def watchlist_rows(compact, watchlist):
+    """
+    Rows of the watchlist symbols ordered by (watchlist position, day), the
+    order build_UPD_frame uses, and the watchlist position of each.
+    """
+    position = pd.Index(watchlist).get_indexer(compact.symbols)
+    row_position = position[compact.codes] if len(compact.codes) else np.zeros(0, dtype=np.int64)
+    order = np.lexsort((compact.days, row_position))
+    order = order[row_position[order] >= 0]
+    return order, row_position[order].astype(np.int32)
+
+
+def compact_indicators(compact, watchlist, dtype=np.float32, workers=1, out=None, bars=None):
+    """
+    R.S. and every INDICATOR_COLUMNS value for the watchlist rows, written
+    into one preallocated (len(UPD_VALUE_COLUMNS), rows) block.
+
+    Symbols are processed CHUNK_SYMBOLS at a time, so the date x symbol
+    scratch matrices the kernels need stay small however long the history
+    or the watchlist; each chunk is computed in float64 from the same
+    paise-exact closes as build_UPD_frame and only stored as dtype.
+
+    Parameters:
+    - compact: CompactBhav with a CLOSE price column.
+    - watchlist: Array of unique symbols; output rows follow this order.
+    - dtype: Storage type of the block (float32 halves it).
+    - workers: Processes for the daily kernels of each chunk.
+    - out: Optional preallocated block to fill.
+    - bars: Optional cached weekly bars (bars.load_bars) for the weekly columns.
+
+    Returns:
+    - (rows, positions, block): compact row indices in output order, their
+      watchlist positions and the indicator block.
+    """
+    rows, positions = watchlist_rows(compact, watchlist)
+    if out is None:
+        out = np.empty((len(UPD_VALUE_COLUMNS), len(rows)), dtype=dtype)
+    column = {name: i for i, name in enumerate(UPD_VALUE_COLUMNS)}
+    outputs = {name: 'matrix' for name in ['R.S.'] + DAILY_COLUMNS}
+    bar_closes = weekly_bar_closes(bars, watchlist) if bars is not None else None
+
+    bounds = np.searchsorted(positions, np.arange(0, len(watchlist) + CHUNK_SYMBOLS, CHUNK_SYMBOLS))
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if first == last:
+            continue
+        chunk = rows[first:last]
+        codes = positions[first:last] - positions[first]
+        close = as_rupees(compact.prices['CLOSE'][chunk])
+        index = segment_positions(codes)
+        matrix = np.full((index.max() + 1, codes.max() + 1), np.nan)
+        matrix[index, codes] = close
+        for name, values in map_columns(upd_kernel, matrix, outputs, workers).items():
+            out[column[name], first:last] = values[index, codes]
+        chunk_bars = (slice_bar_closes(bar_closes, positions[first], positions[last - 1] + 1)
+                      if bar_closes is not None else None)
+        for name, values in weekly_indicators(codes, compact.days[chunk], close, chunk_bars).items():
+            out[column[name], first:last] = values
+    return rows, positions, out
+
+
+def compact_state(compact, watchlist):
+    """
+    Incremental indicator state (see indicator_state) for the watchlist,
+    replayed straight from the compact arrays: each symbol's closes are
+    already contiguous and in date order, so no DataFrame of the history
+    is built. Closes go in as the same float64 rupees as rebuild_state()
+    uses.
+    """
+    watchlist = np.asarray(watchlist, dtype=object)
+    state = new_state(watchlist)
+    rows, positions = watchlist_rows(compact, watchlist)
+    if not len(rows):
+        return state
+    days = compact.days[rows]
+    close = as_rupees(compact.prices['CLOSE'][rows])
+    bounds = np.flatnonzero(np.r_[True, positions[1:] != positions[:-1], True])
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        symbol_state = state['symbols'][watchlist[positions[first]]]
+        for day, value in zip(days[first:last].tolist(), close[first:last].tolist()):
+            update_symbol(symbol_state, value, day)
+    state['last_date'] = str(np.datetime64(int(days.max()), 'D'))
+    return state
+
+
+def write_UPD_csv(upd_path, compact, watchlist, rows, positions, block):
+    """
+    Write UPD.csv, sorted on R.S. descending like generate_UPD_csv, from
+    compact arrays a CHUNK_ROWS slice at a time. Float32 columns are written
+    at float32 precision (shortest round-trip digits).
+    """
+    watchlist = np.asarray(watchlist, dtype=object)
+    order = np.argsort(-block[0], kind='stable')
+    dates = compact.days.astype('datetime64[D]')
+    for start in range(0, max(len(order), 1), CHUNK_ROWS):
+        part = order[start:start + CHUNK_ROWS]
+        at = rows[part]
+        empty = np.full(len(part), np.nan, dtype=block.dtype)
+        frame = pd.DataFrame({
+            'Date': empty, 'Symbol': watchlist[positions[part]], 'R.S.': block[0, part],
+            'Daily High': empty, 'Daily Low': empty,
+            **{name: block[i + 1, part] for i, name in enumerate(INDICATOR_COLUMNS)},
+            'TIMESTAMP': dates[at],
+            **{name: (compact.prices[name][at] / 100 if compact.prices[name].dtype.kind == 'i'
+                      else compact.prices[name][at]) for name in UPD_PRICE_COLUMNS},
+        })
+        frame.to_csv(upd_path, mode='w' if start == 0 else 'a', header=start == 0, index=False,
+                     date_format='%d-%b-%Y')
+
+
+def compare_UPD(expected, actual):
+    """
+    Largest relative difference between two UPD frames over the R.S. and
+    indicator columns (inf if their rows or NaN patterns differ).
+    """
+    if len(expected) != len(actual):
+        return np.inf
+    worst = 0.0
+    for name in UPD_VALUE_COLUMNS:
+        want = expected[name].to_numpy(dtype=np.float64)
+        got = actual[name].to_numpy(dtype=np.float64)
+        if not np.array_equal(np.isnan(want), np.isnan(got)):
+            return np.inf
+        with np.errstate(invalid='ignore', divide='ignore'):
+            diff = np.abs(got - want) / np.maximum(np.abs(want), 1e-12)
+        worst = max(worst, float(np.nanmax(diff, initial=0.0)))
+    return worst
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from bhavstore import load_bhavdb, store_path
+    from watchistTest import build_UPD_frame
+
+    parser = argparse.ArgumentParser(description="Check compact float32 UPD indicators against the float64 path.")
+    parser.add_argument("--save-folder", default="D:/Bhav Folder")
+    parser.add_argument("--watchlist", default="D:/Bhav Folder/watchlist.csv")
+    parser.add_argument("--paise", action="store_true", help="load prices as int32 paise")
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    watchlist = pd.read_csv(args.watchlist, header=None, names=['Symbol'])['Symbol'].astype(str).unique()
+    store_dir = store_path(args.save_folder)
+    compact = read_compact(store_dir, symbols=watchlist, paise=args.paise)
+    rows, positions, block = compact_indicators(compact, watchlist)
+    actual = pd.DataFrame(block.T, columns=UPD_VALUE_COLUMNS)
+    expected = build_UPD_frame(load_bhavdb(store_dir, symbols=watchlist), watchlist)
+    worst = compare_UPD(expected, actual)
+    print(f"Compact layout: {compact_nbytes(compact) / 1e6:.1f} MB for {len(compact.codes)} rows; "
+          f"largest relative difference vs float64: {worst:.3e}")
+    if worst > args.tolerance:
+        raise SystemExit("Compact indicators are outside the tolerance")
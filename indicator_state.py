@@ -0,0 +1,470 @@
+import json
+import math
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from bars import day_numbers, period_start
+from indicators import ema, roc, rolling_max, rolling_min, sma
+from price_matrix import segment_positions, trade_dates
+
+
+# Per-row UPD columns, in the order generate_UPD_csv writes them
+UPD_COLUMNS = [
+    'TIMESTAMP', 'Symbol', 'R.S.', 'HIGH', 'LOW', 'CLOSE', 'LAST',
+    'Weekly Close', 'One Week Ago Close',
+    'Weekly EMA(10)', 'Weekly EMA(40)', 'Daily SMA(50)', 'Daily SMA(200)', 'Daily SMA(250)',
+    'Daily EMA(10)', 'Daily EMA(30)', 'One Week Ago 52-week High', 'One Week Ago 52-week Low',
+    'One Day Ago 100-day High', 'One Day Ago 100-day Low', 'Weekly Upper Bollinger Band(20,2)',
+    'Weekly Lower Bollinger Band(20,1)'
+]
+
+INDICATOR_COLUMNS = UPD_COLUMNS[7:]
+
+# Indicators over each symbol's daily closes (upd_indicators/upd_kernel)
+DAILY_COLUMNS = ['Daily SMA(50)', 'Daily SMA(200)', 'Daily SMA(250)', 'Daily EMA(10)', 'Daily EMA(30)',
+                 'One Day Ago 100-day High', 'One Day Ago 100-day Low']
+
+# Indicators over weekly bars and calendar weeks (weekly_indicators)
+WEEKLY_COLUMNS = ['Weekly Close', 'One Week Ago Close', 'Weekly EMA(10)', 'Weekly EMA(40)',
+                  'One Week Ago 52-week High', 'One Week Ago 52-week Low',
+                  'Weekly Upper Bollinger Band(20,2)', 'Weekly Lower Bollinger Band(20,1)']
+
+ROC_PERIODS = (63, 126, 189, 252)
+EMA_WINDOWS = (10, 30)
+SMA_WINDOWS = (50, 200, 250)
+HIGH_LOW_100D = (100, 1)     # (window, shift) of the 100-day high/low
+
+# Weekly indicators run on Monday-Sunday bars whose close is the latest
+# close, so on the last trading day of a week they equal the indicator of
+# the finished weekly series
+WEEKLY_EMA_WINDOWS = (10, 40)
+WEEKLY_BOLLINGER = 20        # weeks, including the current one
+ONE_WEEK = 7                 # calendar days
+YEAR = 364                   # calendar days in the 52-week window
+
+# Closes kept per symbol: enough for ROC(252) and the longest SMA
+HISTORY = max(ROC_PERIODS) + 1
+
+# Closes between exact recomputes of the running SMA sums, so rounding
+# drift in the add/subtract updates can't accumulate
+RESUM_EVERY = 1000
+
+STATE_VERSION = 4
+
+
+def new_symbol_state():
+    return {
+        'count': 0,         # number of closes seen so far
+        'closes': deque(maxlen=HISTORY),    # the last HISTORY closes
+        'sums': {str(w): 0.0 for w in SMA_WINDOWS},     # running sums of the last w closes
+        'ema': {str(w): None for w in EMA_WINDOWS},
+        # Monotonic deques of [index, close]; front is the window max/min
+        'high_100d': deque(), 'low_100d': deque(),
+        'week': None,       # day number of the current week's Monday
+        'week_close': None,
+        'weekly': deque(maxlen=WEEKLY_BOLLINGER - 1),   # last finished weekly closes
+        'weekly_ema': {str(w): None for w in WEEKLY_EMA_WINDOWS},
+        'first_day': None,
+        # [day number, close] of the closes less than ONE_WEEK calendar days old
+        'pending': deque(),
+        # Latest close at least ONE_WEEK days old, and monotonic deques of
+        # [day number, close] over the YEAR calendar days ending ONE_WEEK ago
+        'week_ago': None, 'high_52w': deque(), 'low_52w': deque(),
+    }
+
+
+# Deques of a symbol state and their maxlen; JSON checkpoints store them as lists
+DEQUES = {'closes': HISTORY, 'weekly': WEEKLY_BOLLINGER - 1, 'high_100d': None, 'low_100d': None,
+          'pending': None, 'high_52w': None, 'low_52w': None}
+
+
+def _restore_symbol_state(state):
+    for key, maxlen in DEQUES.items():
+        state[key] = deque(state[key], maxlen)
+    return state
+
+
+def new_state(symbols=()):
+    return {
+        'version': STATE_VERSION,
+        'last_date': None,
+        'symbols': {symbol: new_symbol_state() for symbol in symbols},
+    }
+
+
+def _push_max(window_deque, index, value, window):
+    while window_deque and window_deque[-1][1] <= value:
+        window_deque.pop()
+    window_deque.append([index, value])
+    while window_deque[0][0] <= index - window:
+        window_deque.popleft()
+
+
+def _push_min(window_deque, index, value, window):
+    while window_deque and window_deque[-1][1] >= value:
+        window_deque.pop()
+    window_deque.append([index, value])
+    while window_deque[0][0] <= index - window:
+        window_deque.popleft()
+
+
+def _update_weekly(state, close, day):
+    """Weekly bar and calendar-week indicators for one new (day number, close)."""
+    week = int(period_start(day, 'W'))
+    if state['week'] is not None and week != state['week']:
+        # The previous week is finished: its last close joins the weekly series
+        finished = state['week_close']
+        state['weekly'].append(finished)
+        for window in WEEKLY_EMA_WINDOWS:
+            previous = state['weekly_ema'][str(window)]
+            state['weekly_ema'][str(window)] = (finished if previous is None
+                                                else (finished - previous) * (2 / (window + 1)) + previous)
+    state['week'], state['week_close'] = week, close
+
+    values = {'Weekly Close': state['weekly'][-1] if state['weekly'] else math.nan}
+    for window in WEEKLY_EMA_WINDOWS:
+        previous = state['weekly_ema'][str(window)]
+        values[f'Weekly EMA({window})'] = close if previous is None else (close - previous) * (2 / (window + 1)) + previous
+    if len(state['weekly']) == WEEKLY_BOLLINGER - 1:
+        window = list(state['weekly']) + [close]
+        mean = math.fsum(window) / WEEKLY_BOLLINGER
+        std = math.sqrt(math.fsum((c - mean) ** 2 for c in window) / (WEEKLY_BOLLINGER - 1))
+    else:
+        mean = std = math.nan
+    values['Weekly Upper Bollinger Band(20,2)'] = mean + 2 * std
+    values['Weekly Lower Bollinger Band(20,1)'] = mean - std
+
+    # Closes enter the 52-week deques once they are ONE_WEEK calendar days
+    # old; the deques then cover (day - ONE_WEEK - YEAR, day - ONE_WEEK]
+    if state['first_day'] is None:
+        state['first_day'] = day
+    lagged = day - ONE_WEEK
+    pending = state['pending']
+    pending.append([day, close])
+    while pending[0][0] <= lagged:
+        entry_day, entry_close = pending.popleft()
+        state['week_ago'] = entry_close
+        _push_max(state['high_52w'], entry_day, entry_close, YEAR)
+        _push_min(state['low_52w'], entry_day, entry_close, YEAR)
+    for window_deque in (state['high_52w'], state['low_52w']):
+        while window_deque and window_deque[0][0] <= lagged - YEAR:
+            window_deque.popleft()
+    values['One Week Ago Close'] = state['week_ago'] if state['week_ago'] is not None else math.nan
+    full = state['high_52w'] and state['first_day'] <= day - YEAR
+    values['One Week Ago 52-week High'] = state['high_52w'][0][1] if full else math.nan
+    values['One Week Ago 52-week Low'] = state['low_52w'][0][1] if full else math.nan
+    return values
+
+
+def update_symbol(state, close, day):
+    """
+    Advance one symbol's state by one close on day (days since 1970-01-01)
+    and return that day's indicators. Every step touches a bounded number of
+    values, independent of history length.
+    """
+    closes = state['closes']
+    index = state['count']
+    closes.append(close)
+    state['count'] = index + 1
+
+    # Running SMA sums: add the new close, drop the one leaving the window
+    sums = state['sums']
+    for window in SMA_WINDOWS:
+        if state['count'] % RESUM_EVERY == 0:
+            sums[str(window)] = math.fsum(list(closes)[-window:])
+        else:
+            sums[str(window)] += close - (closes[-1 - window] if index >= window else 0.0)
+    sma = {window: sums[str(window)] / window if index >= window - 1 else math.nan for window in SMA_WINDOWS}
+
+    for window in EMA_WINDOWS:
+        previous = state['ema'][str(window)]
+        state['ema'][str(window)] = close if previous is None else (close - previous) * (2 / (window + 1)) + previous
+
+    # The 100-day window ends one row back and takes the close from that row
+    window, shift = HIGH_LOW_100D
+    lagged = index - shift
+    if lagged >= 0:
+        _push_max(state['high_100d'], lagged, closes[-1 - shift], window)
+        _push_min(state['low_100d'], lagged, closes[-1 - shift], window)
+    full = lagged >= window - 1
+
+    rocs = [close / closes[-1 - n] - 1 if len(closes) > n else math.nan for n in ROC_PERIODS]
+    rs = (rocs[0] * 2 + rocs[1] + rocs[2] + rocs[3]) / 5
+
+    return {
+        'R.S.': rs,
+        'Daily SMA(50)': sma[50],
+        'Daily SMA(200)': sma[200],
+        'Daily SMA(250)': sma[250],
+        'Daily EMA(10)': state['ema']['10'],
+        'Daily EMA(30)': state['ema']['30'],
+        'One Day Ago 100-day High': state['high_100d'][0][1] if full else math.nan,
+        'One Day Ago 100-day Low': state['low_100d'][0][1] if full else math.nan,
+        **_update_weekly(state, close, day),
+    }
+
+
+def update_day(state, day_df):
+    """
+    Feed one trading day of bhavcopy rows into the state.
+
+    Parameters:
+    - state: State from new_state()/load_state(); only its symbols are updated.
+    - day_df: Rows of a single trade date (any extra symbols are ignored).
+
+    Returns:
+    - DataFrame of UPD rows for the day, or an empty frame if the day is
+      not newer than the state (so replaying a day is a no-op).
+    """
+    day = trade_dates(day_df['TIMESTAMP']).max()
+    if state['last_date'] is not None and day <= pd.Timestamp(state['last_date']):
+        return pd.DataFrame(columns=UPD_COLUMNS)
+
+    symbols = state['symbols']
+    day_df = day_df[day_df['SYMBOL'].astype(str).isin(symbols.keys())]
+    day_number = int(day_numbers([day])[0])
+    rows = []
+    for row in day_df.itertuples(index=False):
+        values = update_symbol(symbols[str(row.SYMBOL)], float(row.CLOSE), day_number)
+        values.update({'TIMESTAMP': row.TIMESTAMP, 'Symbol': str(row.SYMBOL),
+                       'HIGH': row.HIGH, 'LOW': row.LOW, 'CLOSE': row.CLOSE, 'LAST': row.LAST})
+        rows.append(values)
+    state['last_date'] = day.strftime('%Y-%m-%d')
+    return pd.DataFrame(rows, columns=UPD_COLUMNS)
+
+
+def rebuild_state(bhavdb_df, symbols):
+    """
+    Replay the full history of the given symbols into a fresh state.
+
+    Returns:
+    - (state, upd_df) with the UPD rows of every replayed day.
+    """
+    state = new_state(symbols)
+    bhavdb_df = bhavdb_df[bhavdb_df['SYMBOL'].astype(str).isin(symbols)]
+    dates = trade_dates(bhavdb_df['TIMESTAMP'])
+    frames = [update_day(state, day_df) for _, day_df in bhavdb_df.groupby(dates, sort=True)]
+    upd_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=UPD_COLUMNS)
+    return state, upd_df
+
+
+def load_state(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state.get('version') != STATE_VERSION:
+        return None
+    for symbol_state in state['symbols'].values():
+        _restore_symbol_state(symbol_state)
+    return state
+
+
+def save_state(path, state):
+    """Checkpoint the state atomically so a crash never leaves half a file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, default=list)
+    os.replace(tmp_path, path)
+
+
+def upd_indicators(close):
+    """
+    Daily indicators for whole close histories, the way generate_UPD_csv
+    defines them. close is one symbol's Series, or a DataFrame with one
+    column per symbol whose rows are that symbol's consecutive trading days.
+
+    Returns:
+    - Dict mapping 'R.S.' and each DAILY_COLUMNS name to a Series/DataFrame shaped like close.
+    """
+    rocs = [roc(close, n) for n in ROC_PERIODS]
+    return {
+        'R.S.': (rocs[0] * 2 + rocs[1] + rocs[2] + rocs[3]) / 5,
+        'Daily SMA(50)': sma(close, 50),
+        'Daily SMA(200)': sma(close, 200),
+        'Daily SMA(250)': sma(close, 250),
+        'Daily EMA(10)': ema(close, 10),
+        'Daily EMA(30)': ema(close, 30),
+        'One Day Ago 100-day High': rolling_max(close, *HIGH_LOW_100D),
+        'One Day Ago 100-day Low': rolling_min(close, *HIGH_LOW_100D),
+    }
+
+
+def upd_kernel(close):
+    """upd_indicators() over a 2-D column block, as plain arrays for parallel.map_columns."""
+    return {name: values.to_numpy() for name, values in upd_indicators(pd.DataFrame(close)).items()}
+
+
+def weekly_bar_closes(bars, symbols):
+    """
+    (codes, periods, closes) of cached weekly bars (bars.load_bars(..., 'W'))
+    for symbols, sorted by (code, period), in the form weekly_indicators
+    takes them: codes index symbols, periods are day numbers.
+    """
+    codes = pd.Index(symbols).get_indexer(bars['SYMBOL'].astype(str))
+    keep = codes >= 0
+    codes = codes[keep]
+    periods = bars['PERIOD'].to_numpy()[keep].astype('datetime64[D]').astype(np.int64)
+    closes = bars['CLOSE'].to_numpy(dtype=np.float64)[keep]
+    order = np.lexsort((periods, codes))
+    return codes[order], periods[order], closes[order]
+
+
+def slice_bar_closes(bar_closes, first, last):
+    """The bars of symbol codes first..last-1, re-coded from 0."""
+    codes, periods, closes = bar_closes
+    lo, hi = np.searchsorted(codes, [first, last])
+    return codes[lo:hi] - first, periods[lo:hi], closes[lo:hi]
+
+
+def _row_bars(codes, weeks, close, bar_closes):
+    """
+    Weekly closes per (symbol, bar position) and each row's bar position,
+    from the cached bars when they cover every row's week, otherwise from
+    the rows themselves (the last row of every (symbol, week) run).
+    """
+    if bar_closes is not None and len(bar_closes[0]):
+        bar_codes, bar_weeks, bar_close = bar_closes
+        keys = bar_codes * (1 << 32) + bar_weeks
+        row_keys = codes * (1 << 32) + weeks
+        at = np.minimum(np.searchsorted(keys, row_keys), len(keys) - 1)
+        if np.array_equal(keys[at], row_keys):
+            return bar_codes, bar_close, segment_positions(bar_codes), at
+    new_bar = np.r_[True, (codes[1:] != codes[:-1]) | (weeks[1:] != weeks[:-1])]
+    bar_codes = codes[new_bar]
+    bar_close = close[np.r_[np.flatnonzero(new_bar)[1:] - 1, len(codes) - 1]]
+    return bar_codes, bar_close, segment_positions(bar_codes), np.cumsum(new_bar) - 1
+
+
+def weekly_indicators(codes, days, close, bar_closes=None):
+    """
+    WEEKLY_COLUMNS for long rows sorted by (symbol code, day).
+
+    The EMAs and Bollinger bands run over Monday-Sunday weekly closes
+    (about a fifth as many values as daily closes) with the current bar
+    closing at the row's close. The "One Week Ago" values look back seven
+    calendar days, not seven rows.
+
+    Parameters:
+    - codes: Integer symbol code of every row (0..n_symbols-1).
+    - days: Day number (days since 1970-01-01) of every row.
+    - close: Close of every row.
+    - bar_closes: Optional weekly_bar_closes() of the cached bars, coded
+      like codes; the weekly series then comes from the cache instead of
+      being rebuilt from the rows.
+
+    Returns:
+    - Dict mapping each WEEKLY_COLUMNS name to an array with one value per row.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    close = np.asarray(close, dtype=np.float64)
+    out = {name: np.full(len(codes), np.nan) for name in WEEKLY_COLUMNS}
+    if len(codes) == 0:
+        return out
+    n_symbols = codes.max() + 1
+
+    weeks = period_start(days, 'W')
+    bar_codes, bar_close, bar_positions, bar = _row_bars(codes, weeks, close, bar_closes)
+    weekly = np.full((bar_positions.max() + 1, max(n_symbols, bar_codes.max() + 1)), np.nan)
+    weekly[bar_positions, bar_codes] = bar_close
+
+    # Row -> its bar's position; finished weeks are the positions before it
+    position = bar_positions[bar]
+    has_previous = position > 0
+    previous = (np.maximum(position - 1, 0), codes)
+    out['Weekly Close'] = np.where(has_previous, weekly[previous], np.nan)
+    for window in WEEKLY_EMA_WINDOWS:
+        finished = ema(weekly, window)[previous]
+        out[f'Weekly EMA({window})'] = np.where(has_previous, finished + (close - finished) * (2 / (window + 1)), close)
+
+    # Bands over the previous 19 weekly closes plus the current close,
+    # combining the rolling mean/variance of the 19 with the new value
+    span = WEEKLY_BOLLINGER - 1
+    rolling = pd.DataFrame(weekly).rolling(span)
+    mean_prev = rolling.mean().to_numpy()[previous]
+    m2_prev = rolling.var().to_numpy()[previous] * (span - 1)
+    mean = (mean_prev * span + close) / WEEKLY_BOLLINGER
+    std = np.sqrt((m2_prev + (close - mean_prev) * (close - mean)) / (WEEKLY_BOLLINGER - 1))
+    enough = position >= span
+    out['Weekly Upper Bollinger Band(20,2)'] = np.where(enough, mean + 2 * std, np.nan)
+    out['Weekly Lower Bollinger Band(20,1)'] = np.where(enough, mean - std, np.nan)
+
+    # Calendar-day x symbol closes for the seven-calendar-day lookbacks
+    first_day = days.min()
+    calendar = np.full((days.max() - first_day + 1, n_symbols), np.nan)
+    calendar[days - first_day, codes] = close
+    calendar = pd.DataFrame(calendar)
+    at = (days - first_day, codes)
+    out['One Week Ago Close'] = calendar.ffill().shift(ONE_WEEK).to_numpy()[at]
+    window = calendar.rolling(YEAR, min_periods=1)
+    new_symbol = np.r_[True, codes[1:] != codes[:-1]]
+    full = days[new_symbol][np.cumsum(new_symbol) - 1] <= days - YEAR
+    out['One Week Ago 52-week High'] = np.where(full, window.max().shift(ONE_WEEK).to_numpy()[at], np.nan)
+    out['One Week Ago 52-week Low'] = np.where(full, window.min().shift(ONE_WEEK).to_numpy()[at], np.nan)
+    return out
+
+
+def symbol_indicators(timestamps, close):
+    """All INDICATOR_COLUMNS for one symbol's rows in date order, computed in batch."""
+    close = np.asarray(close, dtype=np.float64)
+    values = {name: np.asarray(v) for name, v in upd_indicators(pd.Series(close)).items()}
+    values.update(weekly_indicators(np.zeros(len(close), dtype=np.int64),
+                                    day_numbers(trade_dates(pd.Series(timestamps))), close))
+    return values
+
+
+def verify_state(bhavdb_df, symbols, checkpoint_path=None):
+    """
+    Check the incremental path against a full recompute: replay history
+    one day at a time (round-tripping the state through a checkpoint file
+    halfway if a path is given) and compare every row.
+
+    Returns:
+    - Largest relative difference seen across all indicators.
+    """
+    bhavdb_df = bhavdb_df[bhavdb_df['SYMBOL'].astype(str).isin(symbols)]
+    dates = trade_dates(bhavdb_df['TIMESTAMP'])
+    days = list(bhavdb_df.groupby(dates, sort=True))
+    state = new_state(symbols)
+    frames = []
+    for i, (_, day_df) in enumerate(days):
+        if checkpoint_path and i == len(days) // 2:
+            save_state(checkpoint_path, state)
+            state = load_state(checkpoint_path)
+        frames.append(update_day(state, day_df))
+    incremental = pd.concat(frames, ignore_index=True)
+
+    worst = 0.0
+    for symbol, rows in incremental.groupby('Symbol'):
+        expected = pd.DataFrame(symbol_indicators(rows['TIMESTAMP'], rows['CLOSE']))
+        got = rows[INDICATOR_COLUMNS].to_numpy(dtype=float)
+        want = expected[INDICATOR_COLUMNS].to_numpy(dtype=float)
+        if not np.array_equal(np.isnan(got), np.isnan(want)):
+            return math.inf
+        with np.errstate(invalid='ignore', divide='ignore'):
+            diff = np.abs(got - want) / np.maximum(np.abs(want), 1e-12)
+        worst = max(worst, float(np.nanmax(diff, initial=0.0)))
+    return worst
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    from bhavstore import load_bhavdb, store_path
+
+    parser = argparse.ArgumentParser(description="Check incremental UPD state against a full recompute.")
+    parser.add_argument("--bhavdb", default=store_path("D:/Bhav Folder"), help="store folder or BhavDB.csv")
+    parser.add_argument("--watchlist", default="D:/Bhav Folder/watchlist.csv")
+    args = parser.parse_args()
+
+    watchlist = pd.read_csv(args.watchlist, header=None, names=['Symbol'])['Symbol'].astype(str).unique().tolist()
+    with tempfile.TemporaryDirectory() as workdir:
+        worst = verify_state(load_bhavdb(args.bhavdb), watchlist, os.path.join(workdir, "state.json"))
+    print(f"Largest relative difference vs full recompute: {worst:.3e}")
+    if worst > 1e-9:
+        raise SystemExit("Incremental state does not match the full recompute")
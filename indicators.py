@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_pandas(data):
+    """Wrap arrays so the pandas window kernels can run on them; 2-D arrays become one column per symbol."""
+    if isinstance(data, (pd.Series, pd.DataFrame)):
+        return data, False
+    data = np.asarray(data, dtype=np.float64)
+    return (pd.DataFrame(data) if data.ndim == 2 else pd.Series(data)), True
+
+
+def _restore(result, was_array):
+    return result.to_numpy() if was_array else result
+
+
+def ema(data, window):
+    """
+    Exponential moving average with smoothing 2 / (window + 1), seeded with
+    the first value. Same recursion as watchistTest.calculate_ema, run in
+    compiled code. Works on a Series, or a date x symbol DataFrame/2-D array
+    where every column is one symbol; leading NaNs (a symbol that starts
+    trading later) are skipped and the EMA is seeded at its first close.
+    """
+    data, was_array = _as_pandas(data)
+    return _restore(data.ewm(span=window, adjust=False).mean(), was_array)
+
+
+def sma(data, window):
+    data, was_array = _as_pandas(data)
+    return _restore(data.rolling(window=window).mean(), was_array)
+
+
+def rolling_max(data, window, shift=0):
+    data, was_array = _as_pandas(data)
+    return _restore(data.rolling(window=window).max().shift(shift), was_array)
+
+
+def rolling_min(data, window, shift=0):
+    data, was_array = _as_pandas(data)
+    return _restore(data.rolling(window=window).min().shift(shift), was_array)
+
+
+def roc(data, period):
+    """Fractional rate of change over period rows, like pct_change(periods=period)."""
+    data, was_array = _as_pandas(data)
+    return _restore(data / data.shift(period) - 1, was_array)
+
+
+def bollinger(data, window=20, upper_k=2, lower_k=2):
+    """
+    Bollinger bands from a single rolling window.
+
+    Returns:
+    - (middle, upper, lower) where upper = mean + upper_k * std and
+      lower = mean - lower_k * std, std being the sample standard deviation.
+    """
+    data, was_array = _as_pandas(data)
+    rolling = data.rolling(window=window)
+    middle = rolling.mean()
+    std = rolling.std()
+    upper = middle + upper_k * std
+    lower = middle - lower_k * std
+    return _restore(middle, was_array), _restore(upper, was_array), _restore(lower, was_array)
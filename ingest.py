@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+import metrics
+from bhavstore import read_bhav, store_path, to_store_frame, write_day
+
+
+MANIFEST_FILENAME = "BhavDB.manifest.jsonl"
+
+KEY_COLUMNS = ['SYMBOL', 'TIMESTAMP']
+
+
+def manifest_path(save_folder):
+    return os.path.join(save_folder, MANIFEST_FILENAME)
+
+
+def day_checksum(df):
+    """
+    SHA-256 over the row hashes of one day's data, taken on the typed store
+    layout so the CSV and store copies of a day hash the same, and in
+    SYMBOL order so the same day in a different row order does too.
+    """
+    frame = to_store_frame(df).sort_values('SYMBOL', kind='stable', ignore_index=True)
+    hashes = pd.util.hash_pandas_object(frame, index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def _trade_date_key(value):
+    return pd.to_datetime(value, format='%d-%b-%Y').strftime('%Y-%m-%d')
+
+
+def build_manifest(save_folder):
+    """
+    Rebuild the manifest from whatever is already on disk. This is a one-off
+    full scan used the first time a folder without a manifest is ingested
+    into. Days found only in a legacy BhavDB.csv are migrated into the
+    store, which is the single copy of the data from then on.
+    """
+    manifest = {}
+    store_dir = store_path(save_folder)
+    csv_path = os.path.join(save_folder, "BhavDB.csv")
+    if os.path.isdir(store_dir):
+        df = read_bhav(store_dir)
+        for key, day_df in df.groupby(df['TIMESTAMP'].dt.strftime('%Y-%m-%d'), sort=True):
+            manifest[key] = {'rows': len(day_df), 'checksum': day_checksum(day_df)}
+    if os.path.isfile(csv_path):
+        df = pd.read_csv(csv_path)
+        df = df.drop(columns=[c for c in df.columns if str(c).startswith('Unnamed:')])
+        keys = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y').dt.strftime('%Y-%m-%d')
+        for key, day_df in df.groupby(keys, sort=True):
+            if key not in manifest:
+                day_df = day_df.drop_duplicates(subset=KEY_COLUMNS, keep='first')
+                write_day(store_dir, day_df)
+                manifest[key] = {'rows': len(day_df), 'checksum': day_checksum(day_df)}
+    return manifest
+
+
+def load_manifest(save_folder):
+    """
+    Return the manifest as {trade date 'YYYY-MM-DD': {'rows', 'checksum'}}.
+    The file is an append-only JSON-lines log; later lines win.
+    """
+    path = manifest_path(save_folder)
+    if not os.path.isfile(path):
+        manifest = build_manifest(save_folder)
+        save_manifest(save_folder, manifest)
+        return manifest
+    manifest = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                manifest[entry.pop('date')] = entry
+    return manifest
+
+
+def save_manifest(save_folder, manifest):
+    """Rewrite the whole manifest, e.g. after a rebuild or retention."""
+    path = manifest_path(save_folder)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        for key in sorted(manifest):
+            f.write(json.dumps({'date': key, **manifest[key]}) + '\n')
+    os.replace(tmp_path, path)
+
+
+def manifest_digest(manifest):
+    """
+    SHA-256 over the (date, checksum) pairs of a manifest: a content hash of
+    the whole store that doesn't depend on how the manifest file was written.
+    """
+    digest = hashlib.sha256()
+    for key in sorted(manifest):
+        digest.update(f"{key}:{manifest[key]['checksum']}\n".encode())
+    return digest.hexdigest()
+
+
+def record_day(save_folder, manifest, key, rows, checksum):
+    """Add one ingested day to the manifest with a single appended line."""
+    manifest[key] = {'rows': rows, 'checksum': checksum}
+    with open(manifest_path(save_folder), 'a') as f:
+        f.write(json.dumps({'date': key, **manifest[key]}) + '\n')
+
+
+def append_day(df, save_folder, manifest=None):
+    """
+    Append one bhavcopy day to the store exactly once. BhavDB.csv is no
+    longer appended to; `python bhavstore.py export` writes it on demand.
+
+    Parameters:
+    - df: Cleaned bhavcopy rows (series already filtered).
+    - save_folder: Folder holding the store and the manifest.
+    - manifest: Optional manifest dict to reuse across calls; loaded from
+      disk when omitted.
+
+    Returns:
+    - Number of rows appended (0 when the day was already ingested).
+    """
+    if manifest is None:
+        manifest = load_manifest(save_folder)
+
+    # (SYMBOL, TIMESTAMP) is the unique key; a day never repeats a symbol
+    with metrics.span('dedup') as span:
+        rows = len(df)
+        df = df.drop_duplicates(subset=KEY_COLUMNS, keep='first')
+        new_days = []
+        for timestamp, day_df in df.groupby('TIMESTAMP', sort=False):
+            key = _trade_date_key(timestamp)
+            checksum = day_checksum(day_df)
+            entry = manifest.get(key)
+            if entry is not None:
+                if entry['checksum'] != checksum:
+                    print(f"Data for {key} already ingested with different contents "
+                          f"({entry['rows']} rows, now {len(day_df)}). Skipping...")
+                else:
+                    print(f"Data for {key} already exists in BhavDB. Skipping...")
+                span.add(skipped_days=1)
+                continue
+            new_days.append((key, day_df, checksum))
+        span.add(rows=rows, duplicate_rows=rows - len(df))
+
+    appended = 0
+    with metrics.span('append') as span:
+        for key, day_df, checksum in new_days:
+            write_day(store_path(save_folder), day_df)
+            record_day(save_folder, manifest, key, len(day_df), checksum)
+            appended += len(day_df)
+        span.add(rows=appended, days=len(new_days))
+    return appended
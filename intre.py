@@ -1,23 +1,23 @@
 import os
 import urllib.request
-import zipfile
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import datetime
 import calendar
 
+import metrics
+from backfill import bhavcopy_url as archive_bhavcopy_url
+from bhavparse import parse_bhavcopy
+from bhavzip import cache_archive, read_bhavcopy_zip
+from ingest import append_day
+from retention import apply_retention
+
 
 def generate_bhavcopy_url(date_str):
-    date_obj = datetime.strptime(date_str, '%d/%m/%Y')
-    month_abbr = date_obj.strftime('%b').upper()[:3]  # Convert to uppercase and take the first 3 letters
-    year = date_obj.strftime('%Y')
-    day = date_obj.strftime('%d')
-    url = f"https://nsearchives.nseindia.com/content/historical/EQUITIES/{year}/{month_abbr}/cm{day}{month_abbr}{year}bhav.csv.zip"
-    return url
+    # Legacy cmDDMONYYYYbhav.csv.zip before NSE moved to UDiFF, the UDiFF file after
+    return archive_bhavcopy_url(datetime.strptime(date_str, '%d/%m/%Y').date())
 
 
-def download_bhavcopy(date_str, save_folder):
+def download_bhavcopy(date_str, save_folder, cache_dir=None):
     bhavcopy_url = generate_bhavcopy_url(date_str)
-    zip_file_path = os.path.join(save_folder, f"bhavcopy.zip")
 
     headers = {
         'accept': 'application/json, text/javascript, */*; q=0.01',
@@ -33,73 +33,53 @@ def download_bhavcopy(date_str, save_folder):
     try:
         # Download bhavcopy.zip
         print(f"Downloading Bhavcopy for {date_str} from URL: {bhavcopy_url}")
-        with urllib.request.urlopen(req) as response, open(zip_file_path, 'wb') as out_file:
-            data = response.read()  # a `bytes` object
-            out_file.write(data)
+        with metrics.span('download', date=date_str) as span:
+            with urllib.request.urlopen(req) as response:
+                data = response.read()  # a `bytes` object
+            span.add(bytes=len(data))
         print("Download complete.")
 
-        # Unzip the file
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(save_folder)
+        # Parse the archive in memory; raw zips are only kept when a cache is configured
+        if cache_dir:
+            cache_archive(data, cache_dir)
+        df = read_bhavcopy_zip(data)
         print("Bhavcopy downloaded and extracted successfully!")
+        return df
 
     except Exception as e:
-        print(f"Error downloading or extracting Bhavcopy: {str(e)}")
-
-
-def process_bhavcopy_csv(date_str, save_folder):
-    day, month, year = map(int, date_str.split('/'))
-
-    # Getting the month abbreviation in capital letters
-    month_abbr = calendar.month_abbr[month].upper()
-
-    # Generating the filename dynamically based on the input date
-    filename = f"cm{day:02d}{month_abbr}{year}bhav.csv"
-    bhav_csv_path = os.path.join(save_folder, filename)
-
-    if not os.path.isfile(bhav_csv_path):
-        print(f"Error: File '{bhav_csv_path}' not found.")
-        return
-    print(bhav_csv_path)
-
-    df = pd.read_csv(bhav_csv_path)
-
-
-    # Filter 'SERIES' column for 'EQ'
-    df = df[df['SERIES'] == 'EQ']
+        # Spans have already recorded the failure; say what kind it was
+        print(f"Error downloading or extracting Bhavcopy ({metrics.classify_failure(e)}): {str(e)}")
+        return None
 
-    # Remove unnecessary column
-    df.drop(['Unnamed: 13'], axis=1, inplace=True)
 
-    # Save processed DataFrame to CSV
-    output_csv_path = os.path.join(save_folder, "BhavDB.csv")
-    #df.to_csv(output_csv_path, index=False)
-    df.to_csv(output_csv_path, mode='a', index=False, header=False)
-    print("Processed CSV and appended to BhavDB.csv")
+def process_bhavcopy_csv(date_str, save_folder, df=None):
+    if df is None:
+        day, month, year = map(int, date_str.split('/'))
 
+        # Getting the month abbreviation in capital letters
+        month_abbr = calendar.month_abbr[month].upper()
 
-def filter_dataframe():
-    # Assuming 'TIMESTAMP' is the name of your date column
-    df = pd.read_csv('D:/Bhav Folder/BhavDB.csv')
-    df.drop_duplicates(subset=['SYMBOL', 'TIMESTAMP'], inplace=True, keep='first')
-    df.to_csv('D:/Bhav Folder/BhavDB.csv', index=False)
-    print('Success')
+        # Generating the filename dynamically based on the input date
+        filename = f"cm{day:02d}{month_abbr}{year}bhav.csv"
+        bhav_csv_path = os.path.join(save_folder, filename)
 
+        if not os.path.isfile(bhav_csv_path):
+            print(f"Error: File '{bhav_csv_path}' not found.")
+            return
+        print(bhav_csv_path)
 
-def filter_date():
-    df = pd.read_csv('D:/Bhav Folder/BhavDB.csv')
+        # Typed parse keeping only series 'EQ'; TIMESTAMP is parsed here once
+        df = parse_bhavcopy(bhav_csv_path, series='EQ')
 
-    # Define a custom function to parse dates with multiple formats
-    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y', errors='coerce')
-    current_date = datetime.now()
-    start_date = current_date - timedelta(days=365 * 2)
-    df = df[df['TIMESTAMP'] >= start_date]
+    # Append to the store once; days already in the manifest are skipped
+    if append_day(df, save_folder):
+        print("Processed CSV and appended to BhavDB")
 
-    # Convert back to the original timestamp format "%d-%b-%Y"
-    df['TIMESTAMP'] = df['TIMESTAMP'].dt.strftime('%d-%b-%Y')
 
-    df.to_csv('D:/Bhav Folder/BhavDB.csv', mode='w', index=False, header=True)
-    print('Data filtered for the last two years.')
+def filter_date(save_folder="D:/Bhav Folder"):
+    # Expire whole partitions older than two years instead of rewriting BhavDB.csv
+    cutoff, _, days = apply_retention(save_folder)
+    print(f'Data filtered for the last two years (from {cutoff}, {days} days expired).')
 
 
 if __name__ == "__main__":
@@ -109,11 +89,11 @@ if __name__ == "__main__":
     if not os.path.exists(save_folder):
         os.makedirs(save_folder)
 
-    download_bhavcopy(date_input, save_folder)
-    process_bhavcopy_csv(date_input, save_folder)
+    df = download_bhavcopy(date_input, save_folder)
+    if df is not None:
+        process_bhavcopy_csv(date_input, save_folder, df)
 
-    filter_dataframe()
-    filter_date()
+    filter_date(save_folder)
 
 
 #897184
\ No newline at end of file
@@ -1,33 +1,27 @@
 import datetime
 import os
 import urllib.request
-import zipfile
 import csv
 
+import metrics
+from backfill import bhavcopy_url as archive_bhavcopy_url
+from bhavparse import parse_bhavcopy
+from bhavzip import cache_archive, read_bhavcopy_zip
+
 
 def generate_bhavcopy_url(date_str):
-    date_obj = datetime.datetime.strptime(date_str, '%d/%m/%Y')
-    month_abbr = date_obj.strftime('%b').upper()[:3]  # Convert to uppercase and take the first 3 letters
-    year = date_obj.strftime('%Y')
-    day = date_obj.strftime('%d')
-    url = f"https://nsearchives.nseindia.com/content/historical/EQUITIES/{year}/{month_abbr}/cm{day}{month_abbr}{year}bhav.csv.zip"
-    return url
+    # Legacy cmDDMONYYYYbhav.csv.zip before NSE moved to UDiFF, the UDiFF file after
+    return archive_bhavcopy_url(datetime.datetime.strptime(date_str, '%d/%m/%Y').date())
 
 
 def filter_symbols_with_series_eq(csv_file):
-    symbols = []
-    with open(csv_file, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['SERIES'] == 'EQ':
-                symbols.append(row['SYMBOL'])
-    return symbols
+    # Only the SYMBOL column is converted; the series filter runs inside the parser
+    return parse_bhavcopy(csv_file, series='EQ', columns=['SYMBOL'])['SYMBOL'].tolist()
 
 
 
-def download_bhavcopy(date_str, save_folder):
+def download_bhavcopy(date_str, save_folder, cache_dir=None):
     bhavcopy_url = generate_bhavcopy_url(date_str)
-    zip_file_path = os.path.join(save_folder, f"bhavcopy.zip")
 
     headers = {
         'accept': 'application/json, text/javascript, */*; q=0.01',
@@ -43,24 +37,20 @@ def download_bhavcopy(date_str, save_folder):
     try:
         # Download bhavcopy.zip
         print(f"Downloading Bhavcopy for {date_str} from URL: {bhavcopy_url}")
-        with urllib.request.urlopen(req) as response, open(zip_file_path, 'wb') as out_file:
-            data = response.read()  # a `bytes` object
-            out_file.write(data)
+        with metrics.span('download', date=date_str) as span:
+            with urllib.request.urlopen(req) as response:
+                data = response.read()  # a `bytes` object
+            span.add(bytes=len(data))
         print("Download complete.")
 
-        # Unzip the file
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(save_folder)
+        # Parse the archive in memory and keep only series 'EQ'
+        if cache_dir:
+            cache_archive(data, cache_dir)
+        df = read_bhavcopy_zip(data, series='EQ')
         print("Bhavcopy downloaded and extracted successfully!")
 
-        # Construct CSV file path
         date_obj = datetime.datetime.strptime(date_str, '%d/%m/%Y')
-        csv_file_name = f"cm{date_obj.strftime('%d%b%Y').upper()}bhav.csv"
-        csv_file_path = os.path.join(save_folder, csv_file_name)
-        print("CSV File Path:", csv_file_path)
-
-        # Filter symbols with series 'EQ'
-        symbols = filter_symbols_with_series_eq(csv_file_path)
+        symbols = df['SYMBOL'].tolist()
         # print("Symbols with series 'EQ':", symbols)
         SERIES_EQ_csv_file_name = f"cm{date_obj.strftime('%d%b%Y').upper()}filterbhav.csv"
         # Append the filtered symbols into BhavDB.csv
@@ -72,7 +62,8 @@ def download_bhavcopy(date_str, save_folder):
         print("Data appended to BhavDB.csv")
 
     except Exception as e:
-        print(f"Error downloading or extracting Bhavcopy: {str(e)}")
+        # Spans have already recorded the failure; say what kind it was
+        print(f"Error downloading or extracting Bhavcopy ({metrics.classify_failure(e)}): {str(e)}")
 
 
 
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from bhavstore import read_bhav, store_path
+from ingest import manifest_path
+from price_matrix import PriceMatrix, build_price_matrix, matrix_index
+
+
+CACHE_DIRNAME = "MatrixCache"
+
+# Inside CACHE_DIRNAME: one cache-<fingerprint>-<suffix> folder per build,
+# and this file naming the current one
+POINTER_FILENAME = "CURRENT"
+
+FIELDS = ['OPEN', 'HIGH', 'LOW', 'CLOSE', 'LAST', 'PREVCLOSE', 'TOTTRDQTY']
+
+CACHE_VERSION = 1
+
+# Tries at replacing the pointer while a reader has it open (Windows)
+REPLACE_ATTEMPTS = 5
+
+
+def cache_path(save_folder):
+    return os.path.join(save_folder, CACHE_DIRNAME)
+
+
+def pointer_path(save_folder):
+    return os.path.join(cache_path(save_folder), POINTER_FILENAME)
+
+
+def current_cache_dir(save_folder):
+    """Folder of the current cache build, or None if there isn't one."""
+    try:
+        with open(pointer_path(save_folder)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(cache_path(save_folder), name) if name else None
+
+
+def store_fingerprint(save_folder):
+    """
+    Digest of the ingest manifest. Every ingested day (and every retention
+    run) rewrites or extends the manifest, so a changed fingerprint means
+    the cache no longer matches the store. None when there is no manifest.
+    """
+    path = manifest_path(save_folder)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _replace_pointer(save_folder, name):
+    path = pointer_path(save_folder)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(name)
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.replace(tmp_path, path)
+            return
+        except PermissionError:
+            # Windows refuses while another process is reading the pointer
+            if attempt == REPLACE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def _remove_old_builds(save_folder, keep):
+    """
+    Best-effort removal of cache builds not in keep, and of the files of the
+    old single-folder layout. Builds still memory-mapped elsewhere (which
+    Windows won't delete) are left for a later build to remove.
+    """
+    parent = cache_path(save_folder)
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if name in keep or name == POINTER_FILENAME or name.startswith(f"{POINTER_FILENAME}."):
+            continue
+        if os.path.isdir(path):
+            if name.startswith("cache-"):
+                shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+@metrics.timed('matrix_cache')
+def build_matrix_cache(save_folder, fields=FIELDS):
+    """
+    Read the store once and write dense date x symbol arrays, one .npy per
+    field, plus the date and symbol indexes, into a new cache-<fingerprint>
+    folder. The pointer file is swapped to it only once it is complete, so
+    readers always see a whole build: never a half-written one, and never
+    no cache at all. The previous build is kept for readers that opened it
+    before the swap; older ones are removed.
+    """
+    parent = cache_path(save_folder)
+    os.makedirs(parent, exist_ok=True)
+    fingerprint = store_fingerprint(save_folder)
+    directory = tempfile.mkdtemp(prefix=f"cache-{(fingerprint or 'nomanifest')[:16]}-", dir=parent)
+
+    df = read_bhav(store_path(save_folder), columns=['SYMBOL', 'TIMESTAMP'] + list(fields), upcast=True)
+    # Factorize SYMBOL and TIMESTAMP once; every field scatters with the same codes
+    index = matrix_index(df)
+    matrix = None
+    for field in fields:
+        matrix = build_price_matrix(df, field, index=index)
+        np.save(os.path.join(directory, f"{field}.npy"), matrix.values)
+    dates = matrix.dates if matrix is not None else pd.DatetimeIndex([])
+    symbols = list(matrix.symbols) if matrix is not None else []
+    np.save(os.path.join(directory, "dates.npy"), dates.to_numpy(dtype='datetime64[D]'))
+    with open(os.path.join(directory, "symbols.json"), 'w') as f:
+        json.dump(symbols, f)
+    with open(os.path.join(directory, "meta.json"), 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'fingerprint': fingerprint, 'fields': list(fields),
+                   'shape': [len(dates), len(symbols)]}, f)
+
+    previous = current_cache_dir(save_folder)
+    _replace_pointer(save_folder, os.path.basename(directory))
+    _remove_old_builds(save_folder, {os.path.basename(directory), os.path.basename(previous or '')})
+    return directory
+
+
+class MatrixCache:
+    """
+    Read-only view of a built cache. Field arrays are memory-mapped on first
+    use, so opening the cache costs a couple of small file reads and only
+    the rows/columns actually sliced are paged in from disk.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(directory, "dates.npy")))
+        with open(os.path.join(directory, "symbols.json")) as f:
+            self.symbols = pd.Index(json.load(f))
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._arrays = {}
+
+    def field(self, name):
+        if name not in self._arrays:
+            if name not in self.meta['fields']:
+                raise KeyError(f"field '{name}' is not in the matrix cache")
+            self._arrays[name] = np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode='r')
+        return self._arrays[name]
+
+    def matrix(self, name='CLOSE'):
+        return PriceMatrix(self.field(name), self.dates, self.symbols)
+
+    def date_rows(self, start=None, end=None):
+        """Row slice covering trade dates in [start, end]."""
+        first = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side='left')
+        last = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return slice(first, last)
+
+    def window(self, name, start=None, end=None, symbols=None):
+        """
+        Return a PriceMatrix restricted to a date range and symbol list,
+        reading only that part of the memory-mapped file.
+        """
+        rows = self.date_rows(start, end)
+        if symbols is None:
+            return PriceMatrix(self.field(name)[rows], self.dates[rows], self.symbols)
+        columns = [self.symbol_index[symbol] for symbol in symbols if symbol in self.symbol_index]
+        return PriceMatrix(np.asarray(self.field(name)[rows][:, columns]), self.dates[rows],
+                           self.symbols[columns])
+
+
+def open_matrix_cache(save_folder, rebuild=True):
+    """
+    Open the cache for save_folder, rebuilding it first if it is missing or
+    the store has changed since it was built.
+    """
+    directory = current_cache_dir(save_folder)
+    fingerprint = store_fingerprint(save_folder)
+    fresh = False
+    if directory is not None and os.path.isfile(os.path.join(directory, "meta.json")):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        # Without a manifest there is nothing to tell a stale cache from a fresh one
+        fresh = (fingerprint is not None and meta.get('version') == CACHE_VERSION
+                 and meta.get('fingerprint') == fingerprint)
+    if not fresh:
+        if not rebuild:
+            raise RuntimeError(f"matrix cache in {cache_path(save_folder)} is missing or stale")
+        print("Building matrix cache from the store...")
+        directory = build_matrix_cache(save_folder)
+    return MatrixCache(directory)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the memory-mapped price matrix cache.")
+    parser.add_argument("--save-folder", default="D:/Bhav Folder")
+    args = parser.parse_args()
+
+    cache = open_matrix_cache(args.save_folder)
+    print(f"{len(cache.dates)} dates x {len(cache.symbols)} symbols in {cache.directory}")
@@ -0,0 +1,348 @@
+import copy
+import functools
+import http.client
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import zipfile
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Set BHAV_METRICS to a file to record spans from any script without code
+# changes; a .prom file gets Prometheus text format, anything else JSON lines
+METRICS_ENV = "BHAV_METRICS"
+
+# Failure categories, from the HTTP status or exception that caused them
+FAILURE_CATEGORIES = {
+    'holiday': "404: no archive for the day (holiday or not yet published)",
+    'blocked': "401/403: request refused by the archive",
+    'rate_limited': "429: too many requests",
+    'server': "5xx: archive server error",
+    'http': "any other non-200 status",
+    'corrupt_zip': "download is not a readable zip archive",
+    'parse': "archive read but its CSV didn't parse",
+    'network': "connection, DNS or timeout error",
+    'other': "anything else",
+}
+
+# Raw records kept in memory for records(); older ones are dropped, their
+# totals live on in the per-stage summary
+MAX_RECORDS = 10000
+
+_lock = threading.Lock()
+_enabled = False
+_path = None
+_records = deque(maxlen=MAX_RECORDS)
+_stages = {}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if it can't be read."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1e6
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def classify_failure(error=None, status=None):
+    """
+    Failure category (a FAILURE_CATEGORIES key) for an HTTP status or an
+    exception raised while downloading, extracting or parsing a bhavcopy.
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        status = error.code
+    if status is not None and status != 200:
+        if status == 404:
+            return 'holiday'
+        if status in (401, 403):
+            return 'blocked'
+        if status == 429:
+            return 'rate_limited'
+        if 500 <= status < 600:
+            return 'server'
+        return 'http'
+    if isinstance(error, (zipfile.BadZipFile, zlib.error, EOFError)):
+        return 'corrupt_zip'
+    if isinstance(error, (urllib.error.URLError, http.client.HTTPException, socket.timeout, ConnectionError)):
+        return 'network'
+    if isinstance(error, (ValueError, KeyError, UnicodeDecodeError)):
+        # pyarrow's ArrowInvalid is a ValueError
+        return 'parse'
+    if isinstance(error, OSError):
+        return 'network'
+    return 'other'
+
+
+def enable(path=None):
+    """
+    Start recording spans. Per-stage totals are kept in memory (see
+    summarize()) along with the last MAX_RECORDS records and, when path is given, also written there as each span ends (JSON lines)
+    or on flush() (a .prom file, for a node_exporter textfile collector).
+    """
+    global _enabled, _path
+    with _lock:
+        _enabled = True
+        _path = path
+
+
+def disable():
+    global _enabled
+    flush()
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def records():
+    """The most recent MAX_RECORDS records, oldest first."""
+    with _lock:
+        return list(_records)
+
+
+def reset():
+    with _lock:
+        _records.clear()
+        _stages.clear()
+
+
+class Span:
+    """
+    One timed stage. Counters added with add() (rows, bytes, days, ...)
+    are summed; labels identify the run, e.g. the trade date.
+    """
+
+    __slots__ = ('stage', 'labels', 'counts', 'status', 'category', 'error', '_started', '_rss')
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.counts = {}
+        self.status = 'ok'
+        self.category = None
+        self.error = None
+        self._rss = peak_rss_mb()
+        self._started = time.perf_counter()
+
+    def add(self, **counts):
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def fail(self, category, error=None):
+        """Mark the span failed without raising, e.g. for a 404 that is handled."""
+        self.status = 'error'
+        self.category = category
+        self.error = None if error is None else str(error)
+
+    def _finish(self):
+        seconds = time.perf_counter() - self._started
+        rss = peak_rss_mb()
+        record = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'stage': self.stage,
+            'seconds': seconds,
+            **self.labels,
+            **self.counts,
+            'peak_rss_mb': rss,
+            # How far this span pushed the process high-water mark
+            'rss_growth_mb': rss - self._rss if rss is not None and self._rss is not None else None,
+            'status': self.status,
+        }
+        if self.status != 'ok':
+            record['category'] = self.category
+            record['error'] = self.error
+        _record(record)
+
+
+class _NoopSpan:
+    """Stand-in returned while metrics are disabled; every call does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add(self, **counts):
+        pass
+
+    def fail(self, category, error=None):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def _active_span(stage, labels):
+    current = Span(stage, labels)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(classify_failure(e), e)
+        raise
+    finally:
+        current._finish()
+
+
+def span(stage, **labels):
+    """
+    Context manager timing one stage:
+
+        with metrics.span('extract', date=day) as s:
+            df = read_bhavcopy_zip(data)
+            s.add(rows=len(df), bytes=len(data))
+
+    An exception leaving the block marks the span failed with its category
+    and is re-raised. While metrics are disabled this returns a shared
+    no-op span, so instrumented code costs one flag check.
+    """
+    if not _enabled:
+        return _NOOP
+    return _active_span(stage, labels)
+
+
+def timed(stage):
+    """Decorator form of span(); the function's result isn't inspected."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _active_span(stage, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _record(record):
+    with _lock:
+        _records.append(record)
+        _aggregate(_stages, record)
+        if _path is not None and not _path.endswith('.prom'):
+            with open(_path, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+
+def _aggregate(stages, record):
+    stage = stages.setdefault(record['stage'], {'runs': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                                'counts': {}, 'failures': {}, 'peak_rss_mb': None})
+    stage['runs'] += 1
+    stage['seconds'] += record['seconds']
+    stage['max_seconds'] = max(stage['max_seconds'], record['seconds'])
+    for name in ('rows', 'bytes', 'days', 'files'):
+        if name in record:
+            stage['counts'][name] = stage['counts'].get(name, 0) + record[name]
+    if record.get('status', 'ok') != 'ok':
+        category = record.get('category') or 'other'
+        stage['failures'][category] = stage['failures'].get(category, 0) + 1
+    if record.get('peak_rss_mb') is not None:
+        stage['peak_rss_mb'] = max(stage['peak_rss_mb'] or 0.0, record['peak_rss_mb'])
+
+
+def summarize(recorded=None):
+    """
+    Aggregate records per stage: runs, failures by category, total and
+    max seconds, summed counters and the highest peak RSS. Without
+    recorded, the totals of every span since enable() or reset(), kept up
+    to date as spans end.
+    """
+    if recorded is None:
+        with _lock:
+            return copy.deepcopy(_stages)
+    stages = {}
+    for record in recorded:
+        _aggregate(stages, record)
+    return stages
+
+
+def prometheus_text(recorded=None):
+    """Per-stage totals in the Prometheus text exposition format."""
+    stages = summarize(recorded)
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    metric('bhav_stage_runs_total', 'counter', "Spans recorded per stage.",
+           [({'stage': name}, stage['runs']) for name, stage in stages.items()])
+    metric('bhav_stage_seconds_total', 'counter', "Wall time spent per stage.",
+           [({'stage': name}, f"{stage['seconds']:.6f}") for name, stage in stages.items()])
+    metric('bhav_stage_seconds_max', 'gauge', "Slowest single span per stage.",
+           [({'stage': name}, f"{stage['max_seconds']:.6f}") for name, stage in stages.items()])
+    for counter in ('rows', 'bytes', 'days', 'files'):
+        samples = [({'stage': name}, stage['counts'][counter]) for name, stage in stages.items()
+                   if counter in stage['counts']]
+        if samples:
+            metric(f'bhav_stage_{counter}_total', 'counter', f"{counter.capitalize()} processed per stage.", samples)
+    metric('bhav_stage_failures_total', 'counter', "Failed spans per stage and category.",
+           [({'stage': name, 'category': category}, count)
+            for name, stage in stages.items() for category, count in stage['failures'].items()])
+    metric('bhav_stage_peak_rss_bytes', 'gauge', "Process peak RSS at the end of the stage.",
+           [({'stage': name}, round(stage['peak_rss_mb'] * 1e6)) for name, stage in stages.items()
+            if stage['peak_rss_mb'] is not None])
+    return '\n'.join(lines) + '\n'
+
+
+def flush():
+    """Write the Prometheus file, if that's the configured output."""
+    if _path is not None and _path.endswith('.prom'):
+        tmp_path = f"{_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, _path)
+
+
+def read_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if os.environ.get(METRICS_ENV):
+    import atexit
+
+    enable(os.environ[METRICS_ENV])
+    atexit.register(flush)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a JSON-lines metrics file.")
+    parser.add_argument("path", help="file written with BHAV_METRICS=<path>")
+    parser.add_argument("--prometheus", action="store_true", help="print Prometheus text format instead")
+    args = parser.parse_args()
+
+    recorded = read_records(args.path)
+    if args.prometheus:
+        print(prometheus_text(recorded), end='')
+    else:
+        print(f"{'stage':<12}{'runs':>6}{'seconds':>10}{'max s':>9}{'rows':>12}{'MB':>9}{'peak RSS MB':>13}  failures")
+        for name, stage in summarize(recorded).items():
+            failures = ', '.join(f"{category}={count}" for category, count in stage['failures'].items())
+            rss = f"{stage['peak_rss_mb']:.0f}" if stage['peak_rss_mb'] is not None else '-'
+            print(f"{name:<12}{stage['runs']:>6}{stage['seconds']:10.3f}{stage['max_seconds']:9.3f}"
+                  f"{stage['counts'].get('rows', 0):>12}{stage['counts'].get('bytes', 0) / 1e6:9.1f}"
+                  f"{rss:>13}  {failures}")
@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _attach(name):
+    """Open an existing shared memory block owned by the parent process."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching also registers the block, but pool
+        # workers share the parent's resource tracker, so the parent's
+        # unlink still clears it exactly once
+        return shared_memory.SharedMemory(name=name)
+
+
+def _run_shard(kernel, input_spec, output_specs, start, stop):
+    """Worker side: compute one contiguous column range in place."""
+    blocks = []
+    try:
+        name, shape, dtype = input_spec
+        shm = _attach(name)
+        blocks.append(shm)
+        values = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        # Copy the shard out so nothing the kernel keeps points into the block
+        block = values[:, start:stop].copy()
+        del values
+        results = kernel(block)
+        for key, (name, shape, dtype) in output_specs.items():
+            shm = _attach(name)
+            blocks.append(shm)
+            out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            out[..., start:stop] = results[key]
+            del out
+    finally:
+        for shm in blocks:
+            shm.close()
+    return start, stop
+
+
+def shard_bounds(n_columns, workers):
+    """Contiguous, deterministic column ranges, one per worker."""
+    edges = np.linspace(0, n_columns, min(workers, max(n_columns, 1)) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def map_columns(kernel, values, outputs, workers=1):
+    """
+    Apply kernel to column shards of a date x symbol matrix on a process pool.
+
+    The input and output arrays live in shared memory; workers only receive
+    block names and a column range, so no DataFrame or array is pickled.
+    Every column is computed independently, so the result is identical for
+    any worker count.
+
+    Parameters:
+    - kernel: Module-level function taking a 2-D column block and returning
+      a dict of arrays keyed like outputs.
+    - values: 2-D float array (rows x symbols).
+    - outputs: Dict of output name -> 'matrix' (shaped like values) or
+      'vector' (one value per column).
+    - workers: Process count; 1 runs the kernel in this process.
+
+    Returns:
+    - Dict of output name -> NumPy array.
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    if workers is None or workers <= 1 or values.shape[1] < 2:
+        return {key: np.asarray(result) for key, result in kernel(values).items()}
+
+    blocks = []
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        blocks.append(shm)
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+        input_spec = (shm.name, values.shape, values.dtype.str)
+
+        output_specs = {}
+        for key, kind in outputs.items():
+            shape = values.shape if kind == 'matrix' else values.shape[1:]
+            shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+            blocks.append(shm)
+            output_specs[key] = (shm.name, shape, np.dtype(np.float64).str)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_run_shard, kernel, input_spec, output_specs, start, stop)
+                       for start, stop in shard_bounds(values.shape[1], workers)]
+            for future in futures:
+                future.result()
+
+        results = {}
+        for key, (name, shape, dtype) in output_specs.items():
+            shm = next(block for block in blocks if block.name == name)
+            results[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+        return results
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+# Arrays attached by a map_shared worker, keyed like the arrays argument
+_worker_arrays = {}
+
+
+def _init_shared(specs):
+    """Pool initializer: attach every shared array once per worker process."""
+    for key, (name, shape, dtype) in specs.items():
+        shm = _attach(name)
+        _worker_arrays[key] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _run_task(func, task):
+    return func({key: array for key, (_, array) in _worker_arrays.items()}, task)
+
+
+def map_shared(func, arrays, tasks, workers=1):
+    """
+    Run func(arrays, task) for every task on a process pool.
+
+    The arrays are copied into shared memory once and attached read-only by
+    every worker, so only the small task objects and results are pickled.
+    Use it when the same large inputs are evaluated under many parameter
+    sets; map_columns is for splitting one computation by symbol.
+
+    Parameters:
+    - func: Module-level function taking (dict of arrays, task).
+    - arrays: Dict of name -> NumPy array shared by all tasks.
+    - tasks: List of picklable task descriptions (e.g. parameter dicts).
+    - workers: Process count; 1 runs every task in this process.
+
+    Returns:
+    - List of func results in task order.
+    """
+    tasks = list(tasks)
+    if workers is None or workers <= 1 or len(tasks) < 2:
+        return [func(arrays, task) for task in tasks]
+
+    blocks = []
+    try:
+        specs = {}
+        for key, values in arrays.items():
+            values = np.ascontiguousarray(values)
+            shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+            specs[key] = (shm.name, values.shape, values.dtype.str)
+
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shared, initargs=(specs,)) as executor:
+            return list(executor.map(partial(_run_task, func), tasks, chunksize=chunksize))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
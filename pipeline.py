@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import metrics
+from bars import load_bars
+from backfill import (NSE_ARCHIVE_URL, NSE_HOLIDAYS, backfill, known_holidays, print_report, record_missed_days,
+                      trading_days)
+from bhavstore import read_bhav, store_path
+from bhavzip import read_bhavcopy_zip
+from compact import compact_state
+from indicator_state import save_state
+from ingest import append_day, load_manifest, manifest_digest
+from price_matrix import build_price_matrix
+from retention import apply_retention, retention_cutoff
+from rs_engine import matrix_relative_strength
+from screener import load_snapshot
+from watchistTest import build_UPD_frame, load_compact, update_UPD_csv
+
+
+STATE_FILENAME = "pipeline.state.json"
+
+# Bump when a stage's output format changes, so every stage reruns once
+PIPELINE_VERSION = 1
+
+# One step of the daily run:
+# - deps: stages it reads from (run order follows STAGES)
+# - inputs: context -> JSON-able description of what the output depends on
+#   besides the deps; None means the stage always runs
+# - run: context -> result (a summary dict, or the data for in-memory stages)
+# - outputs: context -> files the stage writes ([] for stages that only write
+#   to the store, which later stages see through the store's content hash),
+#   or None when its result only lives in memory and it runs when a
+#   dependent needs it
+Stage = namedtuple('Stage', ['name', 'deps', 'inputs', 'run', 'outputs'])
+
+
+class Context:
+    """
+    State shared by the stages of one run: the options, the manifest, and
+    the store loaded into memory once for every stage that reads it.
+    """
+
+    def __init__(self, save_folder, start, end, watchlist_path, base_url=NSE_ARCHIVE_URL, holidays=NSE_HOLIDAYS,
+                 download_workers=8, workers=1):
+        self.save_folder = save_folder
+        self.start = start
+        self.end = end
+        self.watchlist_path = watchlist_path
+        self.base_url = base_url
+        self.holidays = holidays
+        self.download_workers = download_workers
+        self.workers = workers
+        self.manifest = load_manifest(save_folder)
+        # Last successful run of each stage and the stages forced this run (set by run_pipeline)
+        self.state = {}
+        self.force = ()
+        self.keys = {}
+        self.results = {}
+        self._bhav = None
+
+    def data_digest(self):
+        """Content hash of everything in the store."""
+        return manifest_digest(self.manifest)
+
+    def bhav(self):
+        """The whole store as one frame, read on first use."""
+        if self._bhav is None:
+            self._bhav = read_bhav(store_path(self.save_folder), upcast=True)
+        return self._bhav
+
+    def data_changed(self):
+        self._bhav = None
+
+    def watchlist(self):
+        return pd.read_csv(self.watchlist_path, header=None, names=['Symbol'])['Symbol'].astype(str).unique()
+
+    def require(self, name):
+        """Result of an in-memory stage, running it on first use."""
+        if name not in self.results:
+            print(f"[{name}] running (needed by a later stage)")
+            with metrics.span('pipeline', step=name):
+                self.results[name] = STAGE_BY_NAME[name].run(self)
+        return self.results[name]
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def stage_key(stage, context):
+    """Hash of a stage's inputs: its own inputs() plus the keys of its deps."""
+    inputs = stage.inputs(context)
+    if inputs is None:
+        return None
+    payload = {'version': PIPELINE_VERSION, 'stage': stage.name, 'inputs': inputs,
+               'deps': [context.keys.get(dep) for dep in stage.deps]}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def missing_days(context):
+    """Trading days in [start, end] that aren't in the manifest yet."""
+    return [day for day in trading_days(context.start, context.end, context.holidays)
+            if day.strftime('%Y-%m-%d') not in context.manifest]
+
+
+def run_ingest(context):
+    days = missing_days(context)
+    if not days:
+        print("[ingest] no missing days")
+        return {'days': 0, 'rows': 0}
+
+    # Download the whole range concurrently, then append it in one batch
+    print(f"[ingest] fetching {len(days)} day(s) from {days[0]} to {days[-1]}")
+    frames = []
+
+    def handler(day, data):
+        try:
+            frames.append(read_bhavcopy_zip(data))
+        except Exception as e:
+            print(f"Error extracting Bhavcopy for {day:%d/%m/%Y} ({metrics.classify_failure(e)}): {str(e)}")
+
+    stats = backfill(days, handler, workers=context.download_workers, base_url=context.base_url)
+    print_report(stats)
+    missed = record_missed_days(context.save_folder, stats)
+    if missed:
+        context.holidays = context.holidays | frozenset(missed)
+    rows = append_day(pd.concat(frames, ignore_index=True), context.save_folder, context.manifest) if frames else 0
+    if rows:
+        context.data_changed()
+    return {'days': len(frames), 'rows': rows, 'failed': len(days) - len(frames)}
+
+
+def run_retention(context):
+    cutoff, files, expired = apply_retention(context.save_folder, context.end)
+    if expired:
+        context.manifest = load_manifest(context.save_folder)
+        context.data_changed()
+    print(f"[retention] kept data from {cutoff}, expired {expired} days ({files} files)")
+    return {'days': expired, 'files': files}
+
+
+def run_indicators(context):
+    watchlist = context.watchlist()
+    bhav = context.bhav()
+    with metrics.span('indicators', mode='full') as span:
+        upd_df = build_UPD_frame(bhav[bhav['SYMBOL'].isin(watchlist)], watchlist, context.workers,
+                                 load_bars(context.save_folder, 'W'))
+        span.add(rows=len(upd_df))
+    return upd_df
+
+
+def upd_path(context):
+    return os.path.join(context.save_folder, "UPD.csv")
+
+
+def appended_only(context, previous):
+    """
+    True when the store still holds every day the previous UPD run was built
+    from, unchanged, for the same watchlist: only newer days were added, so
+    the incremental indicator state can extend UPD.csv instead of a rebuild.
+    """
+    last = previous.get('last_date')
+    if last is None or previous.get('watchlist') != file_digest(context.watchlist_path):
+        return False
+    seen = {key: entry for key, entry in context.manifest.items() if key <= last}
+    return manifest_digest(seen) == previous.get('history')
+
+
+def run_upd(context):
+    path = upd_path(context)
+    indicator_state = os.path.join(context.save_folder, "UPD.state.json")
+    previous = context.state.get('upd', {}).get('result', {})
+    if 'upd' not in context.force and os.path.isfile(path) and appended_only(context, previous):
+        # Append the new days through watchistTest's checkpointed state
+        update_UPD_csv(context.watchlist_path, store_path(context.save_folder), path, indicator_state,
+                       context.workers)
+        result = {'mode': 'incremental'}
+    else:
+        upd_df = context.require('indicators').sort_values(by='R.S.', ascending=False, kind='stable')
+        upd_df.to_csv(path, index=False, date_format='%d-%b-%Y')
+        # Checkpoint the state the next run's incremental update starts from
+        watchlist = context.watchlist().tolist()
+        save_state(indicator_state, compact_state(load_compact(store_path(context.save_folder), watchlist), watchlist))
+        print(f"[upd] wrote {len(upd_df)} rows to {path}")
+        result = {'mode': 'full', 'rows': len(upd_df)}
+    # Refresh the screener's snapshot while the file is hot
+    load_snapshot(path)
+    return {**result, 'last_date': max(context.manifest, default=None),
+            'history': manifest_digest(context.manifest), 'watchlist': file_digest(context.watchlist_path)}
+
+
+def rs_path(context):
+    return os.path.join(context.save_folder, "RS.csv")
+
+
+def run_rs(context):
+    table = matrix_relative_strength(build_price_matrix(context.bhav(), 'CLOSE'), context.workers)
+    table.to_csv(rs_path(context))
+    print(f"[rs] ranked {len(table)} symbols into {rs_path(context)}")
+    return {'rows': len(table)}
+
+
+STAGES = [
+    Stage('ingest', [], lambda context: None, run_ingest, lambda context: []),
+    Stage('retention', ['ingest'], lambda context: {'cutoff': retention_cutoff(context.end)}, run_retention,
+          lambda context: []),
+    Stage('indicators', ['retention'], lambda context: {'watchlist': file_digest(context.watchlist_path)},
+          run_indicators, lambda context: None),
+    Stage('upd', ['indicators'], lambda context: {}, run_upd, lambda context: [upd_path(context)]),
+    Stage('rs', ['retention'], lambda context: {}, run_rs, lambda context: [rs_path(context)]),
+]
+
+STAGE_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+def state_path(save_folder):
+    return os.path.join(save_folder, STATE_FILENAME)
+
+
+def load_pipeline_state(save_folder):
+    path = state_path(save_folder)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_pipeline_state(save_folder, state):
+    path = state_path(save_folder)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def run_pipeline(context, force=()):
+    """
+    Run every stage in order. A stage is skipped when the hash of its
+    inputs matches the last successful run and its output files exist;
+    stages whose result only lives in memory run when a dependent does.
+
+    Parameters:
+    - context: Context for the run.
+    - force: Names of stages to run regardless of their inputs.
+
+    Returns:
+    - {stage name: 'ran', 'skipped' or 'not needed'}
+    """
+    state = load_pipeline_state(context.save_folder)
+    context.state, context.force = state, force
+    outcome = {}
+    for stage in STAGES:
+        key = stage_key(stage, context)
+        context.keys[stage.name] = key
+        outputs = stage.outputs(context)
+        if outputs is None and stage.name not in force:
+            # Runs through context.require() if a later stage needs it
+            outcome[stage.name] = 'not needed'
+            continue
+        previous = state.get(stage.name, {})
+        if (key is not None and stage.name not in force and previous.get('key') == key
+                and all(os.path.exists(path) for path in outputs)):
+            print(f"[{stage.name}] inputs unchanged, skipped")
+            outcome[stage.name] = 'skipped'
+        else:
+            with metrics.span('pipeline', step=stage.name):
+                result = stage.run(context)
+            context.results[stage.name] = result
+            outcome[stage.name] = 'ran'
+            if outputs is not None:
+                state[stage.name] = {'key': key, 'finished': datetime.now().isoformat(timespec='seconds'),
+                                     'result': result}
+                save_pipeline_state(context.save_folder, state)
+        if outputs == []:
+            # Later stages depend on what is in the store, not on how it got there
+            context.keys[stage.name] = context.data_digest()
+
+    for name in context.results:
+        if outcome.get(name) == 'not needed':
+            outcome[name] = 'ran'
+    return outcome
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Daily update: ingest missing days, apply retention, then rebuild indicators, UPD.csv and "
+                    "RS.csv when their inputs changed.")
+    parser.add_argument("--save-folder", default="D:/Bhav Folder")
+    parser.add_argument("--watchlist", help="watchlist CSV (default: watchlist.csv in the save folder)")
+    parser.add_argument("--date", help="DD/MM/YYYY: process just this day")
+    parser.add_argument("--start", type=date.fromisoformat,
+                        help="YYYY-MM-DD: first day to catch up from (default: the day after the last ingested "
+                             "day, or the retention cutoff for an empty store)")
+    parser.add_argument("--end", type=date.fromisoformat, help="YYYY-MM-DD: last day (default: today)")
+    parser.add_argument("--base-url", default=NSE_ARCHIVE_URL, help="archive host, e.g. a local mirror")
+    parser.add_argument("--holidays", help="file with extra holiday dates, one per line")
+    parser.add_argument("--download-workers", type=int, default=8, help="concurrent downloads")
+    parser.add_argument("--workers", type=int, default=1, help="processes for indicators and RS")
+    parser.add_argument("--force", nargs="+", default=[], choices=[stage.name for stage in STAGES],
+                        help="stages to run even if their inputs are unchanged")
+    parser.add_argument("--metrics", help="record stage metrics to this file (.prom for Prometheus text format)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(args.metrics)
+    os.makedirs(args.save_folder, exist_ok=True)
+
+    if args.date:
+        start = end = datetime.strptime(args.date, '%d/%m/%Y').date()
+    else:
+        end = args.end or date.today()
+        start = args.start
+    context = Context(args.save_folder, start, end,
+                      args.watchlist or os.path.join(args.save_folder, "watchlist.csv"), args.base_url,
+                      known_holidays(args.save_folder, args.holidays),
+                      args.download_workers, args.workers)
+    if context.start is None:
+        last = max(context.manifest, default=None)
+        context.start = date.fromisoformat(last) + timedelta(days=1) if last else retention_cutoff(end)
+
+    outcome = run_pipeline(context, args.force)
+    print(", ".join(f"{name}: {status}" for name, status in outcome.items()))
+    metrics.flush()
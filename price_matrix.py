@@ -0,0 +1,87 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+# Dense date x symbol array: values[i, j] is the field for dates[i] and
+# symbols[j], NaN where the symbol did not trade that day.
+PriceMatrix = namedtuple('PriceMatrix', ['values', 'dates', 'symbols'])
+
+
+def trade_dates(timestamps):
+    """Return TIMESTAMP values as datetime64, parsing the '05-JAN-2024' format if needed."""
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        return timestamps
+    return pd.to_datetime(timestamps, format='%d-%b-%Y')
+
+
+def matrix_index(df):
+    """
+    (date_codes, dates, symbol_codes, symbols) of long BhavDB rows: the
+    factorized TIMESTAMP and SYMBOL columns every field's matrix shares.
+    """
+    date_codes, dates = pd.factorize(trade_dates(df['TIMESTAMP']), sort=True)
+    symbol_codes, symbols = pd.factorize(df['SYMBOL'].astype(str), sort=True)
+    return date_codes, dates, symbol_codes, symbols
+
+
+def build_price_matrix(df, field='CLOSE', dtype=np.float64, index=None):
+    """
+    Pivot long BhavDB rows into a dense date x symbol matrix in one pass.
+
+    Parameters:
+    - df: DataFrame with SYMBOL, TIMESTAMP and the requested field.
+    - field: Column to place in the matrix.
+    - index: Optional matrix_index(df), so several fields of the same rows
+      are scattered without factorizing SYMBOL and TIMESTAMP again.
+
+    Returns:
+    - PriceMatrix with dates sorted ascending and symbols sorted by name.
+      If a (date, symbol) pair repeats, the last row wins.
+    """
+    date_codes, dates, symbol_codes, symbols = matrix_index(df) if index is None else index
+    values = np.full((len(dates), len(symbols)), np.nan, dtype=dtype)
+    values[date_codes, symbol_codes] = df[field].to_numpy(dtype=dtype)
+    return PriceMatrix(values, pd.DatetimeIndex(dates), pd.Index(symbols))
+
+
+def compact_columns(values):
+    """
+    Left-align each column's non-NaN values.
+
+    Returns:
+    - (compact, counts) where compact[k, j] is the k-th observation of
+      column j and counts[j] is how many observations the column has. Rows
+      past counts[j] are NaN. This gives every symbol its own trading-day
+      history, matching a per-symbol loop over its rows.
+    """
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=0)
+    positions = np.cumsum(valid, axis=0) - 1
+    rows, cols = np.nonzero(valid)
+    compact = np.full(values.shape, np.nan, dtype=values.dtype)
+    compact[positions[rows, cols], cols] = values[rows, cols]
+    return compact, counts
+
+
+def nth_from_last(compact, counts, n):
+    """Value n observations before each column's last one (NaN if too short)."""
+    index = counts - 1 - n
+    result = np.full(compact.shape[1], np.nan, dtype=compact.dtype)
+    ok = index >= 0
+    result[ok] = compact[index[ok], np.nonzero(ok)[0]]
+    return result
+
+
+def segment_positions(codes):
+    """
+    For codes sorted so equal values are contiguous, return each element's
+    position within its run (0, 1, 2, ... restarting at every new code).
+    """
+    codes = np.asarray(codes)
+    if len(codes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    lengths = np.diff(np.r_[starts, len(codes)])
+    return np.arange(len(codes)) - np.repeat(starts, lengths)
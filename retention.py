@@ -0,0 +1,70 @@
+import os
+from datetime import date, timedelta
+
+import metrics
+from bhavstore import compact_store, drop_before, store_path
+from ingest import load_manifest, save_manifest
+
+
+# History kept in the store: two years back from today, the rule
+# intre.filter_date has always applied
+RETENTION_DAYS = 365 * 2
+
+
+def retention_cutoff(today=None):
+    """First trade date kept in the store."""
+    today = date.today() if today is None else today
+    return today - timedelta(days=RETENTION_DAYS)
+
+
+def apply_retention(save_folder, today=None, compact=True):
+    """
+    Expire data older than retention_cutoff() by deleting whole partition
+    files and the matching manifest entries. No retained data is read or
+    rewritten, so a daily run costs a directory listing and a few unlinks
+    however long the history is.
+
+    Parameters:
+    - save_folder: Folder holding the store and the manifest.
+    - today: Date to apply the rule for (defaults to today).
+    - compact: Also merge finished months inside the window into month files.
+
+    Returns:
+    - (cutoff, number of partition files removed, number of days expired)
+    """
+    today = date.today() if today is None else today
+    cutoff = retention_cutoff(today)
+    store_dir = store_path(save_folder)
+    if not os.path.isdir(store_dir):
+        return cutoff, 0, 0
+
+    with metrics.span('retention') as span:
+        removed = drop_before(store_dir, cutoff)
+
+        manifest = load_manifest(save_folder)
+        expired = [key for key in manifest if key < cutoff.isoformat()]
+        if expired:
+            for key in expired:
+                del manifest[key]
+            save_manifest(save_folder, manifest)
+        span.add(files=len(removed), days=len(expired))
+
+    if compact:
+        # The month the cutoff falls in stays as day files so tomorrow's
+        # run can again drop a single file
+        with metrics.span('compact'):
+            compact_store(store_dir, before=today.replace(day=1), after=cutoff)
+    return cutoff, len(removed), len(expired)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Drop store partitions older than the retention window.")
+    parser.add_argument("--save-folder", default="D:/Bhav Folder")
+    parser.add_argument("--today", type=date.fromisoformat, default=None, help="YYYY-MM-DD (defaults to today)")
+    parser.add_argument("--no-compact", action="store_true", help="skip monthly compaction")
+    args = parser.parse_args()
+
+    cutoff, files, days = apply_retention(args.save_folder, args.today, compact=not args.no_compact)
+    print(f"Kept data from {cutoff}: removed {files} partition files, expired {days} days.")
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+import metrics
+from parallel import map_columns
+from price_matrix import build_price_matrix, compact_columns, nth_from_last
+
+
+# Rate-of-change lookbacks (trading days) and their weights in the RS score
+RS_PERIODS = (63, 126, 189, 252)
+RS_WEIGHTS = (2, 1, 1, 1)
+
+
+def rs_scores(closes):
+    """
+    Weighted ROCR score for every column of a date x symbol close matrix.
+
+    Each ROCR(n) is last close / close n trading days earlier, counted over
+    the symbol's own observations like talib.ROCR on its close list, so
+    symbols with missing days score the same as in the per-symbol loop.
+
+    Returns:
+    - Array with one RS value per column (NaN when history is too short).
+    """
+    compact, counts = compact_columns(closes)
+    last = nth_from_last(compact, counts, 0)
+    score = np.zeros(closes.shape[1])
+    for period, weight in zip(RS_PERIODS, RS_WEIGHTS):
+        score += weight * (last / nth_from_last(compact, counts, period))
+    return score / sum(RS_WEIGHTS)
+
+
+def rank_rs(scores, symbols):
+    """
+    Return a table of RS, RANK (1 = strongest) and PERCENTILE (0-100)
+    sorted by RS descending. Symbols without enough history come last.
+    """
+    table = pd.DataFrame({'RS': scores}, index=pd.Index(symbols, name='SYMBOL'))
+    table['RANK'] = table['RS'].rank(ascending=False, method='min')
+    table['PERCENTILE'] = table['RS'].rank(pct=True) * 100
+    return table.sort_values('RS', ascending=False, kind='stable')
+
+
+def rs_kernel(closes):
+    return {'RS': rs_scores(closes)}
+
+
+def relative_strength(bhavdb_df, workers=1):
+    """
+    RS table for every symbol in a long BhavDB frame. With workers > 1 the
+    symbols are sharded across a process pool; results are identical.
+    """
+    return matrix_relative_strength(build_price_matrix(bhavdb_df, 'CLOSE'), workers)
+
+
+def matrix_relative_strength(matrix, workers=1):
+    """RS table from an already built close PriceMatrix (e.g. from matrix_cache)."""
+    with metrics.span('rs') as span:
+        scores = map_columns(rs_kernel, matrix.values, {'RS': 'vector'}, workers)['RS']
+        span.add(rows=len(matrix.symbols))
+        return rank_rs(scores, matrix.symbols)
@@ -0,0 +1,188 @@
+import ast
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Short names screens can use for UPD.csv columns
+ALIASES = {
+    'rs': 'R.S.',
+    'high': 'HIGH',
+    'low': 'LOW',
+    'close': 'CLOSE',
+    'last': 'LAST',
+    'weekly_close': 'Weekly Close',
+    'close_1w_ago': 'One Week Ago Close',
+    'wema10': 'Weekly EMA(10)',
+    'wema40': 'Weekly EMA(40)',
+    'sma50': 'Daily SMA(50)',
+    'sma200': 'Daily SMA(200)',
+    'sma250': 'Daily SMA(250)',
+    'ema10': 'Daily EMA(10)',
+    'ema30': 'Daily EMA(30)',
+    'high52w': 'One Week Ago 52-week High',
+    'low52w': 'One Week Ago 52-week Low',
+    'high100d': 'One Day Ago 100-day High',
+    'low100d': 'One Day Ago 100-day Low',
+    'bb_upper': 'Weekly Upper Bollinger Band(20,2)',
+    'bb_lower': 'Weekly Lower Bollinger Band(20,1)',
+}
+
+# Ready-made screens; any expression over the aliases (and rs_pct, the
+# cross-sectional R.S. percentile, 0-100) works the same way
+SCREENS = {
+    'rs_top_decile': "rs_pct >= 90",
+    'above_sma200': "close > sma200",
+    'near_52w_high': "close >= 0.75 * high52w",
+    'leaders': "close > sma200 and close >= 0.75 * high52w and rs_pct >= 90",
+    'trend_template': "close > sma50 and sma50 > sma200 and sma200 > sma250 "
+                      "and close >= 1.3 * low52w and close >= 0.75 * high52w and rs_pct >= 70",
+    'ema_stack': "ema10 > ema30 and close > ema10",
+    'breakout_100d': "close > high100d",
+    'above_upper_band': "close > bb_upper",
+    'below_lower_band': "close < bb_lower",
+}
+
+SNAPSHOT_SUFFIX = ".snapshot.parquet"
+
+# The only syntax a screen expression may use: comparisons, and/or/not and
+# basic arithmetic over snapshot columns and numbers. Anything else
+# (attribute access, calls, subscripts, ...) could reach arbitrary Python
+# through pandas.eval and is rejected.
+ALLOWED_NODES = (ast.Expression, ast.Name, ast.Load, ast.Constant, ast.Compare, ast.BoolOp, ast.BinOp,
+                 ast.UnaryOp, ast.And, ast.Or, ast.Not, ast.USub, ast.UAdd, ast.Invert, ast.Add, ast.Sub,
+                 ast.Mult, ast.Div, ast.BitAnd, ast.BitOr, ast.Gt, ast.GtE, ast.Lt, ast.LtE, ast.Eq, ast.NotEq)
+
+# In-process cache: UPD.csv path -> (source fingerprint, snapshot)
+_snapshots = {}
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def latest_snapshot(upd_df):
+    """
+    Reduce UPD rows to the latest trade date's cross-section, one row per
+    symbol, with alias column names and the rs_pct percentile added.
+    """
+    # Parse each distinct date string once instead of every row
+    stamps = upd_df['TIMESTAMP'].unique()
+    dates = pd.to_datetime(stamps, format='%d-%b-%Y')
+    latest_date = dates.max() if len(dates) else None
+    latest = upd_df[upd_df['TIMESTAMP'] == stamps[dates.argmax()]] if len(dates) else upd_df
+    latest = latest.drop_duplicates(subset='Symbol', keep='last')
+    snapshot = pd.DataFrame({alias: latest[column].to_numpy(dtype=float) for alias, column in ALIASES.items()},
+                            index=pd.Index(latest['Symbol'].astype(str).to_numpy(), name='Symbol'))
+    snapshot['rs_pct'] = snapshot['rs'].rank(pct=True) * 100
+    snapshot.attrs['date'] = latest_date.strftime('%Y-%m-%d') if latest_date is not None else None
+    return snapshot
+
+
+def load_snapshot(upd_path):
+    """
+    Latest-day snapshot of UPD.csv. It is kept in memory and in a small
+    Parquet file next to UPD.csv, both keyed by UPD.csv's size and mtime,
+    so the full file is only parsed again after it changes.
+    """
+    fingerprint = _fingerprint(upd_path)
+    cached = _snapshots.get(upd_path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    cache_path = os.path.splitext(upd_path)[0] + SNAPSHOT_SUFFIX
+    snapshot = None
+    if os.path.isfile(cache_path):
+        table = pq.read_table(cache_path)
+        metadata = table.schema.metadata or {}
+        if metadata.get(b'source') == fingerprint.encode():
+            snapshot = table.to_pandas()
+            snapshot.attrs['date'] = metadata.get(b'date', b'').decode() or None
+    if snapshot is None:
+        snapshot = latest_snapshot(pd.read_csv(upd_path, usecols=['Symbol', 'TIMESTAMP', *ALIASES.values()]))
+        table = pa.Table.from_pandas(snapshot)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'source': fingerprint.encode(),
+                                               b'date': (snapshot.attrs['date'] or '').encode()})
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    _snapshots[upd_path] = (fingerprint, snapshot)
+    return snapshot
+
+
+def snapshot_arrays(snapshot):
+    """Column name -> NumPy array, the namespace screen expressions are evaluated in."""
+    return {column: snapshot[column].to_numpy() for column in snapshot.columns}
+
+
+def check_expression(expression, names):
+    """
+    Raise ValueError unless expression only uses ALLOWED_NODES, numeric
+    constants and the given column names.
+    """
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"invalid screen expression: {e.msg}") from None
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError(f"'{type(node).__name__}' is not allowed in a screen expression")
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise ValueError(f"unknown column '{node.id}'")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError(f"only numeric constants are allowed, not {node.value!r}")
+
+
+def screen(snapshot, expression, arrays=None):
+    """
+    Evaluate a filter expression over the snapshot as one vectorized
+    boolean mask (pandas.eval, which uses numexpr when it is installed).
+
+    Parameters:
+    - snapshot: Frame from load_snapshot()/latest_snapshot().
+    - expression: A SCREENS name or an expression such as
+      "close > sma200 and rs_pct >= 90"; expressions are checked with
+      check_expression() first.
+    - arrays: Optional snapshot_arrays(snapshot), reused across screens.
+
+    Returns:
+    - Matching rows, strongest R.S. first.
+    """
+    expression = SCREENS.get(expression, expression)
+    arrays = snapshot_arrays(snapshot) if arrays is None else arrays
+    check_expression(expression, arrays)
+    mask = np.asarray(pd.eval(expression, resolvers=(arrays,)), dtype=bool)
+    return snapshot[mask].sort_values('rs', ascending=False, kind='stable')
+
+
+def run_screens(snapshot, screens=None):
+    """Run several screens; returns {name: list of symbols}."""
+    screens = SCREENS if screens is None else screens
+    arrays = snapshot_arrays(snapshot)
+    return {name: screen(snapshot, expression, arrays).index.tolist() for name, expression in screens.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Screen the latest day of UPD.csv.")
+    parser.add_argument("screens", nargs="*", help="screen names or expressions (default: all named screens)")
+    parser.add_argument("--upd", default="D:/Bhav Folder/UPD.csv")
+    parser.add_argument("--list", action="store_true", help="list named screens and column aliases")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, expression in SCREENS.items():
+            print(f"{name}: {expression}")
+        print("Columns:", ", ".join(list(ALIASES) + ['rs_pct']))
+    else:
+        snapshot = load_snapshot(args.upd)
+        screens = {name: name for name in args.screens} if args.screens else SCREENS
+        print(f"Screening {len(snapshot)} symbols for {snapshot.attrs['date']}")
+        for name, symbols in run_screens(snapshot, screens).items():
+            print(f"{name} ({len(symbols)}): {', '.join(symbols)}")
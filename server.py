@@ -0,0 +1,304 @@
+import asyncio
+import functools
+import json
+import math
+import os
+import traceback
+import urllib.parse
+from datetime import datetime
+
+import numpy as np
+
+from matrix_cache import open_matrix_cache, store_fingerprint
+from price_matrix import PriceMatrix
+from rs_engine import matrix_relative_strength
+from screener import ALIASES, SCREENS, load_snapshot, screen, snapshot_arrays
+
+
+# Matrix cache fields served by /history
+HISTORY_FIELDS = ['OPEN', 'HIGH', 'LOW', 'CLOSE', 'TOTTRDQTY']
+
+# Derived responses kept per snapshot
+CACHE_SIZE = 4096
+
+# Seconds between checks for a newly ingested day or a rewritten UPD.csv
+POLL_SECONDS = 5
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def snapshot_version(save_folder, upd_path):
+    """Changes whenever a day is ingested or expired, or UPD.csv is rewritten."""
+    upd = ''
+    if os.path.isfile(upd_path):
+        stat = os.stat(upd_path)
+        upd = f"{stat.st_size}:{stat.st_mtime_ns}"
+    return f"{store_fingerprint(save_folder)}/{upd}"
+
+
+def _value(value):
+    """JSON-safe scalar: NaN becomes null, NumPy numbers become Python ones."""
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def _json(status, payload):
+    return status, json.dumps(payload, separators=(',', ':')).encode()
+
+
+class Snapshot:
+    """
+    Everything the server answers from, loaded once: the history fields of
+    the matrix cache copied into memory (so the cache can be rebuilt under a
+    running server), the RS table and the latest-day UPD snapshot.
+    Snapshots are never modified; a reload builds a new one.
+
+    Only the named SCREENS are served unless adhoc_screens is set; ad-hoc
+    expressions then still have to pass screener.check_expression().
+    """
+
+    def __init__(self, save_folder, upd_path, cache_size=CACHE_SIZE, adhoc_screens=False):
+        self.adhoc_screens = adhoc_screens
+        self.version = snapshot_version(save_folder, upd_path)
+        cache = open_matrix_cache(save_folder)
+        self.dates = cache.dates.strftime('%Y-%m-%d').to_numpy(dtype=str)
+        self.symbols = cache.symbols
+        self.symbol_index = cache.symbol_index
+        self.history = {field: np.array(cache.field(field)) for field in HISTORY_FIELDS}
+
+        rs = matrix_relative_strength(PriceMatrix(self.history['CLOSE'], cache.dates, self.symbols))
+        self.rs = rs
+        self.rs_rows = {symbol: {'symbol': symbol, 'rs': _value(row[0]), 'rank': _value(row[1]),
+                                 'percentile': _value(row[2])}
+                        for symbol, row in zip(rs.index, rs[['RS', 'RANK', 'PERCENTILE']].to_numpy())}
+
+        self.upd = load_snapshot(upd_path) if os.path.isfile(upd_path) else None
+        self.upd_arrays = snapshot_arrays(self.upd) if self.upd is not None else None
+        self.loaded = datetime.now().isoformat(timespec='seconds')
+        # Per-snapshot LRU: a reload starts with an empty cache, never a stale one
+        self.query = functools.lru_cache(maxsize=cache_size)(self._query)
+
+    def _query(self, route, name, params):
+        params = dict(params)
+        if route == 'health':
+            return _json(200, {'version': self.version, 'loaded': self.loaded,
+                               'last_date': self.dates[-1] if len(self.dates) else None,
+                               'symbols': len(self.symbols),
+                               'upd_date': self.upd.attrs.get('date') if self.upd is not None else None})
+        if route == 'history':
+            return self._history(name, params)
+        if route == 'rs':
+            if name:
+                row = self.rs_rows.get(name)
+                return _json(200, row) if row else _json(404, {'error': f"unknown symbol '{name}'"})
+            top = int(params.get('top', 50))
+            if top < 0:
+                return _json(400, {'error': "top must not be negative"})
+            return _json(200, [self.rs_rows[symbol] for symbol in self.rs.index[:top]])
+        if route == 'upd':
+            return self._upd(name)
+        if route == 'screen':
+            return self._screen(name or params.get('q', ''))
+        return _json(404, {'error': f"unknown endpoint '/{route}'"})
+
+    def _history(self, symbol, params):
+        column = self.symbol_index.get(symbol)
+        if column is None:
+            return _json(404, {'error': f"unknown symbol '{symbol}'"})
+        fields = params['fields'].upper().split(',') if 'fields' in params else HISTORY_FIELDS
+        unknown = [field for field in fields if field not in self.history]
+        if unknown:
+            return _json(400, {'error': f"unknown fields {unknown}", 'fields': HISTORY_FIELDS})
+        first = 0 if 'start' not in params else np.searchsorted(self.dates, params['start'], side='left')
+        last = len(self.dates) if 'end' not in params else np.searchsorted(self.dates, params['end'], side='right')
+        if 'days' in params:
+            days = int(params['days'])
+            if days < 0:
+                return _json(400, {'error': "days must not be negative"})
+            first = max(first, last - days)
+        close = self.history['CLOSE'][first:last, column]
+        traded = np.flatnonzero(~np.isnan(close)) + first
+        payload = {'symbol': symbol, 'date': self.dates[traded].tolist()}
+        for field in fields:
+            values = self.history[field][traded, column]
+            values = values.astype(np.int64) if field == 'TOTTRDQTY' else np.round(values, 2)
+            payload[field] = values.tolist()
+        return _json(200, payload)
+
+    def _upd(self, symbol):
+        if self.upd is None:
+            return _json(503, {'error': "UPD.csv has not been generated"})
+        if not symbol:
+            return _json(200, {'date': self.upd.attrs.get('date'), 'symbols': self.upd.index.tolist()})
+        if symbol not in self.upd.index:
+            return _json(404, {'error': f"'{symbol}' is not in UPD.csv"})
+        row = self.upd.loc[symbol]
+        return _json(200, {'symbol': symbol, 'date': self.upd.attrs.get('date'),
+                           **{ALIASES.get(name, name): _value(row[name]) for name in self.upd.columns}})
+
+    def _screen(self, expression):
+        if self.upd is None:
+            return _json(503, {'error': "UPD.csv has not been generated"})
+        if not expression:
+            return _json(200, SCREENS)
+        if expression not in SCREENS and not self.adhoc_screens:
+            return _json(404, {'error': f"unknown screen '{expression}' (ad-hoc expressions are disabled)",
+                               'screens': list(SCREENS)})
+        try:
+            matches = screen(self.upd, expression, self.upd_arrays)
+        except Exception as e:
+            return _json(400, {'error': f"bad screen expression: {e}"})
+        return _json(200, {'screen': expression, 'date': self.upd.attrs.get('date'),
+                           'symbols': matches.index.tolist()})
+
+
+def force_param(target):
+    """True when the query has force, force=1 or force=true (any value but 0/false/no)."""
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(target).query, keep_blank_values=True)
+    return any(value.lower() not in ('0', 'false', 'no') for value in query.get('force', []))
+
+
+def parse_target(target):
+    """'/rs/INFY?top=5' -> ('rs', 'INFY', (('top', '5'),)), hashable for the LRU cache."""
+    parts = urllib.parse.urlsplit(target)
+    path = [urllib.parse.unquote(part) for part in parts.path.split('/') if part]
+    route = path[0] if path else 'health'
+    name = path[1] if len(path) > 1 else ''
+    if route != 'screen':
+        # Symbols are upper case; screen expressions are not
+        name = name.upper()
+    params = tuple(sorted(urllib.parse.parse_qsl(parts.query)))
+    return route, name, params
+
+
+class QueryServer:
+    """
+    asyncio HTTP/1.1 server (keep-alive, GET plus POST /reload) answering
+    from the current Snapshot. A reload builds the new snapshot in a worker
+    thread and swaps it in with one assignment; requests already running
+    finish on the snapshot they started with.
+    """
+
+    def __init__(self, save_folder, upd_path=None, poll=POLL_SECONDS, cache_size=CACHE_SIZE, adhoc_screens=False):
+        self.save_folder = save_folder
+        self.upd_path = upd_path or os.path.join(save_folder, "UPD.csv")
+        self.poll = poll
+        self.cache_size = cache_size
+        self.adhoc_screens = adhoc_screens
+        self.snapshot = None
+        self._reload_lock = None
+        self._watcher = None
+
+    async def reload(self, force=False):
+        """Load a new snapshot if the data changed; returns True if it was swapped in."""
+        async with self._reload_lock:
+            version = await asyncio.to_thread(snapshot_version, self.save_folder, self.upd_path)
+            if not force and self.snapshot is not None and version == self.snapshot.version:
+                return False
+            snapshot = await asyncio.to_thread(Snapshot, self.save_folder, self.upd_path, self.cache_size,
+                                               self.adhoc_screens)
+            self.snapshot = snapshot
+            print(f"Loaded snapshot: {len(snapshot.symbols)} symbols up to "
+                  f"{snapshot.dates[-1] if len(snapshot.dates) else '-'}")
+            return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll)
+            try:
+                await self.reload()
+            except Exception as e:
+                # Keep serving the old snapshot; the next poll tries again
+                print(f"Reload failed: {str(e)}")
+
+    async def respond(self, method, target):
+        route, name, params = parse_target(target)
+        if method == 'POST' and route == 'reload' and not name:
+            swapped = await self.reload(force=force_param(target))
+            return _json(200, {'reloaded': swapped, 'version': self.snapshot.version})
+        if method != 'GET':
+            return _json(405, {'error': f"{method} not supported"})
+        try:
+            return self.snapshot.query(route, name, params)
+        except (ValueError, TypeError) as e:
+            return _json(400, {'error': str(e)})
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+
+                try:
+                    status, body = await self.respond(method, target)
+                except Exception:
+                    # Answer 500 and keep the connection; the traceback goes to the log
+                    print(f"Error serving {method} {target}:")
+                    traceback.print_exc()
+                    status, body = _json(500, {'error': "internal server error"})
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765):
+        """Load the first snapshot and start listening; returns the asyncio server."""
+        self._reload_lock = asyncio.Lock()
+        await self.reload(force=True)
+        server = await asyncio.start_server(self._handle, host, port)
+        if self.poll:
+            self._watcher = asyncio.ensure_future(self._watch())
+        return server
+
+    async def serve_forever(self, host='127.0.0.1', port=8765):
+        server = await self.start(host, port)
+        print(f"Serving {self.save_folder} on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Serve price history, RS ranks, UPD rows and screens from memory. Endpoints: "
+                    "/health, /history/<symbol>?days=&start=&end=&fields=, /rs?top=, /rs/<symbol>, "
+                    "/upd, /upd/<symbol>, /screen, /screen/<name>, /screen?q=<expression>, POST /reload")
+    parser.add_argument("--save-folder", default="D:/Bhav Folder")
+    parser.add_argument("--upd", help="UPD.csv path (default: UPD.csv in the save folder)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="seconds between data checks (0 = off)")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="derived responses kept per snapshot")
+    parser.add_argument("--adhoc-screens", action="store_true",
+                        help="also accept /screen?q=<expression> (checked against the screener's allow-list)")
+    args = parser.parse_args()
+
+    query_server = QueryServer(args.save_folder, args.upd, args.poll, args.cache_size, args.adhoc_screens)
+    try:
+        asyncio.run(query_server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
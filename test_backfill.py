@@ -0,0 +1,77 @@
+import http.server
+import threading
+from datetime import date
+
+from backfill import backfill, bhavcopy_url, known_holidays, record_missed_days, trading_days
+from benchmarks import serve_directory, synthetic_archives
+
+
+DAYS = trading_days(date(2024, 1, 1), date(2024, 1, 12))
+HOLIDAY = DAYS[3]
+FLAKY = DAYS[5]
+# Not published yet: no later day downloads, so it never counts as missed
+LATE = DAYS[-1]
+
+
+class _FlakyHandler(http.server.SimpleHTTPRequestHandler):
+    """Answers 503 to the first request for FLAKY's archive."""
+
+    protocol_version = 'HTTP/1.1'
+    failed = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            fail = self.path == bhavcopy_url(FLAKY, '') and self.path not in self.failed
+            self.failed.add(self.path)
+        if fail:
+            self.send_error(503)
+        else:
+            super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _run(base_url):
+    downloaded = []
+    stats = backfill(DAYS, lambda day, data: downloaded.append(day), workers=4, base_url=base_url,
+                     retries=2, backoff=0.01)
+    return downloaded, {stat['date']: stat for stat in stats}
+
+
+def test_backfill_downloads_retries_and_records_missed_days(tmp_path):
+    archive_root = str(tmp_path / "archive")
+    synthetic_archives(archive_root, [day for day in DAYS if day not in (HOLIDAY, LATE)], n_symbols=20)
+    server, base_url = serve_directory(archive_root, _FlakyHandler)
+    try:
+        downloaded, stats = _run(base_url)
+        # Handler calls come in date order, one per archived day
+        assert downloaded == [day for day in DAYS if day not in (HOLIDAY, LATE)]
+        assert stats[FLAKY]['status'] == 200 and stats[FLAKY]['attempts'] == 2
+        assert stats[HOLIDAY]['status'] == 404 and stats[HOLIDAY]['attempts'] == 1
+        assert stats[HOLIDAY]['category'] == 'holiday'
+        assert stats[LATE]['status'] == 404
+
+        # One run's 404 is not enough to call a day a holiday
+        save_folder = str(tmp_path)
+        assert record_missed_days(save_folder, stats.values()) == []
+        assert HOLIDAY not in known_holidays(save_folder)
+
+        _, stats = _run(base_url)
+        assert record_missed_days(save_folder, stats.values()) == [HOLIDAY]
+        holidays = known_holidays(save_folder)
+        assert HOLIDAY in holidays and LATE not in holidays
+    finally:
+        server.shutdown()
+
+
+def test_a_download_clears_earlier_misses(tmp_path):
+    def stats(status):
+        return [{'date': HOLIDAY, 'status': status}, {'date': LATE, 'status': 200}]
+
+    save_folder = str(tmp_path)
+    assert record_missed_days(save_folder, stats(404)) == []
+    assert record_missed_days(save_folder, stats(200)) == []
+    assert record_missed_days(save_folder, stats(404)) == []
+    assert record_missed_days(save_folder, stats(404)) == [HOLIDAY]
@@ -0,0 +1,48 @@
+import numpy as np
+
+from backtest import WARMUP, prepare_signals, simulate
+from rs_engine import rs_scores
+
+
+# Four symbols over WARMUP + 18 trade dates, each growing at a constant daily rate
+N_DATES = WARMUP + 18
+STEADY, SLOW, SPARSE, GAPPY = range(4)
+GAP = slice(100, 110)
+
+
+def _closes():
+    t = np.arange(N_DATES, dtype=np.float64)[:, None]
+    closes = np.hstack([1.01 ** t, 1.005 ** t, 1.04 ** t, 1.03 ** t])
+    # SPARSE only trades every other day, GAPPY misses ten days early on
+    closes[1::2, SPARSE] = np.nan
+    closes[GAP, GAPPY] = np.nan
+    return closes
+
+
+def test_rs_counts_each_symbols_own_observations():
+    closes = _closes()
+    rs = prepare_signals(closes)['rs']
+    for day in range(WARMUP, N_DATES):
+        expected = rs_scores(closes[:day + 1])
+        traded = ~np.isnan(closes[day])
+        np.testing.assert_allclose(rs[day, traded], expected[traded], rtol=1e-12)
+        assert np.isnan(rs[day, ~traded]).all()
+    # Half the observations of the others, never enough for ROCR(252)
+    assert np.isnan(rs[:, SPARSE]).all()
+    # Ten missing days push the first GAPPY score ten dates past WARMUP
+    assert np.isnan(rs[:WARMUP + 10, GAPPY]).all()
+    assert not np.isnan(rs[WARMUP + 10:, GAPPY]).any()
+
+
+def test_top_one_trades_and_equity_curve():
+    params = {'top_n': 1, 'rebalance': 5, 'filter': 'none', 'cost_bps': 10}
+    equity, turnover = simulate(prepare_signals(_closes()), params)
+
+    # Rebalances at WARMUP, +5, +10, +15: STEADY until GAPPY has a score, then GAPPY
+    np.testing.assert_allclose(turnover, [1.0, 0.0, 2.0, 0.0], atol=1e-12)
+    expected = np.ones(N_DATES)
+    switch = WARMUP + 10
+    steady = 0.999 * 1.01 ** np.arange(switch - WARMUP + 1)
+    expected[WARMUP:switch + 1] = steady
+    expected[switch:] = steady[-1] * 0.998 * 1.03 ** np.arange(N_DATES - switch)
+    np.testing.assert_allclose(equity, expected, rtol=1e-12)
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic_bhavdb
+from indicator_state import INDICATOR_COLUMNS, verify_state
+from price_matrix import trade_dates
+from watchistTest import generate_UPD_csv, update_UPD_csv
+
+
+# Long enough for ROC(252), SMA(250) and a full 52-week window
+N_SYMBOLS = 6
+N_DAYS = 420
+APPENDED_DAYS = 3
+
+
+def _bhavdb():
+    df = synthetic_bhavdb(N_SYMBOLS, N_DAYS, seed=7)
+    # A few missing rows, so symbols have gaps in their histories
+    return df.drop(df.sample(frac=0.02, random_state=3).index)
+
+
+def test_incremental_state_matches_full_recompute(tmp_path):
+    df = _bhavdb()
+    symbols = df['SYMBOL'].unique().tolist()
+    worst = verify_state(df, symbols, os.path.join(tmp_path, "state.json"))
+    assert worst <= 1e-9
+
+
+def test_update_appends_sorted_days_matching_full_rebuild(tmp_path):
+    df = _bhavdb()
+    dates = trade_dates(df['TIMESTAMP'])
+    last_days = np.sort(dates.unique())[-APPENDED_DAYS:]
+    watchlist_path = os.path.join(tmp_path, "watchlist.csv")
+    bhavdb_path = os.path.join(tmp_path, "BhavDB.csv")
+    upd_path = os.path.join(tmp_path, "UPD.csv")
+    state_path = os.path.join(tmp_path, "UPD.state.json")
+    pd.Series(df['SYMBOL'].unique()).to_csv(watchlist_path, index=False, header=False)
+
+    # First run rebuilds from full history, the second appends the new days
+    df[~dates.isin(last_days)].to_csv(bhavdb_path, index=False)
+    update_UPD_csv(watchlist_path, bhavdb_path, upd_path, state_path)
+    rebuilt_rows = len(pd.read_csv(upd_path))
+    df.to_csv(bhavdb_path, index=False)
+    update_UPD_csv(watchlist_path, bhavdb_path, upd_path, state_path)
+    appended = pd.read_csv(upd_path).iloc[rebuilt_rows:]
+
+    full_path = os.path.join(tmp_path, "UPD.full.csv")
+    generate_UPD_csv(watchlist_path, bhavdb_path, full_path)
+    full = pd.read_csv(full_path)
+
+    # One contiguous block per appended day, strongest R.S. first
+    appended_dates = trade_dates(appended['TIMESTAMP'])
+    assert appended_dates.is_monotonic_increasing
+    assert sorted(appended_dates.unique()) == list(last_days)
+    for day in last_days:
+        block = appended[(appended_dates == day).to_numpy()]
+        assert block['R.S.'].is_monotonic_decreasing
+
+        expected = full[(trade_dates(full['TIMESTAMP']) == day).to_numpy()].set_index('Symbol')
+        got = block.set_index('Symbol').reindex(expected.index)
+        columns = ['R.S.'] + INDICATOR_COLUMNS
+        np.testing.assert_allclose(got[columns].to_numpy(dtype=float), expected[columns].to_numpy(dtype=float),
+                                   rtol=1e-9, equal_nan=True)
@@ -0,0 +1,61 @@
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic_bhavdb
+from bhavstore import import_csv, store_path
+from indicator_state import INDICATOR_COLUMNS
+from ingest import append_day, load_manifest
+from pipeline import Context, run_pipeline
+from price_matrix import trade_dates
+from watchistTest import build_UPD_frame
+
+
+N_SYMBOLS = 5
+N_DAYS = 150
+APPENDED_DAYS = 2
+
+
+def _context(save_folder, end):
+    # Nothing to download: the range starts after the last day
+    return Context(save_folder, end + timedelta(days=1), end, os.path.join(save_folder, "watchlist.csv"))
+
+
+def test_appended_days_update_upd_incrementally(tmp_path):
+    save_folder = str(tmp_path)
+    df = synthetic_bhavdb(N_SYMBOLS, N_DAYS, seed=11)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    last_days = np.sort(df['TIMESTAMP'].unique())[-APPENDED_DAYS:]
+    end = pd.Timestamp(last_days[-1]).date()
+    pd.Series(df['SYMBOL'].unique()).to_csv(os.path.join(save_folder, "watchlist.csv"), index=False, header=False)
+    df[~df['TIMESTAMP'].isin(last_days)].to_csv(os.path.join(save_folder, "BhavDB.csv"), index=False,
+                                                  date_format='%d-%b-%Y')
+    import_csv(os.path.join(save_folder, "BhavDB.csv"), store_path(save_folder))
+
+    context = _context(save_folder, end)
+    assert run_pipeline(context)['upd'] == 'ran'
+    assert context.results['upd']['mode'] == 'full'
+
+    manifest = load_manifest(save_folder)
+    for day in last_days:
+        append_day(df[df['TIMESTAMP'] == day], save_folder, manifest)
+    context = _context(save_folder, end)
+    assert run_pipeline(context)['upd'] == 'ran'
+    assert context.results['upd']['mode'] == 'incremental'
+
+    upd = pd.read_csv(os.path.join(save_folder, "UPD.csv"))
+    full = build_UPD_frame(df, df['SYMBOL'].unique())
+    columns = ['R.S.'] + INDICATOR_COLUMNS
+    for day in last_days:
+        got = upd[(trade_dates(upd['TIMESTAMP']) == day).to_numpy()].set_index('Symbol')
+        expected = full[(trade_dates(full['TIMESTAMP']) == day).to_numpy()].set_index('Symbol')
+        assert len(got) == N_SYMBOLS
+        np.testing.assert_allclose(got.reindex(expected.index)[columns].to_numpy(dtype=float),
+                                   expected[columns].to_numpy(dtype=float), rtol=1e-9, equal_nan=True)
+
+    # A forced run rebuilds in full
+    context = _context(save_folder, end)
+    run_pipeline(context, force=('upd',))
+    assert context.results['upd']['mode'] == 'full'
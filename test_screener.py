@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from screener import ALIASES, SCREENS, check_expression, run_screens, screen
+
+
+def _snapshot():
+    rng = np.random.default_rng(5)
+    snapshot = pd.DataFrame({alias: rng.uniform(10, 1000, 20) for alias in ALIASES},
+                            index=pd.Index([f"SYM{i:02d}" for i in range(20)], name='Symbol'))
+    snapshot['rs'] = rng.normal(0, 0.3, 20)
+    snapshot['rs_pct'] = snapshot['rs'].rank(pct=True) * 100
+    return snapshot
+
+
+def test_named_screens_run():
+    assert set(run_screens(_snapshot())) == set(SCREENS)
+
+
+def test_expression_matches_mask():
+    snapshot = _snapshot()
+    matches = screen(snapshot, "close > sma200 and rs_pct >= 50")
+    expected = snapshot[(snapshot['close'] > snapshot['sma200']) & (snapshot['rs_pct'] >= 50)]
+    assert sorted(matches.index) == sorted(expected.index)
+    assert matches['rs'].is_monotonic_decreasing
+
+
+@pytest.mark.parametrize('expression', [
+    "close.tofile('x')",
+    "close.__class__.__base__.__subclasses__()",
+    "close > 0 and __import__('os').system('true') == 0",
+    "close[0] > 1",
+    "abs(close) > 1",
+    "close > @x",
+])
+def test_calls_and_attribute_access_are_rejected(tmp_path, expression):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        with pytest.raises(ValueError):
+            screen(_snapshot(), expression)
+    finally:
+        os.chdir(cwd)
+    assert not os.listdir(tmp_path)
+
+
+def test_unknown_columns_and_constants_are_rejected():
+    names = list(ALIASES) + ['rs_pct']
+    check_expression("close >= 1.3 * low52w and -rs < 0.5", names)
+    with pytest.raises(ValueError):
+        check_expression("os > 1", names)
+    with pytest.raises(ValueError):
+        check_expression("close > 'a'", names)
@@ -0,0 +1,95 @@
+import asyncio
+import http.client
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic_bhavdb
+from ingest import append_day
+from server import QueryServer
+from watchistTest import build_UPD_frame
+
+
+N_SYMBOLS = 8
+N_DAYS = 300
+
+
+# One server for the module: building the store dominates the test time
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("server")
+    df = synthetic_bhavdb(N_SYMBOLS, N_DAYS, seed=2)
+    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], format='%d-%b-%Y')
+    append_day(df, str(tmp_path))
+    build_UPD_frame(df, df['SYMBOL'].unique()).to_csv(tmp_path / "UPD.csv", index=False, date_format='%d-%b-%Y')
+
+    query_server = QueryServer(str(tmp_path), poll=0)
+    loop = asyncio.new_event_loop()
+    listener = loop.run_until_complete(query_server.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    conn = http.client.HTTPConnection(*listener.sockets[0].getsockname()[:2])
+    yield query_server, conn
+    conn.close()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    listener.close()
+    loop.run_until_complete(listener.wait_closed())
+    loop.close()
+
+
+def _request(conn, path, method='GET'):
+    conn.request(method, path)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_rs_routes(server):
+    query_server, conn = server
+    status, rows = _request(conn, "/rs?top=3")
+    assert status == 200
+    assert [row['symbol'] for row in rows] == query_server.snapshot.rs.index[:3].tolist()
+    assert [row['rank'] for row in rows] == [1, 2, 3]
+
+    status, row = _request(conn, "/rs/sym0001")
+    assert status == 200 and row['symbol'] == 'SYM0001'
+
+
+@pytest.mark.parametrize('path, expected', [
+    ("/rs/NOPE", 404),
+    ("/nope", 404),
+    ("/rs?top=-1", 400),
+    ("/rs?top=abc", 400),
+    ("/history/SYM0001?days=-5", 400),
+])
+def test_error_statuses(server, path, expected):
+    _, conn = server
+    status, payload = _request(conn, path)
+    assert status == expected and 'error' in payload
+
+
+def test_reload_force_is_a_query_parameter(server):
+    _, conn = server
+    # 'force' elsewhere in the target must not force a reload
+    status, payload = _request(conn, "/reload?note=force", 'POST')
+    assert status == 200 and payload['reloaded'] is False
+    status, payload = _request(conn, "/reload?force=0", 'POST')
+    assert payload['reloaded'] is False
+    status, payload = _request(conn, "/reload?force", 'POST')
+    assert payload['reloaded'] is True
+
+
+def test_unexpected_error_answers_500_and_keeps_the_connection(server, monkeypatch):
+    query_server, conn = server
+
+    def broken(route, name, params):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(query_server.snapshot, 'query', broken)
+    status, payload = _request(conn, "/rs?top=3")
+    assert status == 500 and 'error' in payload
+
+    monkeypatch.undo()
+    status, _ = _request(conn, "/health")
+    assert status == 200
@@ -1,5 +1,7 @@
 import pandas as pd
 
+from retention import retention_cutoff
+
 # Read the CSV file
 df = pd.read_csv("D:/Bhav Folder/test.csv")
 
@@ -9,9 +11,8 @@ df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], errors='coerce')
 # Filter out rows where parsing failed
 df = df.dropna(subset=['TIMESTAMP'])
 
-# Filter data for last two years
-current_year = pd.Timestamp.now().year
-filtered_df = df[df['TIMESTAMP'].dt.year >= current_year - 1]
+# Filter data for last two years, with the same cutoff the store retention uses
+filtered_df = df[df['TIMESTAMP'] >= pd.Timestamp(retention_cutoff())].copy()
 
 # Convert datetime objects back to original timestamp format ("%d-%b-%Y")
 filtered_df['TIMESTAMP'] = filtered_df['TIMESTAMP'].dt.strftime('%d-%b-%Y')
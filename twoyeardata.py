@@ -1,23 +1,26 @@
+import argparse
 import os
 import urllib.request
-import zipfile
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import datetime
 import calendar
 
+import metrics
+from bhavparse import parse_bhavcopy
+from bhavzip import cache_archive, read_bhavcopy_zip
+from ingest import append_day, load_manifest
+from backfill import (MISSED_FILENAME, NSE_ARCHIVE_URL, backfill, known_holidays, print_report,
+                      record_missed_days, trading_days)
+from backfill import bhavcopy_url as archive_bhavcopy_url
+from retention import apply_retention, retention_cutoff
+
 
 def generate_bhavcopy_url(date_str):
-    date_obj = datetime.strptime(date_str, '%d/%m/%Y')
-    month_abbr = date_obj.strftime('%b').upper()[:3]  # Convert to uppercase and take the first 3 letters
-    year = date_obj.strftime('%Y')
-    day = date_obj.strftime('%d')
-    url = f"https://nsearchives.nseindia.com/content/historical/EQUITIES/{year}/{month_abbr}/cm{day}{month_abbr}{year}bhav.csv.zip"
-    return url
+    # Legacy cmDDMONYYYYbhav.csv.zip before NSE moved to UDiFF, the UDiFF file after
+    return archive_bhavcopy_url(datetime.strptime(date_str, '%d/%m/%Y').date())
 
 
-def download_bhavcopy(date_str, save_folder):
+def download_bhavcopy(date_str, save_folder, cache_dir=None):
     bhavcopy_url = generate_bhavcopy_url(date_str)
-    zip_file_path = os.path.join(save_folder, f"bhavcopy.zip")
 
     headers = {
         'accept': 'application/json, text/javascript, */*; q=0.01',
@@ -33,73 +36,78 @@ def download_bhavcopy(date_str, save_folder):
     try:
         # Download bhavcopy.zip
         print(f"Downloading Bhavcopy for {date_str} from URL: {bhavcopy_url}")
-        with urllib.request.urlopen(req) as response, open(zip_file_path, 'wb') as out_file:
-            data = response.read()  # a `bytes` object
-            out_file.write(data)
+        with metrics.span('download', date=date_str) as span:
+            with urllib.request.urlopen(req) as response:
+                data = response.read()  # a `bytes` object
+            span.add(bytes=len(data))
         print("Download complete.")
 
-        # Unzip the file
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(save_folder)
+        # Parse the archive in memory; raw zips are only kept when a cache is configured
+        if cache_dir:
+            cache_archive(data, cache_dir)
+        df = read_bhavcopy_zip(data)
         print("Bhavcopy downloaded and extracted successfully!")
-        return True
+        return df
 
     except Exception as e:
-        print(f"Error downloading or extracting Bhavcopy for {date_str}: {str(e)}")
-        return False
-
+        # Spans have already recorded the failure; say what kind it was
+        print(f"Error downloading or extracting Bhavcopy for {date_str} ({metrics.classify_failure(e)}): {str(e)}")
+        return None
 
-def process_bhavcopy_csv(date_str, save_folder):
-    day, month, year = map(int, date_str.split('/'))
 
-    # Getting the month abbreviation in capital letters
-    month_abbr = calendar.month_abbr[month].upper()
+def process_bhavcopy_csv(date_str, save_folder, df=None, manifest=None):
+    if df is None:
+        day, month, year = map(int, date_str.split('/'))
 
-    # Generating the filename dynamically based on the input date
-    filename = f"cm{day:02d}{month_abbr}{year}bhav.csv"
-    bhav_csv_path = os.path.join(save_folder, filename)
-
-    if not os.path.isfile(bhav_csv_path):
-        print(f"Error: File '{bhav_csv_path}' not found.")
-        return
+        # Getting the month abbreviation in capital letters
+        month_abbr = calendar.month_abbr[month].upper()
 
-    df = pd.read_csv(bhav_csv_path)
+        # Generating the filename dynamically based on the input date
+        filename = f"cm{day:02d}{month_abbr}{year}bhav.csv"
+        bhav_csv_path = os.path.join(save_folder, filename)
 
-    # Filter 'SERIES' column for 'EQ'
-    df = df[df['SERIES'] == 'EQ']
+        if not os.path.isfile(bhav_csv_path):
+            print(f"Error: File '{bhav_csv_path}' not found.")
+            return
 
-    # Remove unnecessary column
-    df.drop(['Unnamed: 13'], axis=1, inplace=True)
+        # Typed parse keeping only series 'EQ'; TIMESTAMP is parsed here once
+        df = parse_bhavcopy(bhav_csv_path, series='EQ')
 
-    # Save processed DataFrame to CSV
-    output_csv_path = os.path.join(save_folder, "BhavDB.csv")
+    # Append to the store once; the manifest makes the
+    # "already ingested?" check a lookup instead of re-reading BhavDB
+    if append_day(df, save_folder, manifest):
+        print(f"Processed CSV for {date_str} and appended to BhavDB")
 
-    # Check if the file exists
-    file_exists = os.path.isfile(output_csv_path)
 
-    # If file doesn't exist, write the header
-    if not file_exists:
-        df.to_csv(output_csv_path, index=False)
-        print(f"Header written to BhavDB.csv")
+def save_and_process(day, data, save_folder, cache_dir=None, manifest=None):
+    date_input = day.strftime("%d/%m/%Y")
+    print("Processing date:", date_input)
+    try:
+        if cache_dir:
+            cache_archive(data, cache_dir)
+        df = read_bhavcopy_zip(data)
+    except Exception as e:
+        print(f"Error extracting Bhavcopy for {date_input} ({metrics.classify_failure(e)}): {str(e)}")
         return
-
-    # Check if data already exists in the file
-    existing_data = pd.read_csv(output_csv_path)
-    if not existing_data.empty:
-        if 'Unnamed: 0' in existing_data.columns:
-            existing_data.drop(['Unnamed: 0'], axis=1, inplace=True)  # Drop the index column for comparison
-            if df.equals(existing_data):
-                print(f"Data for {date_str} already exists in BhavDB.csv. Skipping...")
-                return
-
-    # Append data to the file
-    df.to_csv(output_csv_path, mode='a', index=False, header=False)
-    print(f"Processed CSV for {date_str} and appended to BhavDB.csv")
+    process_bhavcopy_csv(date_input, save_folder, df, manifest)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill two years of NSE bhavcopy data.")
+    parser.add_argument("--save-folder", default="D:/Bhav Folder1")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent downloads")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--base-url", default=NSE_ARCHIVE_URL, help="archive host, e.g. a local mirror")
+    parser.add_argument("--holidays", help="file with extra holiday dates, one per line")
+    parser.add_argument("--archive-cache", help="folder to keep raw zips in, named by SHA-256")
+    parser.add_argument("--metrics", help="record stage metrics to this file (.prom for Prometheus text format)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(args.metrics)
+
     # Define the save folder
-    save_folder = "D:/Bhav Folder1"
+    save_folder = args.save_folder
 
     # Create the folder if it doesn't exist
     if not os.path.exists(save_folder):
@@ -111,23 +119,26 @@ if __name__ == "__main__":
     # Calculate the end date (today)
     end_date = today
 
-    # Calculate the start date (2 years ago)
-    start_date = today - timedelta(days=365 * 2)
-
-    # Loop over the date range
-    current_date = start_date
-    while current_date <= end_date:
-        # Convert the date to string format
-        date_input = current_date.strftime("%d/%m/%Y")
-
-        # Print the processing date
-        print("Processing date:", date_input)
-
-        # Download Bhavcopy for the current date
-        success = download_bhavcopy(date_input, save_folder)
-        if success:
-            # Process Bhavcopy for the current date if download is successful
-            process_bhavcopy_csv(date_input, save_folder)
-
-        # Move to the next date
-        current_date += timedelta(days=1)
+    # Calculate the start date (2 years ago, the store's retention cutoff)
+    start_date = retention_cutoff(today.date())
+
+    # Only request days the exchange was open; weekends and holidays always 404
+    holidays = known_holidays(save_folder, args.holidays)
+    days = trading_days(start_date, end_date, holidays)
+
+    # Days already in the manifest don't need downloading at all
+    manifest = load_manifest(save_folder)
+    days = [day for day in days if day.strftime('%Y-%m-%d') not in manifest]
+
+    # Download concurrently, then extract and append each day in date order
+    stats = backfill(days, lambda day, data: save_and_process(day, data, save_folder, args.archive_cache, manifest),
+                     workers=args.workers, base_url=args.base_url, retries=args.retries)
+    print_report(stats)
+    missed = record_missed_days(save_folder, stats)
+    if missed:
+        print(f"Recorded {len(missed)} unlisted holiday(s) in {MISSED_FILENAME}.")
+
+    # Expire anything that has fallen out of the two-year window
+    cutoff, _, expired = apply_retention(save_folder, today.date())
+    print(f"Retention: kept data from {cutoff}, expired {expired} days.")
+    metrics.flush()
@@ -1,27 +1,40 @@
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
 import yfinance
 
+import metrics
+from bhavstore import load_bhavdb, read_bhav, store_path
+from bars import day_numbers, load_bars
+from compact import compact_indicators, compact_state, frame_to_compact, read_compact, write_UPD_csv
+from indicator_state import (DAILY_COLUMNS, INDICATOR_COLUMNS, load_state, rebuild_state, save_state, update_day,
+                             upd_kernel, weekly_bar_closes, weekly_indicators)
+from indicators import ema
+from parallel import map_columns
+from price_matrix import segment_positions, trade_dates
+
 def calculate_RS(roc_63, roc_126, roc_189, roc_252):
     return (roc_63 * 2 + roc_126 + roc_189 + roc_252) / 5
 
 def calculate_ema(data, window):
-    ema_values = []
     if len(data) == 0:
-        return ema_values  # Return empty list if data is empty
-    
-    smoothing_factor = 2 / (window + 1)
-    ema_values.append(data.iloc[0])  # Use iloc to access first value safely
-    for i in range(1, len(data)):
-        ema = (data.iloc[i] - ema_values[-1]) * smoothing_factor + ema_values[-1]
-        ema_values.append(ema)
-    return ema_values
-
-def generate_UPD_csv(watchlist_path, bhavdb_path, upd_path):
+        return []  # Return empty list if data is empty
+    return ema(pd.Series(data), window).tolist()
+
+def generate_UPD_csv(watchlist_path, bhavdb_path, upd_path, workers=1, compact=False):
     # Read watchlist.csv without specifying column names
     watchlist_df = pd.read_csv(watchlist_path, header=None, names=['Symbol'])
+    watchlist = watchlist_df['Symbol'].astype(str).unique()
 
-    # Read BhavDB.csv
-    bhavdb_df = pd.read_csv(bhavdb_path)
+    bars = weekly_bars(bhavdb_path)
+    if compact:
+        generate_compact_UPD_csv(load_compact(bhavdb_path, watchlist), watchlist, upd_path, workers, bars)
+        return
+
+    # Read BhavDB (store folder or legacy BhavDB.csv), watchlist symbols only
+    bhavdb_df = load_bhavdb(bhavdb_path, symbols=watchlist)
 
     # Check if required columns are present in BhavDB.csv
     required_columns = ['SYMBOL', 'TIMESTAMP', 'CLOSE']
@@ -29,72 +42,157 @@ def generate_UPD_csv(watchlist_path, bhavdb_path, upd_path):
         print("Required columns are missing in BhavDB.csv.")
         return
 
-    # Initialize an empty DataFrame for UPD.csv
-    upd_df = pd.DataFrame(columns=[
-        'Date', 'Symbol', 'R.S.', 'Daily High', 'Daily Low', 'Weekly Close', 'One Week Ago Close', 
-        'Weekly EMA(10)', 'Weekly EMA(40)', 'Daily SMA(50)', 'Daily SMA(200)', 'Daily SMA(250)', 
-        'Daily EMA(10)', 'Daily EMA(30)', 'One Week Ago 52-week High', 'One Week Ago 52-week Low', 
-        'One Day Ago 100-day High', 'One Day Ago 100-day Low', 'Weekly Upper Bollinger Band(20,2)', 
-        'Weekly Lower Bollinger Band(20,1)'
-    ])
-
-    for symbol in watchlist_df['Symbol']:
-        # Check if symbol exists in BhavDB.csv
-        if symbol in bhavdb_df['SYMBOL'].values:
-            # Extract data for the symbol from BhavDB.csv
-            symbol_data = bhavdb_df[bhavdb_df['SYMBOL'] == symbol].copy()
-
-            # Calculate Rate of Change (ROC)
-            symbol_data['ROC_63'] = symbol_data['CLOSE'].pct_change(periods=63)
-            symbol_data['ROC_126'] = symbol_data['CLOSE'].pct_change(periods=126)
-            symbol_data['ROC_189'] = symbol_data['CLOSE'].pct_change(periods=189)
-            symbol_data['ROC_252'] = symbol_data['CLOSE'].pct_change(periods=252)
-            symbol_data['R.S.'] = calculate_RS(symbol_data['ROC_63'], symbol_data['ROC_126'], symbol_data['ROC_189'], symbol_data['ROC_252'])
-
-            # Calculate other required metrics
-            if not symbol_data.empty:
-                symbol_data['Weekly EMA(10)'] = calculate_ema(symbol_data['CLOSE'], window=10)
-                symbol_data['Weekly EMA(40)'] = calculate_ema(symbol_data['CLOSE'], window=40)
-                symbol_data['Daily SMA(50)'] = symbol_data['CLOSE'].rolling(window=50).mean()
-                symbol_data['Daily SMA(200)'] = symbol_data['CLOSE'].rolling(window=200).mean()
-                symbol_data['Daily SMA(250)'] = symbol_data['CLOSE'].rolling(window=250).mean()
-                symbol_data['Daily EMA(10)'] = calculate_ema(symbol_data['CLOSE'], window=10)
-                symbol_data['Daily EMA(30)'] = calculate_ema(symbol_data['CLOSE'], window=30)
-                symbol_data['One Week Ago 52-week High'] = symbol_data['CLOSE'].rolling(window=5*52).max().shift(7)
-                symbol_data['One Week Ago 52-week Low'] = symbol_data['CLOSE'].rolling(window=5*52).min().shift(7)
-                symbol_data['One Day Ago 100-day High'] = symbol_data['CLOSE'].rolling(window=100).max().shift(1)
-                symbol_data['One Day Ago 100-day Low'] = symbol_data['CLOSE'].rolling(window=100).min().shift(1)
-                symbol_data['Weekly Upper Bollinger Band(20,2)'] = symbol_data['CLOSE'].rolling(window=20).mean() + 2 * symbol_data['CLOSE'].rolling(window=20).std()
-                symbol_data['Weekly Lower Bollinger Band(20,1)'] = symbol_data['CLOSE'].rolling(window=20).mean() - symbol_data['CLOSE'].rolling(window=20).std()
-
-                # Add symbol column
-                symbol_data['Symbol'] = symbol
-
-                # Reorder columns according to specified sequence
-                symbol_data = symbol_data[[
-                    'TIMESTAMP', 'Symbol', 'R.S.', 'HIGH', 'LOW', 'CLOSE', 'LAST', 
-                    'Weekly EMA(10)', 'Weekly EMA(40)', 'Daily SMA(50)', 'Daily SMA(200)', 'Daily SMA(250)', 
-                    'Daily EMA(10)', 'Daily EMA(30)', 'One Week Ago 52-week High', 'One Week Ago 52-week Low', 
-                    'One Day Ago 100-day High', 'One Day Ago 100-day Low', 'Weekly Upper Bollinger Band(20,2)', 
-                    'Weekly Lower Bollinger Band(20,1)'
-                ]]
-
-                # Append the processed data to UPD.csv DataFrame
-                upd_df = pd.concat([upd_df, symbol_data.dropna(how='all').reset_index(drop=True)], ignore_index=True, sort=False)
-            else:
-                print(f"No data available for symbol: {symbol}")
+    with metrics.span('indicators', mode='full') as span:
+        upd_df = build_UPD_frame(bhavdb_df, watchlist, workers, bars)
+        span.add(rows=len(upd_df))
 
     # Sort UPD.csv DataFrame on R.S. descending
-    upd_df = upd_df.sort_values(by='R.S.', ascending=False)
+    upd_df = upd_df.sort_values(by='R.S.', ascending=False, kind='stable')
 
     # Write UPD.csv to the specified path
-    upd_df.to_csv(upd_path, index=False)
+    upd_df.to_csv(upd_path, index=False, date_format='%d-%b-%Y')
+
+def weekly_bars(bhavdb_path):
+    """Cached weekly bars of a store folder (see bars.load_bars); None for a legacy BhavDB.csv."""
+    if not os.path.isdir(bhavdb_path):
+        return None
+    return load_bars(os.path.dirname(os.path.normpath(bhavdb_path)), 'W')
+
+def load_compact(bhavdb_path, watchlist):
+    """Watchlist rows of the store folder or legacy BhavDB.csv as a CompactBhav."""
+    if os.path.isdir(bhavdb_path):
+        return read_compact(bhavdb_path, symbols=watchlist)
+    return frame_to_compact(load_bhavdb(bhavdb_path, symbols=watchlist))
+
+def generate_compact_UPD_csv(data, watchlist, upd_path, workers=1, bars=None):
+    # int32 symbol codes and day numbers, float32 prices and indicators
+    # in preallocated arrays; values within float32 precision of the
+    # float64 path (python compact.py checks the tolerance)
+    with metrics.span('indicators', mode='compact') as span:
+        rows, positions, block = compact_indicators(data, watchlist, workers=workers, bars=bars)
+        span.add(rows=len(rows))
+    write_UPD_csv(upd_path, data, watchlist, rows, positions, block)
+
+def build_UPD_frame(bhavdb_df, watchlist, workers=1, bars=None):
+    """
+    Compute the UPD rows of every watchlist symbol in one batch.
+
+    Parameters:
+    - bhavdb_df: BhavDB rows (other symbols are ignored).
+    - watchlist: Array of unique symbols; output rows follow this order.
+    - workers: Processes to shard the symbols across (1 = in process).
+    - bars: Optional cached weekly bars (bars.load_bars) the weekly columns
+      are computed from; built from the rows when omitted.
+
+    Returns:
+    - DataFrame in the UPD.csv column layout, one row per symbol per day.
+    """
+    watchlist = np.asarray(watchlist, dtype=object)
+
+    # Sort once by (watchlist position, trade date); each symbol becomes a
+    # contiguous segment and its rows keep their chronological order
+    codes = pd.Categorical(bhavdb_df['SYMBOL'].astype(str), categories=watchlist).codes
+    dates = trade_dates(bhavdb_df['TIMESTAMP']).to_numpy()
+    order = np.lexsort((dates, codes))
+    order = order[codes[order] >= 0]
+    bhavdb_df = bhavdb_df.iloc[order]
+    codes = codes[order]
+    days = day_numbers(dates[order])
+    positions = segment_positions(codes)
+
+    # Row k of column j holds the k-th close of watchlist symbol j, so the
+    # window kernels run over every symbol's own history in one call
+    close = np.full((positions.max() + 1 if len(positions) else 0, len(watchlist)), np.nan)
+    close[positions, codes] = bhavdb_df['CLOSE'].to_numpy(dtype=float)
+
+    outputs = {name: 'matrix' for name in ['R.S.'] + DAILY_COLUMNS}
+    indicators = {name: values[positions, codes]
+                  for name, values in map_columns(upd_kernel, close, outputs, workers).items()}
+
+    # Weekly columns run on the weekly bar series
+    bar_closes = weekly_bar_closes(bars, watchlist) if bars is not None else None
+    indicators.update(weekly_indicators(codes, days, bhavdb_df['CLOSE'].to_numpy(dtype=float), bar_closes))
+
+    # 'Date', 'Daily High' and 'Daily Low' have always been written empty
+    # ahead of the per-row columns; keep the layout
+    empty = np.full(len(codes), np.nan)
+    upd_df = pd.DataFrame({
+        'Date': empty, 'Symbol': watchlist[codes], 'R.S.': indicators['R.S.'],
+        'Daily High': empty, 'Daily Low': empty,
+        **{name: indicators[name] for name in INDICATOR_COLUMNS},
+        'TIMESTAMP': bhavdb_df['TIMESTAMP'].to_numpy(),
+        'HIGH': bhavdb_df['HIGH'].to_numpy(),
+        'LOW': bhavdb_df['LOW'].to_numpy(),
+        'CLOSE': bhavdb_df['CLOSE'].to_numpy(),
+        'LAST': bhavdb_df['LAST'].to_numpy(),
+    })
+    return upd_df
+
+def update_UPD_csv(watchlist_path, bhavdb_path, upd_path, state_path, workers=1, compact=False):
+    """
+    Bring UPD.csv up to date by appending rows only for days newer than the
+    checkpointed indicator state. Falls back to a full generate_UPD_csv and
+    a state rebuild when there is no usable state or the watchlist changed.
+
+    A full rebuild writes every row sorted on R.S. descending; each day
+    appended afterwards is added as its own block, also sorted on R.S.
+    descending. The file is therefore one sorted block followed by one
+    sorted block per appended day, and the latest day's rows are always the
+    last block, strongest first.
+    """
+    watchlist = pd.read_csv(watchlist_path, header=None, names=['Symbol'])['Symbol'].astype(str).unique().tolist()
+    state = load_state(state_path)
+
+    if state is None or set(state['symbols']) != set(watchlist) or not os.path.isfile(upd_path):
+        print("Rebuilding UPD.csv and indicator state from full history.")
+        if compact:
+            # One compact read serves both the UPD.csv and the state
+            data = load_compact(bhavdb_path, watchlist)
+            generate_compact_UPD_csv(data, watchlist, upd_path, workers, weekly_bars(bhavdb_path))
+            state = compact_state(data, watchlist)
+        else:
+            generate_UPD_csv(watchlist_path, bhavdb_path, upd_path, workers)
+            state, _ = rebuild_state(load_bhavdb(bhavdb_path, symbols=watchlist), watchlist)
+        save_state(state_path, state)
+        return
+
+    # Only read the days the state hasn't seen, for watchlist symbols only
+    start = pd.Timestamp(state['last_date']) + pd.Timedelta(days=1)
+    if os.path.isdir(bhavdb_path):
+        new_df = read_bhav(bhavdb_path, start=start, symbols=watchlist, upcast=True)
+    else:
+        new_df = pd.read_csv(bhavdb_path)
+        new_df = new_df[trade_dates(new_df['TIMESTAMP']) >= start]
+
+    with metrics.span('indicators', mode='incremental') as span:
+        frames = [update_day(state, day_df)
+                  for _, day_df in new_df.groupby(trade_dates(new_df['TIMESTAMP']), sort=True)]
+        span.add(rows=sum(len(frame) for frame in frames), days=len(frames))
+    if not frames:
+        print("UPD.csv is already up to date.")
+        return
+
+    # Append one block per day, sorted on R.S. descending like a full
+    # rebuild, in the existing file's column layout
+    header = pd.read_csv(upd_path, nrows=0).columns
+    new_rows = pd.concat([frame.sort_values(by='R.S.', ascending=False, kind='stable') for frame in frames],
+                         ignore_index=True).reindex(columns=header)
+    new_rows.to_csv(upd_path, mode='a', index=False, header=False, date_format='%d-%b-%Y')
+    save_state(state_path, state)
+    print(f"Appended {len(new_rows)} rows for {len(frames)} day(s) to UPD.csv")
+
 
 if __name__ == "__main__":
-    # Paths to watchlist.csv, BhavDB.csv, and UPD.csv
+    parser = argparse.ArgumentParser(description="Generate UPD.csv for the watchlist.")
+    parser.add_argument("--workers", type=int, default=1, help="processes for a full rebuild")
+    parser.add_argument("--compact", action="store_true", help="float32 full rebuild in a fraction of the memory")
+    args = parser.parse_args()
+
+    # Paths to watchlist.csv, the BhavDB store, and UPD.csv
     watchlist_path = "D:/Bhav Folder/watchlist.csv"
-    bhavdb_path = "D:/Bhav Folder/BhavDB.csv"
+    bhavdb_path = store_path("D:/Bhav Folder")
     upd_path = "D:/Bhav Folder/UPD.csv"
+    state_path = "D:/Bhav Folder/UPD.state.json"
 
-    # Generate UPD.csv
-    generate_UPD_csv(watchlist_path, bhavdb_path, upd_path)
+    # Update UPD.csv with the days since the last run (full rebuild on first run)
+    update_UPD_csv(watchlist_path, bhavdb_path, upd_path, state_path, args.workers, args.compact)